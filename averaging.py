@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Robust estimators to average the demodulator samples polled for one wavelength point
+
+All kernels work on a 2D array of shape (channels, samples), e.g. the stacked R, X, Y,
+frequency and phase arrays returned by daq.poll. Outliers are identified on one reference
+row (R by default) and the same samples are excluded from every channel, since a chopper
+glitch or vibration spike corrupts all demodulator outputs at the same time.
+"""
+
+import numpy as np
+
+METHODS = ('mean', 'sigma_clip', 'median', 'trimmed_mean', 'hodges_lehmann')
+
+
+def mad_sigma(values):
+    """Function to estimate the standard deviation from the median absolute deviation
+    :param values: Sample values
+    :type values: array, required
+    ...
+    :return: Robust standard deviation estimate
+    :rtype: float
+    """
+    return 1.4826 * np.median(np.abs(values - np.median(values)))
+
+
+def sigma_clip_mask(values, sigma=3.0, max_iter=5):
+    """Function to iteratively flag samples further than sigma standard deviations from the median
+    :param values: Sample values of the reference channel
+    :type values: array, required
+    :param sigma: Clipping threshold in standard deviations
+    :type sigma: float, optional
+    :param max_iter: Maximum number of clipping iterations
+    :type max_iter: int, optional
+    ...
+    :return: Boolean mask of samples to keep
+    :rtype: array
+    """
+    keep = np.ones(values.shape, dtype=bool)
+    for _ in range(max_iter):
+        kept = values[keep]
+        spread = np.std(kept)
+        if kept.size < 3 or spread == 0:
+            break
+        new_keep = np.abs(values - np.median(kept)) <= sigma * spread
+        if np.array_equal(new_keep, keep):
+            break
+        keep = new_keep
+    return keep
+
+
+def trimmed_mask(values, fraction=0.1):
+    """Function to flag the lowest and highest fraction of samples
+    :param values: Sample values of the reference channel
+    :type values: array, required
+    :param fraction: Fraction of samples to cut from each end
+    :type fraction: float, optional
+    ...
+    :return: Boolean mask of samples to keep
+    :rtype: array
+    """
+    n = values.size
+    cut = int(fraction * n)
+    if n - 2 * cut < 1:
+        cut = (n - 1) // 2
+    keep = np.zeros(n, dtype=bool)
+    keep[np.argsort(values, kind='stable')[cut:n - cut]] = True
+    return keep
+
+
+def hodges_lehmann(samples, max_samples=512):
+    """Function to calculate the Hodges-Lehmann estimator (median of all pairwise means) of each row
+    :param samples: Array of shape (channels, samples)
+    :type samples: array, required
+    :param max_samples: Rows longer than this are evenly subsampled to bound the O(n^2) pair count
+    :type max_samples: int, optional
+    ...
+    :return: Estimate for each row
+    :rtype: array
+    """
+    samples = np.atleast_2d(samples)
+    n = samples.shape[1]
+    if n > max_samples:
+        samples = samples[:, np.linspace(0, n - 1, max_samples).astype(int)]
+        n = max_samples
+    i, j = np.triu_indices(n)
+    return np.median(0.5 * (samples[:, i] + samples[:, j]), axis=1)
+
+
+def average(samples, method='mean', reference=0, sigma=3.0, fraction=0.1):
+    """Function to average the samples of one measurement point with the selected estimator
+    :param samples: Array of shape (channels, samples)
+    :type samples: array, required
+    :param method: One of METHODS
+    :type method: str, optional
+    :param reference: Row used to identify outliers
+    :type reference: int, optional
+    :param sigma: Outlier threshold in standard deviations
+    :type sigma: float, optional
+    :param fraction: Fraction of samples cut from each end for the trimmed mean
+    :type fraction: float, optional
+    ...
+    :raises ValueError: Raises error if the method is unknown
+    ...
+    :return: Estimate for each row, and dictionary with the number of samples and rejected samples.
+             For median and Hodges-Lehmann nothing is excluded explicitly, so 'rejected' counts the
+             samples flagged as outliers by the median absolute deviation.
+    :rtype: tuple of (array, dict)
+    """
+    if method not in METHODS:
+        raise ValueError('Unknown averaging method: %s' % method)
+
+    samples = np.atleast_2d(np.asarray(samples, dtype=float))
+    n = samples.shape[1]
+    if n == 0:
+        return np.full(samples.shape[0], np.nan), {'samples': 0, 'rejected': 0}
+
+    ref = samples[reference]
+
+    if method == 'mean':
+        return samples.mean(axis=1), {'samples': n, 'rejected': 0}
+
+    if method in ('sigma_clip', 'trimmed_mean'):
+        if method == 'sigma_clip':
+            keep = sigma_clip_mask(ref, sigma)
+        else:
+            keep = trimmed_mask(ref, fraction)
+        return samples[:, keep].mean(axis=1), {'samples': n, 'rejected': int(n - keep.sum())}
+
+    spread = mad_sigma(ref)
+    rejected = int(np.count_nonzero(np.abs(ref - np.median(ref)) > sigma * spread)) if spread > 0 else 0
+
+    if method == 'median':
+        values = np.median(samples, axis=1)
+    else:
+        values = hodges_lehmann(samples)
+
+    return values, {'samples': n, 'rejected': rejected}
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless batch post-processing of a data folder
+
+Walks a data tree such as {save_path}/{userName}/{experimentName}, pairs every sample scan with
+the reference scans of the same experiment and calculates the reference power, the EQE of each
+sample and the stitched EQE of complete scans. The work is spread over a process pool. Results are
+cached in the output folder, keyed by the SHA-256 hashes of the input files, so a rerun only
+processes files that changed.
+
+Usage: python batch.py DATA_FOLDER [--out OUTPUT_FOLDER] [--workers N] [--calibrations FOLDER]
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import calibration
+import eqe
+import filenames
+import stitching
+
+OUTPUT_FOLDER = '_processed'
+CACHE_FOLDER = '.cache'
+
+
+def scan_tree(root, skip=None):
+    """Function to find and classify all scan data files in a folder tree
+    :param root: Data folder
+    :type root: str, required
+    :param skip: Folder to leave out, e.g. the output folder
+    :type skip: str, optional
+    ...
+    :return: List of dictionaries with 'path', 'folder', 'mtime', 'reference' (True if the file has a power column)
+             and the parsed file name fields
+    :rtype: list of dict
+    """
+    records = []
+    skip = os.path.abspath(skip) if skip is not None else None
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if skip is None or os.path.abspath(os.path.join(folder, d)) != skip]
+        for file_name in files:
+            fields = filenames.parse_filename(file_name)
+            if fields is None:
+                continue
+            path = os.path.join(folder, file_name)
+            try:
+                with open(path) as f:
+                    header = f.readline().strip().split(',')
+            except (OSError, UnicodeDecodeError):
+                continue
+            if 'Wavelength' not in header or 'Mean Current' not in header:
+                continue
+            fields.update({'path': path, 'folder': folder, 'mtime': os.path.getmtime(path), 'reference': 'Power' in header})
+            records.append(fields)
+    return records
+
+
+def pair_references(sample, references):
+    """Function to select the reference scans for a sample scan
+    :param sample: Sample record from scan_tree
+    :type sample: dict, required
+    :param references: Reference records from scan_tree
+    :type references: list of dict, required
+    ...
+    :return: Reference records, oldest first, so that the latest reference taken before the sample wins where they overlap
+    :rtype: list of dict
+    """
+    candidates = [ref for ref in references
+                  if ref['folder'] == sample['folder'] and ref['stop'] >= sample['start'] and ref['start'] <= sample['stop']]
+
+    # Prefer references taken with the same external filter, otherwise the ones without filter
+    same_filter = [ref for ref in candidates if ref['filter'] == sample['filter']]
+    if not same_filter:
+        same_filter = [ref for ref in candidates if ref['filter'] in (None, 'no')]
+
+    # Prefer references taken before the sample
+    before = [ref for ref in same_filter if ref['mtime'] <= sample['mtime']]
+    return sorted(before or same_filter, key=lambda ref: ref['mtime'])
+
+
+def select_detector(registry, record):
+    """Function to select the reference detector of a reference scan
+    :param registry: Detector registry
+    :type registry: DetectorRegistry, required
+    :param record: Reference record from scan_tree
+    :type record: dict, required
+    ...
+    :return: Detector named in the file name, else the one covering most of the scan range, or None
+    :rtype: Detector
+    """
+    name = record['name'].lower()
+    for detector_name in registry.names():
+        if detector_name.lower() in name:
+            return registry.get(detector_name)
+
+    best, best_overlap = None, 0
+    for detector_name in registry.names():
+        detector = registry.get(detector_name)
+        if detector.valid_range is None:
+            detector.responsivity(record['start'])   # Builds the table and sets the calibrated range
+        overlap = min(record['stop'], detector.valid_range[1]) - max(record['start'], detector.valid_range[0])
+        if overlap > best_overlap:
+            best, best_overlap = detector, overlap
+    return best
+
+
+def cache_key(paths, salt=''):
+    """Function to build a cache key from the contents of input files
+    :param paths: Input files
+    :type paths: list of str, required
+    :param salt: Additional key, e.g. the hash of the calibration files
+    :type salt: str, optional
+    ...
+    :return: Hexadecimal key
+    :rtype: str
+    """
+    sha = hashlib.sha256(salt.encode())
+    for path in paths:
+        sha.update(calibration.file_hash(path).encode())
+    return sha.hexdigest()
+
+
+def calibration_key(calibration_dir):
+    """Function to build a cache key from all files in the calibration folder
+    :param calibration_dir: Calibration folder of the reference detectors
+    :type calibration_dir: str, required
+    ...
+    :return: Hexadecimal key
+    :rtype: str
+    """
+    paths = sorted(os.path.join(calibration_dir, f) for f in os.listdir(calibration_dir)
+                   if os.path.isfile(os.path.join(calibration_dir, f)))
+    return cache_key(paths)
+
+
+def reference_power(record, cache_dir, calibration_dir, salt=''):
+    """Function to calculate the power of a reference scan, using the cache if the file is unchanged
+    :param record: Reference record from scan_tree
+    :type record: dict, required
+    :param cache_dir: Cache folder
+    :type cache_dir: str, required
+    :param calibration_dir: Calibration folder of the reference detectors
+    :type calibration_dir: str, required
+    :param salt: Hash of the calibration files
+    :type salt: str, optional
+    ...
+    :return: Wavelength and power arrays, and True if the cache was used
+    :rtype: tuple of (array, array, bool)
+    """
+    cache_path = os.path.join(cache_dir, 'power_%s.npz' % cache_key([record['path']], salt))
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cache:
+            return cache['wavelength'], cache['power'], True
+
+    ref_df = pd.read_csv(record['path'], index_col=0).dropna(subset=['Wavelength', 'Mean Current']).sort_values('Wavelength')
+    wavelength = ref_df['Wavelength'].to_numpy(dtype=float)
+
+    detector = select_detector(calibration.DetectorRegistry(calibration_dir), record)
+    if detector is not None:
+        power = ref_df['Mean Current'].to_numpy(dtype=float) / detector.responsivity(wavelength)
+    else:
+        power = ref_df['Power'].to_numpy(dtype=float)   # Keep the power calculated during the measurement
+
+    valid = np.isfinite(power)
+    wavelength, power = wavelength[valid], power[valid]
+    with open(cache_path, 'wb') as f:
+        np.savez(f, wavelength=wavelength, power=power)
+    return wavelength, power, False
+
+
+def process_sample(sample, refs, cache_dir, calibration_dir, out_path, salt=''):
+    """Function to calculate the EQE of a sample scan, using the cache if no input file changed
+    :param sample: Sample record from scan_tree
+    :type sample: dict, required
+    :param refs: Paired reference records, oldest first
+    :type refs: list of dict, required
+    :param cache_dir: Cache folder
+    :type cache_dir: str, required
+    :param calibration_dir: Calibration folder of the reference detectors
+    :type calibration_dir: str, required
+    :param out_path: Output file
+    :type out_path: str, required
+    :param salt: Hash of the calibration files
+    :type salt: str, optional
+    ...
+    :return: Output file and True if the result was taken from the cache
+    :rtype: tuple of (str, bool)
+    """
+    key = cache_key([sample['path']] + [ref['path'] for ref in refs], salt)
+    cache_path = os.path.join(cache_dir, 'eqe_%s.csv' % key)
+    if os.path.exists(cache_path) and os.path.exists(out_path):
+        return out_path, True
+
+    sample_df = pd.read_csv(sample['path'], index_col=0)
+    references = [reference_power(ref, cache_dir, calibration_dir, salt)[:2] for ref in refs]
+    power, used = eqe.combine_power(sample_df['Wavelength'].to_numpy(dtype=float), references)
+
+    sample_df['Power'] = power
+    sample_df['EQE'] = eqe.calculate_eqe(sample_df['Mean Current'], power, sample_df['Wavelength'])
+    sample_df['Reference'] = ';'.join(os.path.basename(ref['path']) for ref, is_used in zip(refs, used) if is_used)
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    sample_df.to_csv(cache_path)
+    sample_df.to_csv(out_path)
+    return out_path, False
+
+
+def stitch_group(segments, out_path):
+    """Function to stitch the EQE of the segments of one complete scan
+    :param segments: List of (filter label, processed file), in measurement order
+    :type segments: list of tuples, required
+    :param out_path: Output file
+    :type out_path: str, required
+    ...
+    :return: Output file
+    :rtype: str
+    """
+    stitcher = stitching.Stitcher()
+    for label, path in segments:
+        stitched_df = stitcher.add(pd.read_csv(path, index_col=0), label)
+    stitched_df.to_csv(out_path)
+    return out_path
+
+
+def filter_order(label):
+    """Function to sort external filters in measurement order, open position first"""
+    try:
+        return float(label)
+    except (TypeError, ValueError):
+        return -1.0
+
+
+def process_tree(root, out_dir=None, workers=None, calibration_dir='calibrations'):
+    """Function to process a data folder
+    :param root: Data folder
+    :type root: str, required
+    :param out_dir: Output folder, defaults to a '_processed' folder in the data folder
+    :type out_dir: str, optional
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :type workers: int, optional
+    :param calibration_dir: Calibration folder of the reference detectors
+    :type calibration_dir: str, optional
+    ...
+    :return: Dictionary with the number of 'processed', 'cached', 'unpaired' and 'stitched' files
+    :rtype: dict
+    """
+    logger = logging.getLogger(__name__)
+    out_dir = out_dir or os.path.join(root, OUTPUT_FOLDER)
+    cache_dir = os.path.join(out_dir, CACHE_FOLDER)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    salt = calibration_key(calibration_dir)
+    records = scan_tree(root, skip=out_dir)
+    references = [record for record in records if record['reference']]
+    samples = [record for record in records if not record['reference']]
+    logger.info('Found %d Reference and %d Sample Files' % (len(references), len(samples)))
+
+    counts = {'processed': 0, 'cached': 0, 'unpaired': 0, 'stitched': 0}
+    groups = {}
+    changed_groups = set()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        # Reference power first, so that sample tasks only read it from the cache
+        for future in [pool.submit(reference_power, ref, cache_dir, calibration_dir, salt) for ref in references]:
+            future.result()
+
+        futures = {}
+        for sample in samples:
+            refs = pair_references(sample, references)
+            if not refs:
+                logger.error('No Reference Found for %s' % sample['path'])
+                counts['unpaired'] += 1
+                continue
+            out_path = os.path.join(out_dir, os.path.relpath(sample['path'], root) + '_EQE.csv')
+            futures[pool.submit(process_sample, sample, refs, cache_dir, calibration_dir, out_path, salt)] = sample
+
+        for future in concurrent.futures.as_completed(futures):
+            sample = futures[future]
+            out_path, cached = future.result()
+            counts['cached' if cached else 'processed'] += 1
+            if sample['filter'] is not None:
+                group = (sample['folder'], sample['name'], sample['index'])
+                groups.setdefault(group, []).append((sample['filter'], out_path))
+                if not cached:
+                    changed_groups.add(group)
+
+        stitch_futures = []
+        for group, segments in groups.items():
+            folder, name, index = group
+            out_path = os.path.join(out_dir, os.path.relpath(folder, root), name + '_stitched' + ('_%d' % index if index > 1 else '') + '_EQE.csv')
+            if group in changed_groups or not os.path.exists(out_path):
+                segments = sorted(segments, key=lambda segment: filter_order(segment[0]))
+                stitch_futures.append(pool.submit(stitch_group, segments, out_path))
+        for future in stitch_futures:
+            future.result()
+            counts['stitched'] += 1
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Calculate power, EQE and stitched spectra for a folder of sEQE data')
+    parser.add_argument('root', help='Data folder, e.g. {save_path}/{userName}')
+    parser.add_argument('--out', default=None, help='Output folder, defaults to DATA_FOLDER/%s' % OUTPUT_FOLDER)
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--calibrations', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibrations'),
+                        help='Calibration folder of the reference detectors')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+                        datefmt='%Y-%m-%d - %H:%M:%S')
+    counts = process_tree(args.root, args.out, args.workers, args.calibrations)
+    logging.getLogger(__name__).info('Processed %(processed)d, Cached %(cached)d, Unpaired %(unpaired)d, Stitched %(stitched)d' % counts)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
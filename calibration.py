@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Photodiode calibration store and reference detector registry
+
+Calibration workbooks are converted once to compact .npz files holding the wavelength and
+responsivity as two float64 arrays. A cache file is used if the workbook path, modification time
+and size still match. If only the modification time changed, the SHA-256 hash of the workbook
+decides whether the cache is still valid. Otherwise the workbook is parsed again. Workbooks are
+loaded lazily on first use, so pandas and openpyxl are only needed when a cache is stale.
+
+Reference detectors are discovered from the JSON metadata files in a calibration directory, e.g.
+
+    {"name": "Si", "type": "Si photodiode", "serial": "FDS100", "file": "FDS100-CAL.xlsx",
+     "sheet": "Sheet1", "range": [350, 1100], "interpolation": "linear"}
+
+so that adding a detector only needs its calibration file and a metadata file. The responsivity
+of each detector is tabulated on a dense wavelength grid, so a lookup is a constant time index.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+CACHE_DIR = '.calibration_cache'
+WAVELENGTH_COLUMN = 'Wavelength [nm]'
+RESPONSIVITY_COLUMN = 'Responsivity [A/W]'
+INTERPOLATIONS = ('linear', 'pchip', 'log-linear')
+
+
+def file_hash(path):
+    """Function to calculate the SHA-256 hash of a file
+    :param path: File path
+    :type path: str, required
+    ...
+    :return: Hexadecimal hash
+    :rtype: str
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def read_workbook(path, sheet='Sheet1'):
+    """Function to parse a calibration workbook or CSV file
+    :param path: Path of the Excel workbook or CSV file
+    :type path: str, required
+    :param sheet: Sheet name of Excel workbooks
+    :type sheet: str, optional
+    ...
+    :return: Wavelength [nm] and responsivity [A/W] arrays, sorted by wavelength
+    :rtype: tuple of arrays
+    """
+    import pandas as pd   # Only needed to rebuild the cache
+
+    if path.lower().endswith('.csv'):
+        cal_df = pd.read_csv(path)
+    else:
+        cal_df = pd.ExcelFile(path).parse(sheet)
+    wavelength = cal_df[WAVELENGTH_COLUMN].to_numpy(dtype=np.float64)
+    responsivity = cal_df[RESPONSIVITY_COLUMN].to_numpy(dtype=np.float64)
+    order = np.argsort(wavelength, kind='stable')
+    return wavelength[order], responsivity[order]
+
+
+class CalibrationStore(object):
+    """Class to load photodiode calibrations through a binary cache
+    :param cache_dir: Directory of the cache files, defaults to a folder next to each workbook
+    :type cache_dir: str, optional
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self.logger = logging.getLogger(__name__)
+        self._loaded = {}
+
+    def cache_path(self, path):
+        """Function to return the cache file of a workbook
+        :param path: Path of the Excel workbook
+        :type path: str, required
+        ...
+        :return: Path of the cache file
+        :rtype: str
+        """
+        path = os.path.abspath(path)
+        cache_dir = self.cache_dir or os.path.join(os.path.dirname(path), CACHE_DIR)
+        key = hashlib.sha1(path.encode()).hexdigest()[:12]   # Keeps workbooks with the same name in different folders apart
+        return os.path.join(cache_dir, '%s_%s.npz' % (os.path.basename(path), key))
+
+    def load(self, path, sheet='Sheet1'):
+        """Function to load a calibration, using the in-memory copy or cache file where possible
+        :param path: Path of the Excel workbook
+        :type path: str, required
+        :param sheet: Sheet name
+        :type sheet: str, optional
+        ...
+        :return: Wavelength [nm] and responsivity [A/W] arrays
+        :rtype: tuple of arrays
+        """
+        key = (os.path.abspath(path), sheet)
+        if key not in self._loaded:
+            self._loaded[key] = self._load_cached(path, sheet)
+        return self._loaded[key]
+
+    def _load_cached(self, path, sheet):
+        stat = os.stat(path)
+        cache_path = self.cache_path(path)
+
+        if os.path.exists(cache_path):
+            try:
+                with np.load(cache_path, allow_pickle=False) as cache:
+                    if str(cache['sheet']) == sheet and int(cache['size']) == stat.st_size:
+                        if float(cache['mtime']) == stat.st_mtime or str(cache['sha256']) == file_hash(path):
+                            return cache['wavelength'], cache['responsivity']
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile) as ex:
+                self.logger.error('Calibration cache %s unreadable: %s' % (cache_path, ex))
+
+        self.logger.info('Updating Calibration Cache for %s' % path)
+        wavelength, responsivity = read_workbook(path, sheet)
+        self._write_cache(cache_path, path, sheet, stat, wavelength, responsivity)
+        return wavelength, responsivity
+
+    def _write_cache(self, cache_path, path, sheet, stat, wavelength, responsivity):
+        temp_path = None
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Unique temporary file, as batch workers and setups may write the same cache at the same time
+            handle, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(cache_path))
+            with os.fdopen(handle, 'wb') as f:
+                np.savez(f, wavelength=wavelength, responsivity=responsivity, sheet=np.str_(sheet),
+                         size=stat.st_size, mtime=stat.st_mtime, sha256=np.str_(file_hash(path)))
+            os.chmod(temp_path, 0o644) # mkstemp creates the file readable by the owner only
+            os.replace(temp_path, cache_path)
+        except OSError as ex:
+            self.logger.error('Calibration cache %s not written: %s' % (cache_path, ex))
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class Detector(object):
+    """Class of a reference detector with a responsivity table on a dense wavelength grid
+    :param name: Detector name used to select it, e.g. 'Si'
+    :type name: str, required
+    :param path: Path of the calibration file
+    :type path: str, required
+    :param store: Calibration store used to load the calibration file
+    :type store: CalibrationStore, required
+    :param detector_type: Detector type
+    :type detector_type: str, optional
+    :param serial: Serial or model number
+    :type serial: str, optional
+    :param valid_range: Lowest and highest valid wavelength [nm], defaults to the calibrated range
+    :type valid_range: tuple, optional
+    :param interpolation: One of INTERPOLATIONS
+    :type interpolation: str, optional
+    :param sheet: Sheet name of Excel workbooks
+    :type sheet: str, optional
+    :param step: Grid step of the responsivity table [nm]
+    :type step: float, optional
+    """
+
+    def __init__(self, name, path, store, detector_type='', serial='', valid_range=None,
+                 interpolation='linear', sheet='Sheet1', step=0.1):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError('Unknown interpolation method: %s' % interpolation)
+        self.name = name
+        self.path = path
+        self.store = store
+        self.type = detector_type
+        self.serial = serial
+        self.valid_range = valid_range
+        self.interpolation = interpolation
+        self.sheet = sheet
+        self.step = step
+        self._table = None
+
+    def _build_table(self):
+        wavelength, responsivity = self.store.load(self.path, self.sheet)
+        if self.valid_range is None:
+            self.valid_range = (wavelength[0], wavelength[-1])
+        start = max(self.valid_range[0], wavelength[0])
+        stop = min(self.valid_range[1], wavelength[-1])
+        grid = start + self.step * np.arange(int(round((stop - start) / self.step)) + 1)
+
+        if self.interpolation == 'linear':
+            table = np.interp(grid, wavelength, responsivity)
+        elif self.interpolation == 'log-linear':
+            table = np.exp(np.interp(grid, wavelength, np.log(responsivity)))
+        else:
+            from scipy.interpolate import PchipInterpolator   # Only needed for PCHIP detectors
+            table = PchipInterpolator(wavelength, responsivity)(grid)
+
+        self._start = start
+        self._table = table
+
+    def responsivity(self, wavelength):
+        """Function to look up the responsivity
+        :param wavelength: Wavelength(s) [nm]
+        :type wavelength: float or array, required
+        ...
+        :return: Responsivity [A/W], NaN outside the valid range
+        :rtype: float or array
+        """
+        if self._table is None:
+            self._build_table()
+        position = (np.asarray(wavelength, dtype=float) - self._start) / self.step
+        valid = (position >= 0) & (position <= self._table.size - 1)
+        index = np.clip(position, 0, self._table.size - 1)
+        low = np.minimum(index.astype(int), self._table.size - 2) if self._table.size > 1 else index.astype(int)
+        high = np.minimum(low + 1, self._table.size - 1)
+        fraction = index - low
+        value = (1 - fraction) * self._table[low] + fraction * self._table[high]   # Linear between grid points
+        return np.where(valid, value, np.nan)[()]
+
+
+class DetectorRegistry(object):
+    """Class to discover reference detectors from the metadata files in a calibration directory
+    :param directory: Calibration directory
+    :type directory: str, required
+    :param store: Calibration store, defaults to a new one
+    :type store: CalibrationStore, optional
+    """
+
+    def __init__(self, directory, store=None):
+        self.directory = directory
+        self.store = store or CalibrationStore()
+        self.logger = logging.getLogger(__name__)
+        self.detectors = {}
+        self.discover()
+
+    def discover(self):
+        """Function to (re-)read all detector metadata files
+        :return: None
+        """
+        self.detectors = {}
+        for meta_path in sorted(glob.glob(os.path.join(self.directory, '*.json'))):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                detector = Detector(meta['name'], os.path.join(self.directory, meta['file']), self.store,
+                                    detector_type=meta.get('type', ''), serial=meta.get('serial', ''),
+                                    valid_range=tuple(meta['range']) if 'range' in meta else None,
+                                    interpolation=meta.get('interpolation', 'linear'),
+                                    sheet=meta.get('sheet', 'Sheet1'), step=meta.get('step', 0.1))
+            except (OSError, ValueError, KeyError) as ex:
+                self.logger.error('Invalid detector metadata %s: %s' % (meta_path, ex))
+                continue
+            self.detectors[detector.name] = detector
+
+    def names(self):
+        """Function to list the detector names
+        :return: Detector names
+        :rtype: list of str
+        """
+        return sorted(self.detectors)
+
+    def get(self, name):
+        """Function to return a detector
+        :param name: Detector name
+        :type name: str, required
+        ...
+        :raises KeyError: Raises error if no detector of this name is registered
+        ...
+        :return: Detector
+        :rtype: Detector
+        """
+        if name not in self.detectors:
+            raise KeyError('Unknown reference detector: %s' % name)
+        return self.detectors[name]
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite catalog of the scans in the data folder
+
+Every scan registers itself when it starts and is updated when it finishes. Existing data can be
+added by parsing the file names in parallel:
+
+Usage: python catalog.py rebuild DATA_FOLDER [--workers N] [--calibration-path CALIBRATION_FOLDER]
+       python catalog.py reference DATA_FOLDER USER EXPERIMENT START STOP [--before TIMESTAMP]
+"""
+
+import argparse
+import concurrent.futures
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+import batch
+import calibration
+import filenames
+
+CATALOG_FILE = 'catalog.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    user TEXT,
+    experiment TEXT,
+    name TEXT,
+    detector TEXT,
+    start_nm REAL,
+    stop_nm REAL,
+    step_nm REAL,
+    gain REAL,
+    filter TEXT,
+    gratings TEXT,
+    started REAL,
+    finished REAL,
+    points INTEGER
+);
+CREATE INDEX IF NOT EXISTS scans_user ON scans (user, experiment);
+CREATE INDEX IF NOT EXISTS scans_detector ON scans (detector);
+CREATE INDEX IF NOT EXISTS scans_range ON scans (start_nm, stop_nm);
+CREATE INDEX IF NOT EXISTS scans_step ON scans (step_nm);
+CREATE INDEX IF NOT EXISTS scans_gain ON scans (gain);
+CREATE INDEX IF NOT EXISTS scans_filter ON scans (filter);
+CREATE INDEX IF NOT EXISTS scans_gratings ON scans (gratings);
+CREATE INDEX IF NOT EXISTS scans_started ON scans (started);
+CREATE INDEX IF NOT EXISTS scans_finished ON scans (finished);
+"""
+
+COLUMNS = ('path', 'user', 'experiment', 'name', 'detector', 'start_nm', 'stop_nm', 'step_nm', 'gain',
+           'filter', 'gratings', 'started', 'finished', 'points')
+KEPT_COLUMNS = ('detector', 'started', 'gratings')   # Only known to scans registered by the GUI
+
+
+class Catalog(object):
+    """Class of the scan catalog of a data folder
+    :param root: Data folder, i.e. the folder holding the {userName}/{experimentName} folders
+    :type root: str, required
+    :param path: Catalog file, defaults to catalog.sqlite in the data folder
+    :type path: str, optional
+    """
+
+    def __init__(self, root, path=None):
+        self.root = root
+        self.path = path or os.path.join(root, CATALOG_FILE)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Function to close the catalog
+        :return: None
+        """
+        self.connection.close()
+
+    def register(self, keep_existing=False, **scan):
+        """Function to add or update a scan
+        :param keep_existing: Keep cataloged values of the detector, start time and grating map, e.g. when backfilling
+        :type keep_existing: bool, optional
+        :param scan: Values of COLUMNS, 'path' is required and relative to the data folder
+        :type scan: keyword arguments, required
+        ...
+        :return: None
+        """
+        with self.connection:
+            self._upsert(scan, keep_existing)
+
+    def register_many(self, scans, keep_existing=True):
+        """Function to add or update many scans in one transaction
+        :param scans: Dictionaries of COLUMNS values
+        :type scans: list of dict, required
+        :param keep_existing: Keep cataloged values of the detector, start time and grating map
+        :type keep_existing: bool, optional
+        ...
+        :return: None
+        """
+        with self.connection:
+            for scan in scans:
+                self._upsert(scan, keep_existing)
+
+    def _upsert(self, scan, keep_existing):
+        columns = [column for column in COLUMNS if column in scan]
+        updates = []
+        for column in columns:
+            if column == 'path':
+                continue
+            if keep_existing and column in KEPT_COLUMNS:
+                updates.append('%s = COALESCE(scans.%s, excluded.%s)' % (column, column, column))
+            else:
+                updates.append('%s = excluded.%s' % (column, column))
+        self.connection.execute('INSERT INTO scans (%s) VALUES (%s) ON CONFLICT(path) DO UPDATE SET %s'
+                                % (', '.join(columns), ', '.join('?' * len(columns)), ', '.join(updates)),
+                                [scan[column] for column in columns])
+
+    def find(self, order='started', **conditions):
+        """Function to query scans
+        :param order: Column to sort by
+        :type order: str, optional
+        :param conditions: Column values to match exactly
+        :type conditions: keyword arguments, optional
+        ...
+        :return: Matching scans
+        :rtype: list of sqlite3.Row
+        """
+        conditions = {column: value for column, value in conditions.items() if column in COLUMNS}
+        where = ' AND '.join('%s = ?' % column for column in conditions) or '1'
+        order = order if order in COLUMNS else 'started'
+        return self.connection.execute('SELECT * FROM scans WHERE %s ORDER BY %s' % (where, order),
+                                       list(conditions.values())).fetchall()
+
+    def references(self, user, experiment, start=None, stop=None, before=None, detector=None):
+        """Function to find the reference scans of an experiment
+        :param user: User name
+        :type user: str, required
+        :param experiment: Experiment name
+        :type experiment: str, required
+        :param start: Only consider references covering this wavelength
+        :type start: float, optional
+        :param stop: Only consider references covering this wavelength
+        :type stop: float, optional
+        :param before: Only consider references started before this time [s since epoch]
+        :type before: float, optional
+        :param detector: Reference detector name, any reference detector if None
+        :type detector: str, optional
+        ...
+        :return: Matching scans, oldest first
+        :rtype: list of sqlite3.Row
+        """
+        query = 'SELECT * FROM scans WHERE user = ? AND experiment = ? AND detector IS NOT NULL AND detector != ?'
+        values = [user, experiment, 'sample']
+        if start is not None:
+            query += ' AND start_nm <= ?'
+            values.append(start)
+        if stop is not None:
+            query += ' AND stop_nm >= ?'
+            values.append(stop)
+        if detector is not None:
+            query += ' AND detector = ?'
+            values.append(detector)
+        if before is not None:
+            query += ' AND COALESCE(started, finished) <= ?'
+            values.append(before)
+        return self.connection.execute(query + ' ORDER BY COALESCE(started, finished)', values).fetchall()
+
+    def latest_reference(self, user, experiment, start, stop, before=None, detector=None):
+        """Function to find the latest reference scan covering a wavelength range
+        :param user: User name
+        :type user: str, required
+        :param experiment: Experiment name
+        :type experiment: str, required
+        :param start: Wavelength start value
+        :type start: float, required
+        :param stop: Wavelength stop value
+        :type stop: float, required
+        :param before: Only consider references started before this time [s since epoch]
+        :type before: float, optional
+        :param detector: Reference detector name, any reference detector if None
+        :type detector: str, optional
+        ...
+        :return: Scan, or None if no reference covers the range
+        :rtype: sqlite3.Row
+        """
+        scans = self.references(user, experiment, start, stop, before, detector)
+        return scans[-1] if len(scans) > 0 else None
+
+    def full_path(self, scan):
+        """Function to look up the file of a cataloged scan
+        :param scan: Cataloged scan
+        :type scan: sqlite3.Row, required
+        ...
+        :return: File path
+        :rtype: str
+        """
+        return os.path.join(self.root, scan['path'])
+
+    def rebuild(self, workers=None, calibration_path='calibrations'):
+        """Function to backfill the catalog from the file names in the data folder
+        :param workers: Number of worker processes, defaults to the number of CPUs
+        :type workers: int, optional
+        :param calibration_path: Calibration folder with the reference detectors
+        :type calibration_path: str, optional
+        ...
+        :return: Number of scans found
+        :rtype: int
+        """
+        # Scans registered by the GUI keep their detector, start time and grating map
+        folders = []
+        for folder, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not d.startswith(('.', '_'))]  # Skip caches and processed output
+            folders.append(folder)
+        scans = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            for folder_scans in pool.map(parse_folder, [self.root] * len(folders), folders, chunksize=16):
+                scans.extend(folder_scans)
+
+        # Reference scans are labelled with their detector like the scans registered by the GUI, chosen from the
+        # file name or the scan range as in batch processing
+        registry = calibration.DetectorRegistry(calibration_path)
+        for scan in scans:
+            if scan['detector'] == 'reference':
+                detector = batch.select_detector(registry, {'name': scan['name'], 'start': scan['start_nm'],
+                                                            'stop': scan['stop_nm']})
+                if detector is not None:
+                    scan['detector'] = detector.name
+        self.register_many(scans)
+        return len(scans)
+
+
+def parse_folder(root, folder):
+    """Function to parse the scan files of one folder
+    :param root: Data folder
+    :type root: str, required
+    :param folder: Folder to parse
+    :type folder: str, required
+    ...
+    :return: Dictionaries of COLUMNS values
+    :rtype: list of dict
+    """
+    scans = []
+    relative = os.path.relpath(folder, root).split(os.sep)
+    user = relative[0] if len(relative) >= 1 and relative[0] != '.' else None
+    experiment = relative[1] if len(relative) >= 2 else None
+
+    for file_name in os.listdir(folder):
+        fields = filenames.parse_filename(file_name)
+        path = os.path.join(folder, file_name)
+        if fields is None or not os.path.isfile(path):
+            continue
+        try:
+            with open(path) as f:
+                header = f.readline().strip().split(',')
+                points = sum(1 for line in f)
+        except (OSError, UnicodeDecodeError):
+            continue
+        stat = os.stat(path)
+        scans.append({'path': os.path.relpath(path, root), 'user': user, 'experiment': experiment,
+                      'name': fields['name'], 'detector': 'reference' if 'Power' in header else 'sample',
+                      'start_nm': fields['start'], 'stop_nm': fields['stop'], 'step_nm': fields['step'],
+                      'gain': fields['amp'], 'filter': fields['filter'],
+                      'started': None, 'finished': stat.st_mtime, 'points': points})
+    return scans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Catalog of the sEQE scans in a data folder')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subparsers.add_parser('rebuild', help='Backfill the catalog from existing file names')
+    rebuild_parser.add_argument('root', help='Data folder')
+    rebuild_parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    rebuild_parser.add_argument('--calibration-path', default='calibrations', help='Calibration folder with the reference detectors')
+    reference_parser = subparsers.add_parser('reference', help='Find the latest reference scan covering a range')
+    reference_parser.add_argument('root', help='Data folder')
+    reference_parser.add_argument('user')
+    reference_parser.add_argument('experiment')
+    reference_parser.add_argument('start', type=float)
+    reference_parser.add_argument('stop', type=float)
+    reference_parser.add_argument('--before', type=float, default=None, help='Time in seconds since epoch')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+                        datefmt='%Y-%m-%d - %H:%M:%S')
+    logger = logging.getLogger(__name__)
+    catalog = Catalog(args.root)
+
+    if args.command == 'rebuild':
+        start = time.time()
+        count = catalog.rebuild(args.workers, args.calibration_path)
+        logger.info('Cataloged %d Scans in %.1f s' % (count, time.time() - start))
+    else:
+        scan = catalog.latest_reference(args.user, args.experiment, args.start, args.stop, args.before)
+        if scan is None:
+            logger.error('No Reference Found')
+            return 1
+        print(catalog.full_path(scan))
+
+    catalog.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checkpoints of running scans
+
+After every point the scan engine writes the scan plan, the position in the current range, the
+instrument state and the data file to a small JSON file in the data folder. An interrupted scan
+can then be resumed from the first missing wavelength, appending to the same data file. The file
+is replaced atomically, so a crash while writing leaves the previous checkpoint intact.
+"""
+
+import json
+import os
+import time
+
+CHECKPOINT_FILE = '.checkpoint.json'
+VERSION = 1
+
+
+def checkpoint_path(save_path):
+    """Function to compile the checkpoint file of a data folder
+    :param save_path: Data folder
+    :type save_path: str, required
+    ...
+    :return: Checkpoint file
+    :rtype: str
+    """
+    return os.path.join(save_path, CHECKPOINT_FILE)
+
+
+def save(path, state):
+    """Function to write a checkpoint
+    :param path: Checkpoint file
+    :type path: str, required
+    :param state: Checkpoint, must be JSON serialisable
+    :type state: dict, required
+    ...
+    :return: None
+    """
+    state = dict(state, version=VERSION, updated=time.time())
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        f.write(json.dumps(state)) # dumps encodes in C, dump in small chunks in Python
+    os.replace(temporary, path)
+
+
+def load(path):
+    """Function to read a checkpoint
+    :param path: Checkpoint file
+    :type path: str, required
+    ...
+    :return: Checkpoint, or None if there is no valid checkpoint
+    :rtype: dict
+    """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get('version') != VERSION:
+        return None
+    return state
+
+
+def clear(path):
+    """Function to remove a checkpoint after the scan finished
+    :param path: Checkpoint file
+    :type path: str, required
+    ...
+    :return: None
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
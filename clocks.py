@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clocks shared by the scan engine and the instrument drivers
+
+The engine and the drivers read the time and wait through a clock object instead of calling
+time.time and time.sleep. The system clock is used with real instruments. The virtual clock
+of the simulation advances instantly when waiting, so that simulated scans run as fast as the
+software allows while keeping the timing of the real setup. The scaled clock really waits, but
+a fixed factor shorter, so that simulated setups wait like real ones, e.g. to benchmark several
+setups running side by side.
+"""
+
+import time
+
+
+class SystemClock(object):
+    """Class of the wall clock
+    """
+
+    def time(self):
+        """Function to read the current time
+        :return: Seconds since the epoch
+        :rtype: float
+        """
+        return time.time()
+
+    def sleep(self, seconds):
+        """Function to wait
+        :param seconds: Duration [s]
+        :type seconds: float, required
+        ...
+        :return: None
+        """
+        time.sleep(seconds)
+
+
+class VirtualClock(object):
+    """Class of a simulated clock that advances instantly when waiting
+    :param start: Start time [s since the epoch], defaults to the current time
+    :type start: float, optional
+    """
+
+    def __init__(self, start=None):
+        self.now = time.time() if start is None else float(start)
+        self.slept = 0.0 # Total simulated waiting time [s]
+
+    def time(self):
+        """Function to read the simulated time
+        :return: Seconds since the epoch
+        :rtype: float
+        """
+        return self.now
+
+    def sleep(self, seconds):
+        """Function to advance the simulated time
+        :param seconds: Duration [s]
+        :type seconds: float, required
+        ...
+        :return: None
+        """
+        if seconds > 0:
+            self.now += seconds
+            self.slept += seconds
+
+    def advance_to(self, when):
+        """Function to advance the simulated time to a point in time, e.g. the end of a move
+        :param when: Time [s since the epoch]
+        :type when: float, required
+        ...
+        :return: None
+        """
+        self.sleep(when - self.now)
+
+
+class ScaledClock(object):
+    """Class of a clock running a fixed factor faster than the wall clock
+    :param speed: Simulated seconds per wall second
+    :type speed: float, optional
+    :param start: Start time [s since the epoch], defaults to the current time
+    :type start: float, optional
+    """
+
+    def __init__(self, speed=50, start=None):
+        self.speed = float(speed)
+        self.start = time.time() if start is None else float(start)
+        self.origin = time.perf_counter()
+
+    def time(self):
+        """Function to read the simulated time
+        :return: Seconds since the epoch
+        :rtype: float
+        """
+        return self.start + (time.perf_counter() - self.origin)*self.speed
+
+    def sleep(self, seconds):
+        """Function to wait the scaled down duration
+        :param seconds: Simulated duration [s]
+        :type seconds: float, required
+        ...
+        :return: None
+        """
+        if seconds > 0:
+            time.sleep(seconds/self.speed)
+
+    def advance_to(self, when):
+        """Function to wait until a point in simulated time
+        :param when: Time [s since the epoch]
+        :type when: float, required
+        ...
+        :return: None
+        """
+        self.sleep(when - self.time())
+
+
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Min/max decimation of plot series
+
+Points are collected in buckets of consecutive points and each finished bucket is reduced to its
+minimum and maximum, so that peaks stay visible. When there are more buckets than the target width,
+neighbouring buckets are merged and the bucket size doubles. Appending a point is therefore O(1)
+amortised. The bucket still being filled is reduced to its minimum and maximum as well when the
+series is drawn, so a series never has more than 2x the target width plus 2 points to draw.
+"""
+
+import numpy as np
+
+
+class MinMaxDecimator(object):
+    """Class to decimate a series while points are appended
+    :param width: Target number of buckets, e.g. the plot width in pixels
+    :type width: int, optional
+    """
+
+    def __init__(self, width=1000):
+        self.width = max(int(width), 2)
+        self.bucket_size = 1
+        self.buckets = np.empty((self.width+1, 4))   # x of min, min, x of max, max
+        self.count = 0
+        self.open_x = []
+        self.open_y = []
+        self.size = 0
+        self.xmin = self.ymin = np.inf
+        self.xmax = self.ymax = -np.inf
+        self._cache = None
+
+    def __len__(self):
+        return self.size
+
+    def append(self, x, y):
+        """Function to add a point to the series
+        :param x: x value, ascending
+        :type x: float, required
+        :param y: y value
+        :type y: float, required
+        ...
+        :return: None
+        """
+        self.open_x.append(x)
+        self.open_y.append(y)
+        self.size += 1
+        self.xmin, self.xmax = min(self.xmin, x), max(self.xmax, x)
+        self.ymin, self.ymax = min(self.ymin, y), max(self.ymax, y)
+        self._cache = None
+
+        if len(self.open_x) == self.bucket_size:
+            low = int(np.argmin(self.open_y))
+            high = int(np.argmax(self.open_y))
+            self.buckets[self.count] = (self.open_x[low], self.open_y[low], self.open_x[high], self.open_y[high])
+            self.count += 1
+            self.open_x, self.open_y = [], []
+            if self.count > self.width:
+                self.merge()
+
+    def extend(self, x, y):
+        """Function to add several points to the series
+        :param x: x values, ascending
+        :type x: array, required
+        :param y: y values
+        :type y: array, required
+        ...
+        :return: None
+        """
+        for xi, yi in zip(x, y):
+            self.append(xi, yi)
+
+    def merge(self):
+        """Function to merge neighbouring buckets and double the bucket size
+        :return: None
+        """
+        pairs = self.count//2
+        first = self.buckets[0:2*pairs:2]
+        second = self.buckets[1:2*pairs:2]
+        merged = first.copy()
+        lower = second[:, 1] < first[:, 1]
+        merged[lower, 0:2] = second[lower, 0:2]
+        higher = second[:, 3] > first[:, 3]
+        merged[higher, 2:4] = second[higher, 2:4]
+
+        leftover = self.buckets[2*pairs:self.count].copy()
+        self.buckets[:pairs] = merged
+        self.count = pairs
+        self.bucket_size *= 2
+
+        # A leftover bucket is only half full at the new size, so its points return to the open bucket
+        if len(leftover) > 0:
+            x_low, y_low, x_high, y_high = leftover[0]
+            points = sorted({(x_low, y_low), (x_high, y_high)})
+            self.open_x = [p[0] for p in points] + self.open_x
+            self.open_y = [p[1] for p in points] + self.open_y
+
+    def data(self):
+        """Function to get the decimated series
+        :return: x and y arrays in ascending x order, at most 2*width + 2 points
+        :rtype: tuple of arrays
+        """
+        if self._cache is None:
+            buckets = self.buckets[:self.count]
+            low_first = buckets[:, 0] <= buckets[:, 2]
+            x = np.where(low_first[:, None], buckets[:, [0, 2]], buckets[:, [2, 0]]).ravel()
+            y = np.where(low_first[:, None], buckets[:, [1, 3]], buckets[:, [3, 1]]).ravel()
+            # The open bucket holds up to a bucket size of raw points, keep its minimum and maximum only
+            open_x, open_y = self.open_x, self.open_y
+            if len(open_y) > 2:
+                index = sorted({int(np.argmin(open_y)), int(np.argmax(open_y))})
+                open_x, open_y = [open_x[i] for i in index], [open_y[i] for i in index]
+            self._cache = (np.concatenate((x, open_x)), np.concatenate((y, open_y)))
+        return self._cache
+
+
+def decimate(x, y, width):
+    """Function to decimate a complete series
+    :param x: x values, ascending
+    :type x: array, required
+    :param y: y values
+    :type y: array, required
+    :param width: Target number of buckets, e.g. the plot width in pixels
+    :type width: int, required
+    ...
+    :return: x and y arrays with at most 2*width points
+    :rtype: tuple of arrays
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= 2*width:
+        return x, y
+    size = int(np.ceil(len(x)/width))
+    pad = (-len(x)) % size
+    yp = np.concatenate((y, np.full(pad, np.nan))).reshape(-1, size)
+    low = np.argmin(np.where(np.isnan(yp), np.inf, yp), axis=1)
+    high = np.argmax(np.where(np.isnan(yp), -np.inf, yp), axis=1)
+    offset = np.arange(len(yp))*size
+    index = np.sort(np.stack((offset + low, offset + high), axis=1), axis=1).ravel()
+    index = np.minimum(index, len(x)-1)
+    return x[index], y[index]
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Drift monitoring by revisiting a fixed wavelength during long scans
+
+A revisit becomes due after a number of points or a time interval. A due revisit is taken as
+soon as it does not need an extra grating or filter change, i.e. when the monitor wavelength
+uses the current configuration or the one the scan is about to switch to anyway. It is only
+forced with an extra change once it is overdue by the slack fraction of the interval.
+"""
+
+import numpy as np
+
+
+class DriftMonitor(object):
+    """Class to schedule and record revisits of a monitor wavelength
+    :param wavelength: Monitor wavelength [nm]
+    :type wavelength: float, required
+    :param every_points: Revisit after this many scan points
+    :type every_points: int, optional
+    :param every_seconds: Revisit after this many seconds
+    :type every_seconds: float, optional
+    :param slack: Fraction of the interval a revisit may be delayed to avoid an extra grating or filter change
+    :type slack: float, optional
+    """
+
+    def __init__(self, wavelength, every_points=None, every_seconds=None, slack=0.5):
+        self.wavelength = wavelength
+        self.every_points = every_points
+        self.every_seconds = every_seconds
+        self.slack = slack
+        self.start(0)
+
+    def start(self, now):
+        """Function to forget all readings at the start of a scan
+        :param now: Current time [s]
+        :type now: float, required
+        :return: None
+        """
+        self.times = []
+        self.values = []
+        self._points = 0
+        self._last_time = now
+
+    def point_done(self):
+        """Function to count a finished scan point
+        :return: None
+        """
+        self._points += 1
+
+    def overdue(self, now):
+        """Function to calculate how far the next revisit is overdue
+        :param now: Current time [s]
+        :type now: float, required
+        ...
+        :return: Largest fraction of the points or time interval passed, infinite before the first reading
+        :rtype: float
+        """
+        if not self.values:
+            return np.inf
+        fraction = 0.0
+        if self.every_points:
+            fraction = max(fraction, self._points / float(self.every_points))
+        if self.every_seconds:
+            fraction = max(fraction, (now - self._last_time) / float(self.every_seconds))
+        return fraction
+
+    def should_revisit(self, now, monitor_config, current_config, next_config):
+        """Function to decide if the monitor wavelength should be measured before the next scan point
+        :param now: Current time [s]
+        :type now: float, required
+        :param monitor_config: Grating and filter of the monitor wavelength
+        :type monitor_config: tuple, required
+        :param current_config: Grating and filter of the current position
+        :type current_config: tuple, required
+        :param next_config: Grating and filter of the next scan point
+        :type next_config: tuple, required
+        ...
+        :return: Returns True if the monitor wavelength should be measured now
+        :rtype: bool
+        """
+        overdue = self.overdue(now)
+        if overdue >= 1 + self.slack:
+            return True
+        return overdue >= 1 and monitor_config in (current_config, next_config)
+
+    def record(self, now, value):
+        """Function to store a monitor reading
+        :param now: Current time [s]
+        :type now: float, required
+        :param value: Measured signal at the monitor wavelength
+        :type value: float, required
+        :return: None
+        """
+        self.times.append(now)
+        self.values.append(value)
+        self._points = 0
+        self._last_time = now
+
+    @property
+    def relative(self):
+        """Latest monitor reading relative to the first one, or 1 without readings"""
+        if not self.values or self.values[0] == 0:
+            return 1.0
+        return self.values[-1] / self.values[0]
+
+    def curve(self):
+        """Function to return the drift curve
+        :return: Arrays of reading times, readings and readings relative to the first one
+        :rtype: tuple of arrays
+        """
+        times = np.asarray(self.times, dtype=float)
+        values = np.asarray(self.values, dtype=float)
+        if values.size and values[0] != 0:
+            relative = values / values[0]
+        else:
+            relative = np.ones(values.size)
+        return times, values, relative
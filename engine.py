@@ -0,0 +1,1472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless scan engine
+
+Instrument drivers, scan definitions and the scan executor, usable from scripts, notebooks and over
+SSH without a Qt window. The GUI builds a ScanPlan from its widgets and runs it with a ScanEngine.
+
+Example:
+    mono = engine.Monochromator('/dev/ttyUSB1')
+    lockin = engine.LockIn()
+    wheel = engine.FilterWheel('/dev/ttyUSB0')
+    for instrument in (lockin, mono, wheel):
+        instrument.connect()
+    scan = engine.ScanEngine(mono, lockin, wheel, save_path='data')
+    plan = engine.ScanPlan('sample', 'user', 'experiment', [engine.ScanRange(350, 1100, 5, 1000)])
+    scan.run(plan)
+"""
+
+import io
+import itertools
+import logging
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import averaging
+import calibration
+import catalog
+import checkpoint
+import clocks
+import drift
+import eqe
+import eventlog
+import filenames
+import phase_tracking
+import ringbuffer
+import scheduler
+import settling
+import stitching
+import timing
+
+# Default switching points of the gratings and monochromator filters, including start and excluding stop
+GRATINGS = {1: (350, 535), 2: (535, 1150), 3: (1150, 1800)}
+FILTERS = {2: (350, 410), 3: (410, 650), 4: (650, 985), 5: (985, 1800)}
+
+COLUMNS = ['Wavelength', 'Mean Current', 'Amplification', 'Mean R', 'Mean Frequency', 'Mean Phase', 'Samples', 'Rejected',
+           'Projected R', 'Reference Phase', 'Drift']
+
+
+# -----------------------------------------------------------------------------------------------------------
+
+    #### Instrument drivers
+
+# -----------------------------------------------------------------------------------------------------------
+
+class Monochromator(object):
+    """Class of the monochromator, controlled over a serial connection
+    :param port: Serial port, e.g. '/dev/ttyUSB1'
+    :type port: str, required
+    :param clock: Clock to wait on, the system clock by default
+    :type clock: SystemClock or VirtualClock, optional
+    """
+
+    def __init__(self, port, clock=None):
+        self.port = port
+        self.clock = clock or clocks.SYSTEM_CLOCK
+        self.logger = logging.getLogger(__name__)
+        self.connected = False
+        self.failures = 0 # Commands without a valid response
+        self.p = None
+
+    def connect(self):
+        """Function to establish connection to monochromator
+        :return: True if the connection was established
+        :rtype: bool
+        """
+        self.p = self.openPort()
+        self.p.write('HELLO\r'.encode())   # "Hello" initializes the Monochromator
+        self.clock.sleep(25)   # Wait until the Monochromator has initialized before sending commands
+        self.connected = self.waitForOK()   # Checks for OK response of Monochromator
+
+        if self.connected:
+            self.logger.info('Connection to Monochromator Established')
+        return self.connected
+
+    def openPort(self):
+        """Function to open the serial port
+        :return: Serial port
+        :rtype: serial.Serial
+        """
+        import serial
+
+        return serial.Serial(self.port, 9600, timeout=0)
+
+    def close(self):
+        """Function to close the serial connection
+        :return: None
+        """
+        if self.p is not None:
+            self.p.close()
+        self.connected = False
+
+    def waitForOK(self):
+        """Function to wait for acceptance signal from monochromator
+        :raises LoggerError: Raises error if monochromator connection failed
+        ...
+        :return: Returns True of connection successful, and False otherwise
+        :rtype: bool
+        """
+        ret = False
+        self.p.timeout = 40000
+        shouldbEOk = self.p.readline()
+
+        if (shouldbEOk == ' ok\r\n'.encode()) or (shouldbEOk == '  ok\r\n'.encode()):
+            ret = True
+        else:
+            self.failures += 1
+            self.logger.error('Connection to Monochromator Could Not Be Established')
+        eventlog.event('response', 'mono', response=shouldbEOk.decode(errors='replace').strip(), ok=ret)
+
+        self.p.timeout = 0
+        return ret
+
+    def command(self, command):
+        """Function to send a command and wait for the acceptance signal
+        :param command: Command without line ending
+        :type command: str, required
+        ...
+        :return: True if the command was accepted
+        :rtype: bool
+        """
+        if not self.connected:
+            self.logger.error('Monochromator Not Connected')
+            return False
+        self.p.write((command + '\r').encode())
+        eventlog.event('command', 'mono', command=command)
+        return self.waitForOK()
+
+    def query(self, command):
+        """Function to query a numbered position, e.g. '?grating' or '?filter'
+        :param command: Query command
+        :type command: str, required
+        ...
+        :return: Position, or None if the response was invalid
+        :rtype: int
+        """
+        if not self.connected:
+            self.logger.error('Monochromator Not Connected')
+            return None
+        self.p.write((command + '\r').encode())
+        eventlog.event('command', 'mono', command=command)
+        self.p.timeout = 30000
+        response = self.p.readline()
+        self.p.timeout = 0
+        eventlog.event('response', 'mono', response=response.decode(errors='replace').strip())
+
+        match = re.match(rb'^\s*(\d)\s+ok\r\n$', response)
+        if match is None:
+            self.failures += 1
+            self.logger.error('Error: %s Response' % command[1:].capitalize())
+            return None
+        return int(match.group(1))
+
+    def goto(self, wavelength):
+        """Function to send wavelength command to monochromator
+        :param wavelength: target wavelength
+        :type wavelength: float, required
+        ...
+        :return: None
+        """
+        self.logger.debug('Moving to %d nm' % wavelength)
+        self.command('{:.2f} GOTO'.format(wavelength))
+
+    def setSpeed(self, speed):
+        """Function to send scan speed command to monochromator
+        :param speed: monochromator grating scan speed [nm/min]
+        :type speed: float, required
+        ...
+        :return: None
+        """
+        self.command('{:.2f} NM/MIN'.format(speed))
+
+    def setGrating(self, gratingNo):
+        """Function to send grating command to monochromator
+        :param gratingNo: Monochromator grating number
+        :type gratingNo: int, required
+        ...
+        :return: None
+        """
+        if self.connected:
+            self.logger.info('Moving to Grating %d' % gratingNo)
+        self.command('{:d} grating'.format(gratingNo))
+
+    def setFilter(self, filterNo):
+        """Function to send filter selection command to monochromator filter wheel
+        :param filterNo: Filter position
+        :type filterNo: int, required
+        ...
+        :return: None
+        """
+        self.command('{:d} FILTER'.format(filterNo))
+
+    def grating(self):
+        """Function to query the current grating
+        :return: Grating number, or None if the response was invalid
+        :rtype: int
+        """
+        return self.query('?grating')
+
+    def filter(self):
+        """Function to query the current filter position
+        :return: Filter position, or None if the response was invalid
+        :rtype: int
+        """
+        return self.query('?filter')
+
+    def initializeFilter(self, filterDiff):
+        """Function to initialize filter wheel
+        :param filterDiff: Difference between filter position and initialization position
+        :type filterDiff: int, required
+        ...
+        :return: True if the filter wheel was initialized
+        :rtype: bool
+        """
+        if not self.connected:
+            self.logger.error('Monochromator Not Connected')
+            return False
+        self.logger.info('Initializing Monochromator Filter Wheel')
+        self.p.write('{:d} FILTER\r'.format(filterDiff).encode())
+        self.p.write('FHOME\r'.encode())
+        return self.waitForOK()
+
+
+class FilterWheel(object):
+    """Class of the external Thorlabs filter wheel, controlled over a serial connection
+    :param port: Serial port, e.g. '/dev/ttyUSB0'
+    :type port: str, required
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.logger = logging.getLogger(__name__)
+        self.connected = False
+        self._fw = None
+        self._sio = None
+
+    def connect(self):
+        """Function to establish connection to filter wheel
+        :return: True if the connection was established
+        :rtype: bool
+        """
+        try:
+            self._fw = self.openPort()
+        except OSError as ex: # Includes serial.SerialException
+            self.logger.error('Port {0} is unavailable: {1}'.format(self.port, ex))
+            self.connected = False
+            return False
+
+        self._sio = io.TextIOWrapper(io.BufferedRWPair(self._fw, self._fw, 1),
+                                     newline=None, encoding='ascii')
+        self.logger.info("Connection to External Filter Wheel Established")
+        self._sio.flush()
+        self.connected = True
+        return True
+
+    def openPort(self):
+        """Function to open the serial port
+        :return: Serial port
+        :rtype: serial.Serial
+        """
+        import serial
+
+        return serial.Serial(port=self.port, baudrate=115200, bytesize=8, parity='N', stopbits=1,
+                             timeout=1, xonxoff=0, rtscts=0)
+
+    def close(self):
+        """Function to close the serial connection
+        :return: None
+        """
+        if self._fw is not None:
+            self._fw.close()
+        self.connected = False
+
+    def move(self, pos):
+        """Function to update position of the filter wheel
+        :param pos: Target filter position, between 1-6
+        :type pos: int, required
+        ...
+        :return: Returns True if connection to filter wheel is successful, False otherwise
+        """
+        if not self.connected:
+            self.logger.error("External Filter Wheel Not Connected")
+            return False
+        self._sio.flush()
+        self._sio.write('pos=' + str(pos) + '\r')
+        eventlog.event('command', 'wheel', command='pos=%s' % pos)
+        return True
+
+
+class LockinSettings(object):
+    """Class of the Lock-in demodulator settings
+    :param tc: Time constant [s]
+    :type tc: float, required
+    :param rate: Data transfer rate [Sa/s]
+    :type rate: float, required
+    :param order: Low-pass filter order
+    :type order: int, required
+    :param input_range: Input range [V]
+    :type input_range: float, optional
+    :param ac: AC coupling
+    :type ac: int, optional
+    :param imp50: 50 Ohm input impedance
+    :type imp50: int, optional
+    :param imp50_ref: 50 Ohm input impedance of the reference input, attenuates the signal from the chopper controller
+    :type imp50_ref: int, optional
+    :param diff: Differential input
+    :type diff: int, optional
+    """
+
+    def __init__(self, tc, rate, order, input_range=2, ac=0, imp50=0, imp50_ref=1, diff=1):
+        self.tc = tc
+        self.rate = rate
+        self.order = int(order)
+        self.input_range = input_range
+        self.ac = ac
+        self.imp50 = imp50
+        self.imp50_ref = imp50_ref
+        self.diff = diff
+
+
+class LockIn(object):
+    """Class of the Zurich Instruments Lock-in
+    :param host: Address of the data server
+    :type host: str, optional
+    :param port: Port of the data server
+    :type port: int, optional
+    :param channel: Signal input and demodulator channel, 1-based
+    :type channel: int, optional
+    :param clock: Clock to wait on, the system clock by default
+    :type clock: SystemClock or VirtualClock, optional
+    """
+
+    def __init__(self, host='localhost', port=8005, channel=1, clock=None):
+        self.host = host
+        self.port = port
+        self.channel = channel
+        self.clock = clock or clocks.SYSTEM_CLOCK
+        self.c = str(channel-1)
+        self.logger = logging.getLogger(__name__)
+        self.connected = False
+        self.daq = None
+        self.device = None
+        self.clockbase = None
+        self.sample_path = None
+
+    def connect(self):
+        """Function to establish connection to Lockin
+        :return: True if the connection was established
+        :rtype: bool
+        """
+        self.daq, self.device = self.openServer()
+        self.logger.info('Connection to Lock-In Established')
+        self.connected = True
+        return True
+
+    def openServer(self):
+        """Function to connect to the data server and find the device
+        :return: Data server session and device id
+        :rtype: tuple
+        """
+        import zhinst.utils
+        import zhinst.ziPython
+
+        daq = zhinst.ziPython.ziDAQServer(self.host, self.port)
+        return daq, zhinst.utils.autoDetect(daq)
+
+    def configure(self, settings, amplification, settle):
+        """Function to set the Lock-in parameters
+        :param settings: Demodulator settings
+        :type settings: LockinSettings, required
+        :param amplification: Pre-amplifier amplification value
+        :type amplification: float, required
+        :param settle: Time to wait for a settled low-pass filter [s]
+        :type settle: float, required
+        ...
+        :return: None
+        """
+        c_2 = str(self.channel) # Channel 2 for the reference input
+
+        # Disable all outputs and all demods
+        general_setting = [[['/', self.device, '/demods/%d/trigger' % demod], 0] for demod in range(6)]
+        general_setting += [[['/', self.device, '/sigouts/0/enables/*'], 0],
+                            [['/', self.device, '/sigouts/1/enables/*'], 0]]
+        self.daq.set(general_setting)
+
+        t1_sigOutIn_setting = [
+            [['/', self.device, '/sigins/',self.c,'/diff'], settings.diff],  # Diff Button (Enable for differential mode to measure the difference between +In and -In.)
+            [['/', self.device, '/sigins/',self.c,'/imp50'], settings.imp50],  # 50 Ohm Button (Enable to switch input impedance between low (50 Ohm) and high (approx 1 MOhm). Select for signal frequencies of > 10 MHz.)
+            [['/', self.device, '/sigins/',self.c,'/ac'], settings.ac],  # AC Button (Enable for AC coupling to remove DC signal. Cutoff frequency = 1kHz)
+            [['/', self.device, '/sigins/',self.c,'/range'], settings.input_range],  # Input Range
+            [['/', self.device, '/demods/',self.c,'/order'], settings.order],  # Low-Pass Filter Order
+            [['/', self.device, '/demods/',self.c,'/timeconstant'], settings.tc],  # Time Constant
+            [['/', self.device, '/demods/',self.c,'/rate'], settings.rate],  # Data Transfer Rate
+            [['/', self.device, '/demods/',self.c,'/oscselect'], self.channel-1],  # Oscillators
+            [['/', self.device, '/demods/',self.c,'/harmonic'], 1],  # Harmonicss
+            [['/', self.device, '/demods/',self.c,'/phaseshift'], 0],  # Phase Shift
+            [['/', self.device, '/zctrls/',self.c,'/tamp/0/currentgain'], amplification],  #  Amplifier Setting
+            [['/', self.device, '/demods/',self.c,'/adcselect'], self.channel-1],
+
+        # For locked reference signal
+            [['/', self.device, '/sigins/', c_2,'/imp50'], settings.imp50_ref],
+            [['/', self.device, '/plls/',self.c,'/enable'], 1],  # Manual [0], External Reference [1]
+            [['/', self.device, '/plls/',self.c,'/adcselect'], 1],
+        ]
+        self.daq.set(t1_sigOutIn_setting)
+        eventlog.event('configure', 'lockin', tc=settings.tc, order=settings.order, rate=settings.rate,
+                       input_range=settings.input_range, gain=amplification, settle=settle)
+        self.clock.sleep(settle)  # wait to get a settled lowpass filter
+        self.daq.flush()   # clean queue
+
+    def subscribe(self):
+        """Function to subscribe to the demodulator samples
+        :return: None
+        """
+        self.sample_path = '/%s/demods/%s/sample' % (self.device, self.c)
+        self.daq.subscribe(self.sample_path)
+        self.clockbase = float(self.daq.getInt('/%s/clockbase' % self.device)) # Timestamp ticks per second
+
+    def unsubscribe(self):
+        """Function to unsubscribe from the demodulator samples
+        :return: None
+        """
+        self.daq.unsubscribe(self.sample_path)
+
+    def poll(self, duration):
+        """Function to poll the demodulator samples
+        :param duration: Poll duration [s]
+        :type duration: float, required
+        ...
+        :return: Dictionary with the ['timestamp']['x']['y']['frequency']['phase'] arrays and the 'dataloss' flag, or None if no data was received
+        :rtype: dict
+        """
+        # Second parameter is poll timeout in [ms] (recomended value is 500ms)
+        dataDict = self.daq.poll(duration, 500)
+        if self.device not in dataDict:
+            eventlog.event('poll', 'lockin', duration=duration, samples=0)
+            return None
+        data = dataDict[self.device]['demods'][self.c]['sample']
+        sample = {key: data[key] for key in ['timestamp', 'x', 'y', 'frequency', 'phase']}
+        sample['dataloss'] = bool(data['time']['dataloss'])
+        eventlog.event('poll', 'lockin', duration=duration, samples=len(sample['x']), dataloss=sample['dataloss'])
+        return sample
+
+
+# -----------------------------------------------------------------------------------------------------------
+
+    #### Scan definitions
+
+# -----------------------------------------------------------------------------------------------------------
+
+class PositionMap(object):
+    """Class to look up the grating or filter position for a wavelength
+    :param ranges: Dictionary of position and (start, stop) wavelengths, including start and excluding stop,
+                   except for the last range which includes stop
+    :type ranges: dict, required
+    :param name: Name used in error messages, e.g. 'Grating' or 'Filter'
+    :type name: str, required
+    """
+
+    def __init__(self, ranges, name):
+        self.ranges = {int(position): (float(start), float(stop)) for position, (start, stop) in ranges.items()}
+        self.name = name
+        self.logger = logging.getLogger(__name__)
+
+    def __call__(self, wavelength):
+        """Function to look up the position for a wavelength
+        :param wavelength: Wavelength
+        :type wavelength: float, required
+        ...
+        :return: Position, or None if out of range
+        :rtype: int
+        """
+        positions = sorted(self.ranges)
+        for position in positions:
+            start, stop = self.ranges[position]
+            if start <= wavelength < stop or (position == positions[-1] and wavelength == stop):
+                return position
+        self.logger.error('Error: %s Out Of Range' % self.name)
+        return None
+
+
+def GratingMap(ranges):
+    """Function to create the map of monochromator gratings, e.g. {1: (350, 535), 2: (535, 1150), 3: (1150, 1800)}
+    :return: Grating lookup
+    :rtype: PositionMap
+    """
+    return PositionMap(ranges, 'Grating')
+
+
+def FilterMap(ranges):
+    """Function to create the map of monochromator filters, e.g. {2: (350, 410), 3: (410, 650), 4: (650, 985), 5: (985, 1800)}
+    :return: Filter lookup
+    :rtype: PositionMap
+    """
+    return PositionMap(ranges, 'Filter')
+
+
+class ScanRange(object):
+    """Class of one wavelength range of a scan
+    :param start: Wavelength start value
+    :type start: float, required
+    :param stop: Wavelength stop value
+    :type stop: float, required
+    :param step: Wavelength step value
+    :type step: float, required
+    :param amp: Pre-amplifier amplification value
+    :type amp: float, required
+    :param external_filter: Position of the external filter wheel for complete scans
+    :type external_filter: int, optional
+    :param filter_label: External filter in the file name, e.g. 'no' or a cut-on wavelength
+    :type filter_label: str, optional
+    """
+
+    def __init__(self, start, stop, step, amp, external_filter=None, filter_label=None):
+        self.start = start
+        self.stop = stop
+        self.step = step
+        self.amp = amp
+        self.external_filter = external_filter
+        self.filter_label = filter_label
+
+    def wavelengths(self):
+        """Function to compile scan parameters
+        :return: List of wavelength values, starting one step before the start to cut off the initial spike
+        :rtype: list
+        """
+        number = int((self.stop-self.start)/self.step)
+        return [self.start + n*self.step for n in range(-1, number + 1)]
+
+
+class ScanPlan(object):
+    """Class of a scan of one sample or reference detector
+    :param name: File name
+    :type name: str, required
+    :param user: User name
+    :type user: str, required
+    :param experiment: Experiment name
+    :type experiment: str, required
+    :param ranges: Wavelength ranges, measured in order
+    :type ranges: list of ScanRange, required
+    :param detector: Reference detector name, None for samples
+    :type detector: str, optional
+    :param complete: Complete scan with external filters, whose segments are stitched
+    :type complete: bool, optional
+    :param gratings: Grating map, defaults to the GUI defaults
+    :type gratings: PositionMap, optional
+    :param filters: Monochromator filter map, defaults to the GUI defaults
+    :type filters: PositionMap, optional
+    :param lockin: Lock-in settings, defaults to the GUI defaults
+    :type lockin: LockinSettings, optional
+    :param speed: Monochromator scan speed [nm/min]
+    :type speed: float, optional
+    """
+
+    def __init__(self, name, user, experiment, ranges, detector=None, complete=False, gratings=None, filters=None,
+                 lockin=None, speed=1000):
+        self.name = name
+        self.user = user
+        self.experiment = experiment
+        self.ranges = ranges
+        self.detector = detector
+        self.complete = complete
+        self.gratings = gratings or GratingMap(GRATINGS)
+        self.filters = filters or FilterMap(FILTERS)
+        self.lockin = lockin or LockinSettings(tc=0.1, rate=224.9, order=4)
+        self.speed = speed
+
+
+# -----------------------------------------------------------------------------------------------------------
+
+    #### Scan executor
+
+# -----------------------------------------------------------------------------------------------------------
+
+class ScanEngine(object):
+    """Class to run scan plans on a set of instruments
+    :param mono: Monochromator
+    :type mono: Monochromator, required
+    :param lockin: Lock-in
+    :type lockin: LockIn, required
+    :param wheel: External filter wheel
+    :type wheel: FilterWheel, required
+    :param save_path: Data folder, holding the {userName}/{experimentName} folders
+    :type save_path: str, required
+    :param calibration_path: Folder of the reference detector calibrations
+    :type calibration_path: str, optional
+    :param clock: Clock to read and wait on, shared with the instruments, the system clock by default
+    :type clock: SystemClock or VirtualClock, optional
+    """
+
+    def __init__(self, mono, lockin, wheel, save_path, calibration_path='calibrations', clock=None):
+        self.mono = mono
+        self.lockin = lockin
+        self.clock = clock or clocks.SYSTEM_CLOCK
+        self.wheel = wheel
+        self.save_path = save_path
+        self.calibration_path = calibration_path
+        self.logger = logging.getLogger(__name__)
+
+        # Averaging of the demodulator samples of each point ('mean', 'sigma_clip', 'median', 'trimmed_mean', 'hodges_lehmann')
+        self.averaging = 'mean'
+        self.clip_sigma = 3 # Outlier threshold in standard deviations
+        self.trim_fraction = 0.1 # Fraction of samples cut from each end for the trimmed mean
+
+        # Detection mode ('magnitude' uses R, 'projection' projects X and Y of weak points onto the phase of strong points)
+        self.detection = 'magnitude'
+        self.phase_tracker = phase_tracking.PhaseTracker(snr_threshold=20, smoothing=0.2)
+
+        # Lock-in low-pass filter settling
+        self.settle_accuracy = 0.99 # Settled fraction to wait for after moves and setting changes
+        self.integration_tc = 5 # Measurement window after settling in time constants
+
+        # Noise-budgeted allocation of the measurement window per wavelength. Set either a time budget or a target SNR to enable it
+        self.time_budget = None # Total time per range [s]
+        self.target_snr = None # Target signal-to-noise ratio of each point
+        self.pilot_step = 5 # Pilot measurement at every n-th wavelength
+        self.pilot_tc = 3 # Pilot measurement window in time constants
+        self.min_window_tc = 1 # Shortest measurement window in time constants
+        self.max_window_tc = 50 # Longest measurement window in time constants
+
+        # Drift monitor. Set a monitor wavelength to revisit it every few points or minutes during a scan
+        self.monitor_wavelength = None # [nm]
+        self.monitor_points = 20 # Revisit after this many points
+        self.monitor_minutes = None # Revisit after this many minutes
+        self.drift_correction = False # Normalise the current to the latest monitor reading
+
+        self.live_eqe = True # Calculate the EQE of sample scans from the latest reference measurements of the experiment
+        self.use_catalog = True # Register every scan in the catalog of the data folder
+        self.use_checkpoints = True # Checkpoint every point to resume interrupted scans
+        self.context = None # Caller information stored with the checkpoint, e.g. the queued job
+        self.log_timings = True # Log the time of moves, swaps and points to calibrate the timing model
+        self.event_log = True # Write the commands, responses, points and errors of every run to the _logs folder of the data folder
+
+        self.detectors = None # Reference detectors, discovered on first use
+        self.catalog = None
+        self.timing = None # Timing model, fitted to the logged timings when a scan starts
+        self.timing_log = None
+        self.timing_path = None # Folder of the timing log, the calibration folder by default, e.g. one folder per setup
+        self.events = None # Event log of the runs
+        self.scope_buffer = None # Optional ring buffer of the raw demodulator samples
+        self.metrics = None # Optional live metrics of the running scan, see metrics.py
+
+        # Callbacks of front ends
+        self.range_callback = None # Called with the scan list and whether the EQE is calculated when a range starts
+        self.point_callback = None # Called with a dictionary of each measured point
+        self.status_callback = None # Called with status messages, e.g. the remaining scan time
+
+        self.measuring = False
+        self.plan = None
+        self.settings = None
+        self.amplification = None
+        self.point_overhead = 0
+        self.last_wavelength = None
+        self.motion_time = 0
+        self.eta = None # Expected end of the running scan
+        self.path = None
+        self.file_name = None
+        self.range_index = 0
+        self.segments = []
+        self.point_number = 0
+
+    # Scan control
+
+    def stop(self):
+        """Function to stop the running scan after the current point
+        :return: None
+        """
+        self.measuring = False
+
+    def connected(self):
+        """Function to check that all instruments are connected
+        :return: True if the monochromator, Lock-in and filter wheel are connected
+        :rtype: bool
+        """
+        return self.mono.connected and self.lockin.connected and self.wheel.connected
+
+    def loadDetectors(self):
+        """Function to discover the reference detectors in the calibration folder
+        :return: Detector registry
+        :rtype: DetectorRegistry
+        """
+        if self.detectors is None:
+            self.detectors = calibration.DetectorRegistry(self.calibration_path)
+        return self.detectors
+
+    def release(self):
+        """Function to close the catalog and the timing log, whose connections belong to the thread that opened them
+        :return: None
+        """
+        for log in (self.catalog, self.timing_log):
+            if log is not None:
+                log.close()
+        self.catalog = None
+        self.timing_log = None
+
+    def status(self, message):
+        if self.status_callback is not None:
+            self.status_callback(message)
+
+    def settleTime(self):
+        """Function to calculate the settling time of the Lockin low-pass filter
+        :return: Minimum wait [s] to reach the settling accuracy for the current time constant and filter order
+        :rtype: float
+        """
+        return settling.settle_time(self.settings.tc, self.settings.order, self.settle_accuracy)
+
+    def configure(self, settings, amplification, speed=None):
+        """Function to update the Lock-in parameters and the monochromator scan speed
+        :param settings: Lock-in settings
+        :type settings: LockinSettings, required
+        :param amplification: Pre-amplifier amplification value
+        :type amplification: float, required
+        :param speed: Monochromator scan speed [nm/min]
+        :type speed: float, optional
+        ...
+        :return: None
+        """
+        self.settings = settings
+        self.amplification = amplification
+        if self.lockin.connected:
+            self.lockin.configure(settings, amplification, self.settleTime())
+            self.logger.info('Updating Lock-In Settings')
+        else:
+            self.logger.error("Lock-In Not Connected")
+        if speed is not None:
+            self.mono.setSpeed(speed)
+
+    def run(self, plan, resume=None):
+        """Function to measure all ranges of a scan plan
+        :param plan: Scan plan
+        :type plan: ScanPlan, required
+        :param resume: Checkpoint of an interrupted run of the plan, to continue from its first missing wavelength
+        :type resume: dict, optional
+        ...
+        :return: DataFrames of the measured ranges
+        :rtype: list of DataFrame
+        """
+        run_id = None
+        if self.event_log:
+            if self.events is None:
+                self.events = eventlog.EventLog(os.path.join(self.save_path, eventlog.LOG_FOLDER), self.clock)
+            self.events.folder = os.path.join(self.save_path, eventlog.LOG_FOLDER) # The data folder may change between runs
+            run_id = self.events.start(plan.name)
+            eventlog.event('run', name=plan.name, user=plan.user, experiment=plan.experiment, detector=plan.detector,
+                           complete=plan.complete, ranges=len(plan.ranges), resumed=resume is not None, context=self.context)
+        if self.metrics is not None:
+            self.metrics.start(plan.name, run_id, len(plan.ranges), self.clock.time())
+        try:
+            return self.measurePlan(plan, resume)
+        except Exception as ex:
+            self.logger.exception('Scan Failed: %s' % ex)
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.finish(not self.measuring, self.clock.time())
+            if run_id is not None:
+                eventlog.event('finished', stopped=not self.measuring)
+                self.events.stop()
+
+    def measurePlan(self, plan, resume=None):
+        """Function to measure the ranges of a scan plan, see run
+        :param plan: Scan plan
+        :type plan: ScanPlan, required
+        :param resume: Checkpoint of an interrupted run of the plan
+        :type resume: dict, optional
+        ...
+        :return: DataFrames of the measured ranges
+        :rtype: list of DataFrame
+        """
+        self.plan = plan
+        self.measuring = True
+        self.point_number = 0
+        self.phase_tracker.reset() # Ranges of the same sample share the signal phase, each detector has its own
+        self.stitcher = stitching.Stitcher() if plan.complete else None
+        self.stitched_name = None
+        self.segments = []
+        self.timing = timing.load(self.timingFolder())
+        results = []
+
+        first_range = 0
+        if resume is not None:
+            self.path = resume['path']
+            first_range = resume['range']
+            self.stitched_name = resume['stitched_name']
+            # Merge the segments finished before the interruption again
+            for file_name, label in resume['segments']:
+                segment_df = pd.read_csv(os.path.join(resume['path'], file_name), index_col=0)
+                if plan.complete:
+                    self.stitcher.add(segment_df, label)
+                self.segments.append([file_name, label])
+                results.append(segment_df)
+
+        for number, scan_range in enumerate(plan.ranges):
+            if number < first_range:
+                continue
+            if not self.measuring:
+                break
+            self.range_index = number
+            if self.metrics is not None:
+                self.metrics.range_index = number
+            if plan.complete:
+                # Not timed for the timing model, move returns once the command is written, before the wheel has turned
+                if not self.wheel.move(scan_range.external_filter):
+                    continue
+                if scan_range.filter_label == 'no':
+                    self.logger.info('Moving to Open Filter Position')
+                else:
+                    self.logger.info('Moving to %s nm Filter' % scan_range.filter_label)
+
+            self.configure(plan.lockin, scan_range.amp, plan.speed)
+            resume_range = resume if resume is not None and number == first_range and resume['file_name'] is not None else None
+            range_df = self.measureRange(scan_range, resume_range)
+            results.append(range_df)
+            if plan.complete:
+                self.stitchSegment(range_df, scan_range.filter_label)
+            if range_df is not None and self.measuring:
+                self.segments.append([self.file_name, scan_range.filter_label])
+                self.range_index = number + 1
+                self.saveCheckpoint(0)
+
+        if self.measuring:
+            checkpoint.clear(self.checkpointPath()) # Finished, nothing to resume
+
+        if plan.complete:
+            self.wheel.move(1)
+            self.logger.info('Moving to open filter')
+        self.mono.setFilter(1)
+        self.logger.info('Finished Measurement')
+        return results
+
+    # Measurement of one range
+
+    def measureRange(self, scan_range, resume=None):
+        """Function to prepare and perform the measurement of one range
+        :param scan_range: Wavelength range
+        :type scan_range: ScanRange, required
+        :param resume: Checkpoint of an interrupted measurement of the range
+        :type resume: dict, optional
+        ...
+        :return: DataFrame of the measurement, or None if not all instruments are connected
+        :rtype: DataFrame
+        """
+        if not self.connected():
+            self.logger.error('Instruments Not Connected')
+            return None
+
+        if resume is not None:
+            return self.resumeRange(scan_range, resume)
+
+        plan = self.plan
+        label = scan_range.filter_label if plan.complete else None
+        fileName = filenames.format_filename(plan.name, scan_range.start, scan_range.stop, scan_range.step, scan_range.amp, label)
+
+        # Set up path to save data
+        self.path = os.path.join(self.save_path, plan.user, plan.experiment)
+        self.logger.info(f'Saving data to: {self.path}')
+        os.makedirs(self.path, exist_ok=True)
+        self.file_name = unique_name(self.path, fileName)
+
+        scan_list = scan_range.wavelengths()
+        self.registerScan(scan_list, scan_range, label)
+        return self.measure(scan_list)
+
+    def resumeRange(self, scan_range, resume):
+        """Function to restore the instrument state of a checkpoint and continue its range, appending to the same data file
+        :param scan_range: Wavelength range
+        :type scan_range: ScanRange, required
+        :param resume: Checkpoint
+        :type resume: dict, required
+        ...
+        :return: DataFrame of the measurement
+        :rtype: DataFrame
+        """
+        self.path = resume['path']
+        self.file_name = resume['file_name']
+        data_file = os.path.join(self.path, self.file_name)
+        previous = []
+        if os.path.exists(data_file):
+            previous = pd.read_csv(data_file, index_col=0)[COLUMNS].values.tolist()
+
+        state = resume['state']
+        if state['grating'] is not None:
+            self.mono.setGrating(state['grating'])
+        if state['filter'] is not None:
+            self.mono.setFilter(state['filter'])
+
+        # Start one point before the first missing wavelength, as the first point of a scan is discarded
+        first = max(resume['next'] - 1, 0)
+        scan_list = scan_range.wavelengths()
+        if first < len(scan_list):
+            self.logger.info('Resuming %s at %g nm' % (self.file_name, scan_list[min(resume['next'], len(scan_list) - 1)]))
+        return self.measure(scan_list, first, previous)
+
+    def measure(self, scan_list, first=0, previous=None):
+        """Function to perform the measurement of a list of wavelengths
+        :param scan_list: List of wavelength values to scan
+        :type scan_list: list, required
+        :param first: Index of the first wavelength to measure, when resuming
+        :type first: int, optional
+        :param previous: Rows measured before the scan was interrupted
+        :type previous: list, optional
+        ...
+        :return: DataFrame of the measurement
+        :rtype: DataFrame
+        """
+        full_list = list(scan_list)
+        scan_list = full_list[first:]
+        plan = self.plan
+
+        # Interpolate the latest reference power onto the scan wavelengths to calculate the EQE during sample scans
+        eqe_power = None
+        if plan.detector is None and self.live_eqe:
+            power, ref_files = eqe.reference_power(self.path, full_list, exclude=os.path.join(self.path, self.file_name),
+                                                   files=self.catalogReferences())
+            if len(ref_files) > 0:
+                eqe_power = dict(zip(full_list, power))
+                self.logger.info('Calculating EQE from: %s' % ', '.join(os.path.basename(f) for f in ref_files))
+            else:
+                self.logger.info('No Reference Measurement Found')
+
+        detector = self.loadDetectors().get(plan.detector) if plan.detector is not None else None
+
+        if self.range_callback is not None:
+            self.range_callback(full_list, eqe_power is not None)
+
+        self.clock.sleep(1)
+
+        data_list = list(previous or [])
+        data_df = pd.DataFrame(data_list, columns=COLUMNS)
+
+        # Show the points measured before the scan was interrupted
+        if len(data_list) > 0 and self.point_callback is not None:
+            if eqe_power is not None:
+                data_df['EQE'] = eqe.calculate_eqe(data_df['Mean Current'], data_df['Wavelength'].map(eqe_power), data_df['Wavelength'])
+            for _, row in data_df.iterrows():
+                point = {'Wavelength': row['Wavelength'], 'R': row['Mean R'], 'Log R': np.log(row['Mean R']), 'Phase': row['Mean Phase']}
+                if eqe_power is not None:
+                    point['EQE'] = row['EQE']
+                self.point_callback(point)
+
+        self.lockin.subscribe()
+        count = 0
+
+        # Allocate the measurement window of each wavelength from pilot measurements
+        windows = None
+        if self.time_budget is not None or self.target_snr is not None:
+            windows = self.planWindows(scan_list)
+
+        # Set up drift monitor within the scan range, as external filters may block other wavelengths
+        monitor = None
+        if self.monitor_wavelength is not None:
+            monitor_wavelength = np.clip(self.monitor_wavelength, min(scan_list), max(scan_list))
+            monitor = drift.DriftMonitor(monitor_wavelength, every_points=self.monitor_points,
+                                         every_seconds=None if self.monitor_minutes is None else 60*self.monitor_minutes)
+            monitor.start(self.clock.time())
+            monitor_config = self.monoConfiguration(monitor_wavelength)
+            current_config = None
+
+        while len(scan_list) > 0 and self.measuring:
+            wavelength = scan_list[0]
+
+            # Revisit the monitor wavelength when due, preferably without an extra grating or filter change
+            if monitor is not None:
+                next_config = self.monoConfiguration(wavelength)
+                if monitor.should_revisit(self.clock.time(), monitor_config, current_config, next_config):
+                    self.measureMonitor(monitor)
+                current_config = next_config
+
+            point_start = self.clock.time()
+            self.point_number += 1
+            if self.events is not None:
+                self.events.point = self.point_number
+
+            if windows is not None:
+                window = windows[wavelength]
+            else:
+                window = self.integration_tc*self.settings.tc
+            data = self.pollPoint(wavelength, window)
+            poll_stop = self.clock.time()
+
+            if data is not None and count > 0: # Cut off the first measurement before the start to cut off the initial spike in the spectrum
+                rdata = np.sqrt(data['x']**2+data['y']**2)
+
+                # Average R, X, Y, frequency and phase, rejecting outliers identified on R
+                samples = np.vstack((rdata, data['x'], data['y'], data['frequency'], data['phase']))
+                averages, stats = averaging.average(samples, self.averaging, sigma=self.clip_sigma, fraction=self.trim_fraction)
+                mean_r, mean_x, mean_y, mean_freq, mean_phase = averages
+
+                # Learn the signal phase on strong points and project X and Y onto it
+                strong = self.phase_tracker.update(mean_x, mean_y, averaging.mad_sigma(rdata))
+                proj_r = self.phase_tracker.project(mean_x, mean_y)
+                ref_phase = self.phase_tracker.reference
+
+                if self.detection == 'projection' and not strong and self.phase_tracker.locked:
+                    mean_curr = proj_r/self.amplification # Projection removes the positive noise bias of R for weak points
+                else:
+                    mean_curr = mean_r/self.amplification
+
+                drift_value = monitor.relative if monitor is not None else 1.0
+                if self.drift_correction:
+                    mean_curr = mean_curr/drift_value
+
+                data_list.append([wavelength, mean_curr, self.amplification, mean_r, mean_freq, mean_phase, stats['samples'],
+                                  stats['rejected'], proj_r, ref_phase, drift_value])
+                data_df = pd.DataFrame(data_list, columns=COLUMNS)
+
+                if detector is not None:
+                    calculatePower(data_df, detector)
+                elif eqe_power is not None:
+                    data_df['EQE'] = eqe.calculate_eqe(data_df['Mean Current'], data_df['Wavelength'].map(eqe_power), data_df['Wavelength'])
+
+                data_df.to_csv(os.path.join(self.path, self.file_name))
+
+                eventlog.event('point', wavelength=wavelength, current=mean_curr, r=mean_r, phase=mean_phase,
+                               samples=stats['samples'], rejected=stats['rejected'], window=window)
+                if self.metrics is not None:
+                    self.metrics.record(wavelength, mean_r, self.clock.time())
+
+                if self.point_callback is not None:
+                    point = {'Wavelength': wavelength, 'R': mean_r, 'Log R': np.log(mean_r), 'Phase': mean_phase}
+                    if eqe_power is not None:
+                        point['EQE'] = data_df['EQE'].iloc[-1]
+                    self.point_callback(point)
+
+            del scan_list[0]
+            count += 1
+            if monitor is not None:
+                monitor.point_done()
+            self.saveCheckpoint(first + count, wavelength)
+
+            # Log the time spent outside the moves, settling and measurement window, and update the remaining scan time
+            self.recordTiming('overhead', self.clock.time() - point_start - self.motion_time - self.settleTime() - window)
+            remaining = self.updateEta(scan_list, windows, wavelength)
+            if self.metrics is not None:
+                self.updateMetrics(point_start, poll_stop, remaining)
+
+        self.lockin.unsubscribe()
+
+        if self.catalog is not None:
+            self.catalog.register(path=self.catalogPath(), finished=self.clock.time(), points=len(data_df))
+
+        return data_df
+
+    # Timing model
+
+    def timingFolder(self):
+        """Function to look up the folder of the timing log
+        :return: Folder of timings.sqlite
+        :rtype: str
+        """
+        return self.timing_path or self.calibration_path
+
+    def recordTiming(self, kind, duration, amount=None):
+        """Function to log the time of a step to calibrate the timing model
+        :param kind: One of timing.KINDS
+        :type kind: str, required
+        :param duration: Measured time [s]
+        :type duration: float, required
+        :param amount: Size of the step, e.g. the distance of a GOTO [nm], or the target position of a swap
+        :type amount: float, optional
+        ...
+        :return: None
+        """
+        eventlog.event('timing', step=kind, duration=duration, amount=amount)
+        if not self.log_timings:
+            return
+        try:
+            if self.timing_log is None:
+                self.timing_log = timing.TimingLog(os.path.join(self.timingFolder(), timing.TIMING_FILE))
+            self.timing_log.record(kind, duration, amount)
+        except (OSError, sqlite3.Error) as ex:
+            self.logger.error('Timing Not Logged: %s' % ex)
+            self.log_timings = False
+
+    def updateEta(self, scan_list, windows, wavelength):
+        """Function to estimate the remaining time of the running scan from the timing model
+        :param scan_list: Remaining wavelengths of the current range
+        :type scan_list: list, required
+        :param windows: Dictionary of wavelength and measurement window [s], None for fixed windows
+        :type windows: dict, required
+        :param wavelength: Last measured wavelength
+        :type wavelength: float, required
+        ...
+        :return: Remaining time [s]
+        :rtype: float
+        """
+        plan = self.plan
+        window = self.integration_tc*self.settings.tc
+        remaining = self.timing.points(plan, scan_list, [windows[w] for w in scan_list] if windows is not None else [window]*len(scan_list),
+                                       self.settleTime(), start=(wavelength, timing.position(plan.gratings, wavelength), timing.position(plan.filters, wavelength)))
+        remaining += self.timing.scan(plan, self.integration_tc, self.settle_accuracy, ranges=plan.ranges[self.range_index+1:])
+        remaining += self.timing.swap('filter', 1) + (self.timing.wheel if plan.complete else 0) # Return to position 1 after the scan
+        self.eta = self.clock.time() + remaining
+        self.status('Remaining Scan Time: %s, Done At %s' % (scheduler.format_duration(remaining),
+                                                            time.strftime('%H:%M', time.localtime(self.eta))))
+        return remaining
+
+    # Live metrics
+
+    def updateMetrics(self, point_start, poll_stop, remaining):
+        """Function to update the live metrics after a point, without locks as the metrics have a single writer
+        :param point_start: Start time of the point
+        :type point_start: float, required
+        :param poll_stop: End time of the Lock-in poll
+        :type poll_stop: float, required
+        :param remaining: Remaining scan time [s]
+        :type remaining: float, required
+        ...
+        :return: None
+        """
+        now = self.clock.time()
+        self.metrics.phase('motion', self.motion_time)
+        self.metrics.phase('poll', poll_stop - point_start - self.motion_time)
+        self.metrics.phase('processing', now - poll_stop)
+        self.metrics.phase('point', now - point_start)
+        self.metrics.serial_failures = self.mono.failures
+        self.metrics.remaining = remaining
+        self.metrics.eta = self.eta
+        self.metrics.updated = now
+
+    # Checkpoints
+
+    def checkpointPath(self):
+        """Function to compile the checkpoint file of the data folder
+        :return: Checkpoint file
+        :rtype: str
+        """
+        return checkpoint.checkpoint_path(self.save_path)
+
+    def saveCheckpoint(self, next_index, wavelength=None):
+        """Function to save the progress of the running scan, to resume it after an interruption
+        :param next_index: Index of the next wavelength of the current range, 0 if the range has not started
+        :type next_index: int, required
+        :param wavelength: Last measured wavelength, to save the grating and filter used for it
+        :type wavelength: float, optional
+        ...
+        :return: None
+        """
+        if not self.use_checkpoints:
+            return
+        import recipe # Imported here, the recipe module imports this module
+
+        plan = self.plan
+        grating = timing.position(plan.gratings, wavelength) if wavelength is not None else None
+        filter_no = timing.position(plan.filters, wavelength) if wavelength is not None else None
+        scan_range = plan.ranges[min(self.range_index, len(plan.ranges) - 1)]
+        state = {'grating': grating, 'filter': filter_no, 'gain': scan_range.amp,
+                 'wheel': scan_range.external_filter if plan.complete else None,
+                 'lockin': vars(plan.lockin) if plan.lockin is not None else None}
+        try:
+            checkpoint.save(self.checkpointPath(),
+                            {'recipe': recipe.from_plan(plan, self.save_path), 'range': self.range_index, 'next': next_index,
+                             'path': self.path, 'file_name': self.file_name if next_index > 0 else None, 'segments': self.segments,
+                             'stitched_name': self.stitched_name, 'state': state, 'context': self.context})
+        except (OSError, TypeError, ValueError) as ex:
+            self.logger.error('Checkpoint Not Saved: %s' % ex)
+
+    def loadCheckpoint(self):
+        """Function to read the checkpoint of an interrupted scan in the data folder
+        :return: Checkpoint, or None if no scan was interrupted
+        :rtype: dict
+        """
+        return checkpoint.load(self.checkpointPath())
+
+    def resume(self, state=None):
+        """Function to continue an interrupted scan from its first missing wavelength
+        :param state: Checkpoint, the checkpoint of the data folder by default
+        :type state: dict, optional
+        ...
+        :return: DataFrames of the measured ranges, or None if there is nothing to resume
+        :rtype: list of DataFrame
+        """
+        import recipe # Imported here, the recipe module imports this module
+
+        state = state or self.loadCheckpoint()
+        if state is None:
+            self.logger.info('No Interrupted Scan Found')
+            return None
+        plan = recipe.build_plans(state['recipe'])[0]
+        self.logger.info('Resuming %s' % plan.name)
+        return self.run(plan, resume=state)
+
+    # Monochromator configuration
+
+    def monoConfiguration(self, wavelength):
+        """Function to look up the grating and filter used for a wavelength
+        :param wavelength: Wavelength
+        :type wavelength: float, required
+        ...
+        :return: Grating number and filter position
+        :rtype: tuple
+        """
+        return (self.plan.gratings(wavelength), self.plan.filters(wavelength))
+
+    def monoCheckFilter(self, wavelength):
+        """Function to update the position of the monochromator filter wheel
+        :param wavelength: Target wavelength
+        :type wavelength: float, required
+        ...
+        :return: None
+        """
+        shouldbeFilterNo = self.plan.filters(wavelength)
+        if self.mono.connected and self.mono.filter() != shouldbeFilterNo and shouldbeFilterNo is not None:
+            swap_start = self.clock.time()
+            self.mono.setFilter(shouldbeFilterNo)
+            self.recordTiming('filter', self.clock.time() - swap_start, shouldbeFilterNo)
+            # Take data and discard it, this is required to avoid kinks
+            self.lockin.poll(self.settleTime())
+
+    def monoCheckGrating(self, wavelength):
+        """Function to update the monochromator grating
+        :param wavelength: Target wavelength
+        :type wavelength: float, required
+        ...
+        :return: None
+        """
+        shouldbeGratingNo = self.plan.gratings(wavelength)
+        if self.mono.connected and self.mono.grating() != shouldbeGratingNo and shouldbeGratingNo is not None:
+            swap_start = self.clock.time()
+            self.mono.setGrating(shouldbeGratingNo)
+            self.recordTiming('grating', self.clock.time() - swap_start, shouldbeGratingNo)
+            # Take data and discard it, this is required to avoid kinks
+            self.lockin.poll(self.settleTime())
+
+    # Move to a wavelength and take data
+
+    def pollPoint(self, wavelength, window):
+        """Function to move to a wavelength and poll the settled demodulator samples
+        :param wavelength: Target wavelength
+        :type wavelength: float, required
+        :param window: Measurement window after the filter has settled [s]
+        :type window: float, required
+        ...
+        :return: Dictionary with the ['timestamp']['x']['y']['frequency']['phase'] arrays within the measurement window, or None if no data was received
+        :rtype: dict
+        """
+        move_start = self.clock.time()
+        self.monoCheckFilter(wavelength)
+        self.monoCheckGrating(wavelength)
+        goto_start = self.clock.time()
+        self.mono.goto(wavelength)
+        move_stop = self.clock.time()
+        self.mark('motion', move_start, move_stop)
+        self.motion_time = move_stop - move_start
+        if self.last_wavelength is not None:
+            self.recordTiming('goto', move_stop - goto_start, abs(wavelength - self.last_wavelength))
+        self.last_wavelength = wavelength
+
+        # Poll data for the settling time plus the measurement window
+        data = self.lockin.poll(self.settleTime() + window)
+        if data is None:
+            return None
+
+        times = ringbuffer.host_times(data['timestamp'], self.lockin.clockbase, self.clock.time())
+        if self.scope_buffer is not None:
+            self.scope_buffer.extend(times, data['x'], data['y'], data['frequency'], data['phase'])
+
+        if data['dataloss']:
+            self.logger.info('Sample Loss Detected')
+            if self.metrics is not None:
+                self.metrics.dataloss += 1
+            self.mark('dataloss', times[0], times[-1])
+            return None
+
+        # Only keep the measurement window at the end of the poll, after the filter has settled from the move
+        settled = times >= times[-1] - window
+        self.mark('discard', times[0], times[-1] - window)
+        self.mark('window', times[-1] - window, times[-1])
+
+        return {key: data[key][settled] for key in ['timestamp', 'x', 'y', 'frequency', 'phase']}
+
+    def mark(self, kind, start, stop):
+        if self.scope_buffer is not None:
+            self.scope_buffer.mark(kind, start, stop)
+
+    # Measure drift monitor wavelength
+
+    def measureMonitor(self, monitor):
+        """Function to measure the drift monitor wavelength and save the drift curve
+        :param monitor: Drift monitor of the current scan
+        :type monitor: DriftMonitor, required
+        ...
+        :return: None
+        """
+        data = self.pollPoint(monitor.wavelength, self.integration_tc*self.settings.tc)
+        if data is None or len(data['x']) == 0:
+            return
+
+        rdata = np.sqrt(data['x']**2+data['y']**2)
+        averages, stats = averaging.average(rdata, self.averaging, sigma=self.clip_sigma, fraction=self.trim_fraction)
+        monitor.record(self.clock.time(), averages[0])
+        self.logger.info('Drift Monitor at %d nm: %.4f' % (monitor.wavelength, monitor.relative))
+
+        times, values, relative = monitor.curve()
+        drift_df = pd.DataFrame({'Time': times - times[0], 'Wavelength': monitor.wavelength, 'Mean R': values, 'Relative R': relative})
+        drift_df.to_csv(os.path.join(self.path, self.file_name + '_drift'))
+
+    # Allocate measurement windows
+
+    def planWindows(self, scan_list):
+        """Function to allocate the measurement window of each wavelength from quick pilot measurements
+        :param scan_list: List of wavelength values to scan
+        :type scan_list: list, required
+        ...
+        :return: Dictionary of wavelength and measurement window [s]
+        :rtype: dict
+        """
+        tc = self.settings.tc
+        pilot_list = scan_list[::int(self.pilot_step)]
+        if pilot_list[-1] != scan_list[-1]:
+            pilot_list.append(scan_list[-1])
+
+        pilot_window = self.pilot_tc*tc
+        tau = settling.correlation_time(tc, self.settings.order)
+        pilot_signal = []
+        pilot_noise = []
+        pilot_start = self.clock.time()
+
+        self.logger.info('Taking Pilot Measurements')
+        for wavelength in pilot_list:
+            if not self.measuring:
+                break
+            data = self.pollPoint(wavelength, pilot_window)
+            if data is None or len(data['x']) == 0:
+                continue
+            rdata = np.sqrt(data['x']**2+data['y']**2)
+            pilot_signal.append([wavelength, np.mean(rdata)])
+            pilot_noise.append(averaging.mad_sigma(rdata)*np.sqrt(tau)) # Noise density of R
+
+        # Time per point spent moving and settling
+        self.point_overhead = max((self.clock.time() - pilot_start)/len(pilot_list) - pilot_window, 0)
+
+        if len(pilot_signal) == 0:
+            self.logger.error('Error: No Pilot Data')
+            return {wavelength: self.integration_tc*tc for wavelength in scan_list}
+
+        pilot_signal = np.array(pilot_signal)
+        signal = np.interp(scan_list, pilot_signal[:, 0], pilot_signal[:, 1])
+        noise = np.interp(scan_list, pilot_signal[:, 0], pilot_noise)
+
+        windows = scheduler.allocate_windows(signal, noise, budget=self.time_budget, target_snr=self.target_snr,
+                                             overhead=self.point_overhead,
+                                             min_window=self.min_window_tc*tc, max_window=self.max_window_tc*tc)
+
+        predicted = scheduler.predict_duration(windows, self.point_overhead)
+        self.logger.info('Predicted Scan Time: %s' % scheduler.format_duration(predicted))
+        self.status('Predicted Scan Time: %s' % scheduler.format_duration(predicted))
+
+        return dict(zip(scan_list, windows))
+
+    # Merge the segments of a complete scan
+
+    def stitchSegment(self, segment_df, label):
+        """Function to merge a finished complete scan segment into the stitched spectrum and save it
+        :param segment_df: Measurement data of the segment
+        :type segment_df: DataFrame, required
+        :param label: External filter of the segment, e.g. 'no' or a cut-on wavelength
+        :type label: str, required
+        ...
+        :return: None
+        """
+        if segment_df is None or len(segment_df) == 0:
+            return
+
+        stitched_df = self.stitcher.add(segment_df, label)
+
+        if self.stitched_name is None:
+            self.stitched_name = unique_name(self.path, self.plan.name + '_stitched')
+
+        stitched_df.to_csv(os.path.join(self.path, self.stitched_name))
+        self.logger.info('Stitched %s Filter Segment, Scale %.4f' % (label, stitched_df['Scale'].iloc[-1]))
+
+    # Catalog of the data folder
+
+    def catalogPath(self):
+        """Function to compile the catalog path of the current data file
+        :return: Path relative to the data folder
+        :rtype: str
+        """
+        return os.path.relpath(os.path.join(self.path, self.file_name), self.save_path)
+
+    def registerScan(self, scan_list, scan_range, label):
+        """Function to register a new scan in the catalog of the data folder
+        :param scan_list: List of wavelength values to scan
+        :type scan_list: list, required
+        :param scan_range: Wavelength range
+        :type scan_range: ScanRange, required
+        :param label: External filter of complete scans
+        :type label: str, required
+        ...
+        :return: None
+        """
+        if not self.use_catalog:
+            return
+        try:
+            if self.catalog is None:
+                self.catalog = catalog.Catalog(self.save_path)
+
+            # Wavelength ranges of each grating, e.g. '1:350-600;2:605-1100'
+            gratings = []
+            for grating, wavelengths in itertools.groupby(scan_list, self.plan.gratings):
+                wavelengths = list(wavelengths)
+                gratings.append('%s:%g-%g' % (grating, wavelengths[0], wavelengths[-1]))
+
+            self.catalog.register(path=self.catalogPath(), user=self.plan.user, experiment=self.plan.experiment,
+                                  name=self.plan.name, detector=self.plan.detector or 'sample',
+                                  start_nm=scan_range.start, stop_nm=scan_range.stop, step_nm=scan_range.step, gain=scan_range.amp,
+                                  filter=label, gratings=';'.join(gratings), started=self.clock.time(), finished=None, points=0)
+        except sqlite3.Error as err:
+            self.logger.error('Scan Not Cataloged: %s' % err)
+            self.catalog = None
+
+    def catalogReferences(self):
+        """Function to look up the reference files of the current experiment in the catalog
+        :return: File paths, or None to search the experiment folder instead
+        :rtype: list of str
+        """
+        if self.catalog is None:
+            return None
+        scans = self.catalog.references(self.plan.user, self.plan.experiment)
+        return [self.catalog.full_path(scan) for scan in scans]
+
+
+# -----------------------------------------------------------------------------------------------------------
+
+def calculatePower(ref_df, detector):
+    """Function to calculate power
+    :param ref_df: DataFrame of reference measurements
+    :type ref_df: DataFrame, required
+    :param detector: Reference detector
+    :type detector: Detector, required
+    ...
+    :return: DataFrame of reference diode measurements incl. power
+    :rtype: DataFrame
+    """
+    responsivity = detector.responsivity(ref_df['Wavelength'].to_numpy(dtype=float)) # Look up responsivity, NaN outside the valid range of the detector
+    ref_df['Power'] = ref_df['Mean Current'].to_numpy(dtype=float) / responsivity # Create new column in reference file
+
+    return ref_df['Power']
+
+
+def unique_name(path, file_name):
+    """Function to find a file name that is not taken yet, appending _2, _3, ...
+    :param path: Folder
+    :type path: str, required
+    :param file_name: File name
+    :type file_name: str, required
+    ...
+    :return: File name
+    :rtype: str
+    """
+    name = file_name
+    num = 2
+    while os.path.exists(os.path.join(path, name)):
+        name = file_name + '_%d' % num
+        num += 1
+    return name
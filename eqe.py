@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Live EQE calculation from the latest reference diode measurements of an experiment
+"""
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+HC_E = 1239.84193   # Planck constant * speed of light / elementary charge [eV nm]
+
+
+def find_references(path, exclude=None, files=None):
+    """Function to find reference diode measurements, i.e. data files with a power column
+    :param path: Folder of the experiment
+    :type path: str, required
+    :param exclude: File to ignore, e.g. the file of the current measurement
+    :type exclude: str, optional
+    :param files: Candidate files, e.g. from the catalog, instead of all files in the folder
+    :type files: list of str, optional
+    ...
+    :return: List of (modification time, file path, wavelength array, power array), oldest first
+    :rtype: list of tuples
+    """
+    references = []
+    for file_path in glob.glob(os.path.join(path, '*')) if files is None else files:
+        if not os.path.isfile(file_path) or (exclude is not None and os.path.abspath(file_path) == os.path.abspath(exclude)):
+            continue
+        try:
+            with open(file_path) as f:
+                header = f.readline().strip().split(',')
+            if 'Power' not in header or 'Wavelength' not in header:
+                continue
+            ref_df = pd.read_csv(file_path, usecols=['Wavelength', 'Power'])
+        except (OSError, UnicodeDecodeError, ValueError, pd.errors.ParserError):
+            continue
+        ref_df = ref_df.dropna().sort_values('Wavelength')
+        if len(ref_df) < 2:
+            continue
+        references.append((os.path.getmtime(file_path), file_path,
+                           ref_df['Wavelength'].to_numpy(dtype=float), ref_df['Power'].to_numpy(dtype=float)))
+    references.sort(key=lambda reference: reference[0])
+    return references
+
+
+def combine_power(wavelengths, references):
+    """Function to interpolate the power of several references onto a wavelength grid
+    :param wavelengths: Wavelength grid of the sample measurement [nm]
+    :type wavelengths: array, required
+    :param references: List of (wavelength array, power array), oldest first
+    :type references: list of tuples, required
+    ...
+    :return: Power at each wavelength [W], NaN where no reference covers it, and a boolean list of the references used
+    :rtype: tuple of (array, list)
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    power = np.full(wavelengths.shape, np.nan)
+    used = []
+
+    # Newer references overwrite older ones where their wavelength ranges overlap, e.g. Si and InGaAs
+    for ref_wavelength, ref_power in references:
+        covered = (wavelengths >= ref_wavelength[0]) & (wavelengths <= ref_wavelength[-1])
+        if covered.any():
+            power[covered] = np.interp(wavelengths[covered], ref_wavelength, ref_power)
+        used.append(bool(covered.any()))
+
+    return power, used
+
+
+def reference_power(path, wavelengths, exclude=None, files=None):
+    """Function to interpolate the latest reference power onto a wavelength grid
+    :param path: Folder of the experiment
+    :type path: str, required
+    :param wavelengths: Wavelength grid of the sample measurement [nm]
+    :type wavelengths: array, required
+    :param exclude: File to ignore, e.g. the file of the current measurement
+    :type exclude: str, optional
+    :param files: Candidate files, e.g. from the catalog, instead of all files in the folder
+    :type files: list of str, optional
+    ...
+    :return: Power at each wavelength [W], NaN where no reference covers it, and the list of reference files used
+    :rtype: tuple of (array, list)
+    """
+    references = find_references(path, exclude, files)
+    power, used = combine_power(wavelengths, [(reference[2], reference[3]) for reference in references])
+    return power, [reference[1] for reference, is_used in zip(references, used) if is_used]
+
+
+def calculate_eqe(current, power, wavelength):
+    """Function to calculate the external quantum efficiency
+    :param current: Photocurrent [A]
+    :type current: float or array, required
+    :param power: Incident power [W]
+    :type power: float or array, required
+    :param wavelength: Wavelength [nm]
+    :type wavelength: float or array, required
+    ...
+    :return: EQE, i.e. collected electrons per incident photon
+    :rtype: float or array
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.asarray(current) / np.asarray(power) * HC_E / np.asarray(wavelength)
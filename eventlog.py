@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Structured event log of scan runs
+
+The drivers and the scan engine report instrument commands and responses, Lock-in polls, point
+results and step timings as events. While a scan runs, these events and all log messages of the
+scanning thread are written as JSON lines to a file per run in the _logs folder of the data folder,
+e.g. {"time": ..., "run": "20240101-120000_sample", "point": 12, "event": "command", "device": "mono",
+"command": "500.00 GOTO"}. Records are handed to a queue and written by a background thread, so
+logging never waits for the disk during a scan. The console handler of the GUI works the same way.
+
+Usage: python eventlog.py LOG_FOLDER_OR_FILE [--run RUN] [--point N] [--device DEVICE] [--event EVENT] [--level LEVEL]
+"""
+
+import argparse
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+import clocks
+
+LOG_FOLDER = '_logs'
+EVENTS = logging.getLogger('events')
+EVENTS.setLevel(logging.DEBUG)
+EVENTS.propagate = False # Events only go to the event log, not to the console
+
+_console = None
+
+
+def event(kind, device=None, **fields):
+    """Function to report an event to the running event log
+    :param kind: Event, e.g. 'command', 'response', 'poll', 'point' or 'timing'
+    :type kind: str, required
+    :param device: Instrument, e.g. 'mono', 'lockin' or 'wheel'
+    :type device: str, optional
+    :param fields: Values of the event, must be JSON serialisable
+    :type fields: keyword arguments, optional
+    ...
+    :return: None
+    """
+    if EVENTS.handlers: # Nothing to do without a running event log
+        EVENTS.info(kind, extra={'device': device, 'fields': fields})
+
+
+class JsonFormatter(logging.Formatter):
+    """Class to format events and log messages as JSON lines
+    """
+
+    def format(self, record):
+        entry = {'time': getattr(record, 'clock', record.created), 'run': getattr(record, 'run', None),
+                 'point': getattr(record, 'point', None)}
+        if record.name == EVENTS.name:
+            entry.update(event=record.getMessage(), device=record.device)
+            entry.update(record.fields)
+        else:
+            entry.update(event='log', level=record.levelname, logger=record.name, message=record.getMessage())
+        return json.dumps(entry, default=_plain)
+
+
+def _plain(value):
+    # numpy numbers and other objects json does not know
+    try:
+        return value.item()
+    except AttributeError:
+        return str(value)
+
+
+class EventLog(logging.Filter):
+    """Class of the event log of the runs of a scan engine
+    :param folder: Folder of the log files
+    :type folder: str, required
+    :param clock: Clock of the event times, the system clock by default
+    :type clock: SystemClock or VirtualClock, optional
+    """
+
+    def __init__(self, folder, clock=None):
+        logging.Filter.__init__(self)
+        self.folder = folder
+        self.clock = clock or clocks.SYSTEM_CLOCK
+        self.run = None
+        self.point = None
+        self.path = None
+        self.thread = None
+        self.queue = queue.Queue(-1)
+        self.handler = logging.handlers.QueueHandler(self.queue)
+        self.handler.addFilter(self)
+        self.listener = None
+        self.file = None
+
+    def filter(self, record):
+        # Only records of the scanning thread belong to the run, e.g. when several setups run in one process
+        if threading.get_ident() != self.thread:
+            return False
+        record.run = self.run
+        record.point = self.point
+        record.clock = self.clock.time()
+        return True
+
+    def start(self, name):
+        """Function to start the log file of a new run
+        :param name: Name of the run, e.g. the scan name
+        :type name: str, required
+        ...
+        :return: Run id
+        :rtype: str
+        """
+        if self.run is not None:
+            self.stop()
+        os.makedirs(self.folder, exist_ok=True)
+        self.run = '%s_%s' % (time.strftime('%Y%m%d-%H%M%S', time.localtime(self.clock.time())), name)
+        self.path = os.path.join(self.folder, self.run + '.jsonl')
+        self.point = None
+        self.thread = threading.get_ident()
+        self.file = logging.FileHandler(self.path, encoding='utf-8')
+        self.file.setFormatter(JsonFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, self.file)
+        self.listener.start()
+        logging.getLogger().addHandler(self.handler)
+        EVENTS.addHandler(self.handler)
+        return self.run
+
+    def stop(self):
+        """Function to finish the log file of the run, after the queued records are written
+        :return: None
+        """
+        if self.run is None:
+            return
+        logging.getLogger().removeHandler(self.handler)
+        EVENTS.removeHandler(self.handler)
+        self.listener.stop()
+        self.file.close()
+        self.listener = None
+        self.file = None
+        self.run = None
+        self.thread = None
+
+
+def setup_console(level=logging.DEBUG):
+    """Function to log to the console from a background thread, only set up once
+    :param level: Level of the root logger
+    :type level: int, optional
+    ...
+    :return: Root logger
+    :rtype: Logger
+    """
+    global _console
+    logger = logging.getLogger()
+    logger.setLevel(level)
+    if _console is None:
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(logging.Formatter(fmt='%(asctime)s %(levelname)s %(name)s: %(message)s',
+                                               datefmt='%Y-%m-%d - %H:%M:%S'))
+        records = queue.Queue(-1)
+        _console = logging.handlers.QueueListener(records, console)
+        _console.start()
+        logger.addHandler(logging.handlers.QueueHandler(records))
+    return logger
+
+
+def read(paths):
+    """Function to read the events of log files
+    :param paths: Log files or folders of log files
+    :type paths: list of str, required
+    ...
+    :return: Events
+    :rtype: generator of dict
+    """
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*.jsonl'))) if os.path.isdir(path) else [path]
+        for file_name in files:
+            with open(file_name, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def matches(entry, run=None, point=None, device=None, kind=None, level=None):
+    """Function to check an event against query conditions, None matches everything
+    :param entry: Event
+    :type entry: dict, required
+    :param run: Run id or the start of it
+    :type run: str, optional
+    :param point: Point number
+    :type point: int, optional
+    :param device: Instrument
+    :type device: str, optional
+    :param kind: Event, e.g. 'command' or 'log'
+    :type kind: str, optional
+    :param level: Lowest level of log messages, e.g. 'ERROR', other events are excluded
+    :type level: str, optional
+    ...
+    :return: True if the event matches
+    :rtype: bool
+    """
+    if run is not None and not (entry.get('run') or '').startswith(run):
+        return False
+    if point is not None and entry.get('point') != point:
+        return False
+    if device is not None and entry.get('device') != device:
+        return False
+    if kind is not None and entry.get('event') != kind:
+        return False
+    if level is not None and (entry.get('event') != 'log' or
+                              logging.getLevelName(entry['level']) < logging.getLevelName(level.upper())):
+        return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query the event logs of scan runs')
+    parser.add_argument('paths', nargs='+', help='Log files or logs folders')
+    parser.add_argument('--run', help='Run id or the start of it, e.g. the date')
+    parser.add_argument('--point', type=int, help='Point number within the run')
+    parser.add_argument('--device', help="Instrument, 'mono', 'lockin' or 'wheel'")
+    parser.add_argument('--event', help="Event, e.g. 'command', 'response', 'poll', 'point', 'timing' or 'log'")
+    parser.add_argument('--level', help='Only log messages of this level or above, e.g. ERROR')
+    parser.add_argument('--json', action='store_true', help='Print the events as JSON lines')
+    args = parser.parse_args(argv)
+
+    count = 0
+    for entry in read(args.paths):
+        if not matches(entry, args.run, args.point, args.device, args.event, args.level):
+            continue
+        count += 1
+        if args.json:
+            print(json.dumps(entry))
+            continue
+        fields = ' '.join('%s=%s' % (key, value) for key, value in entry.items()
+                          if key not in ('time', 'run', 'point', 'event', 'device') and value is not None)
+        print('%s %s %5s %-8s %-7s %s' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['time'])), entry['run'],
+                                         '' if entry['point'] is None else entry['point'], entry['event'],
+                                         entry.get('device') or '', fields))
+    if count == 0:
+        print('No matching events')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
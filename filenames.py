@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Data file names of scans, e.g. name_(350-1100nm_5nm_1000x)_2 or name_650Filter_(650-1400nm_10nm_10000x)
+"""
+
+import re
+
+PATTERN = re.compile(r'^(?P<name>.*?)(?:_(?P<filter>[^_()]+)Filter)?'
+                     r'_\((?P<start>\d+)-(?P<stop>\d+)nm_(?P<step>\d+)nm_(?P<amp>\d+)x\)'
+                     r'(?:_(?P<index>\d+))?$')
+
+
+def format_filename(name, start, stop, step, amp, filter_label=None):
+    """Function to compile the file name of a scan
+    :param name: File name entered in the GUI
+    :type name: str, required
+    :param start: Wavelength start value
+    :type start: float, required
+    :param stop: Wavelength stop value
+    :type stop: float, required
+    :param step: Wavelength step value
+    :type step: float, required
+    :param amp: Pre-amplifier amplification value
+    :type amp: float, required
+    :param filter_label: External filter of complete scans, e.g. 'no' or a cut-on wavelength
+    :type filter_label: str, optional
+    ...
+    :return: File name
+    :rtype: str
+    """
+    scan = '(' + str(int(start)) + '-' + str(int(stop)) + 'nm_' + str(int(step)) + 'nm_' + str(int(amp)) + 'x)'
+    if filter_label is None:
+        return name + '_' + scan
+    return name + '_' + filter_label + 'Filter' + '_' + scan
+
+
+def parse_filename(file_name):
+    """Function to parse the file name of a scan
+    :param file_name: File name without folder
+    :type file_name: str, required
+    ...
+    :return: Dictionary with 'name', 'filter' (None for single scans), 'start', 'stop', 'step', 'amp'
+             and 'index' (1 for the first file of that name), or None if the name does not match
+    :rtype: dict
+    """
+    match = PATTERN.match(file_name)
+    if match is None:
+        return None
+    return {'name': match.group('name'),
+            'filter': match.group('filter'),
+            'start': int(match.group('start')),
+            'stop': int(match.group('stop')),
+            'step': int(match.group('step')),
+            'amp': int(match.group('amp')),
+            'index': int(match.group('index') or 1)}
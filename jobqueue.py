@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent queue of scan jobs
+
+Each job is a recipe with one scan (see recipe.py), stored in a SQLite file so the queue survives a
+restart of the GUI or the command line. Jobs run back to back, and pending jobs can be reordered to
+minimise grating, filter wheel and gain changes between them, keeping the references of an
+experiment ahead of its samples.
+
+Usage: python jobqueue.py add RECIPE [--queue FILE]
+       python jobqueue.py list|optimise|run|clear [--queue FILE]
+       python jobqueue.py remove|up|down JOB_ID [--queue FILE]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+import metrics
+import recipe as recipes
+import scheduler
+import timing
+
+QUEUE_FILE = 'queue.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    position REAL NOT NULL,
+    name TEXT,
+    kind TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    recipe TEXT NOT NULL,
+    duration REAL,
+    added REAL,
+    started REAL,
+    finished REAL,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_position ON jobs (status, position);
+"""
+
+# Statuses of a job. Jobs that were running when the program stopped are set back to pending on the next start
+STATUSES = ('pending', 'running', 'done', 'stopped', 'failed')
+
+
+def job_kind(plan):
+    """Function to describe the kind of a scan
+    :param plan: Scan plan
+    :type plan: ScanPlan, required
+    ...
+    :return: Reference detector name, 'complete' or 'sample'
+    :rtype: str
+    """
+    if plan.detector is not None:
+        return plan.detector
+    return 'complete' if plan.complete else 'sample'
+
+
+def configuration(plan, end=False):
+    """Function to look up the instrument configuration at the start or end of a scan
+    :param plan: Scan plan
+    :type plan: ScanPlan, required
+    :param end: Configuration after the scan instead of before it
+    :type end: bool, optional
+    ...
+    :return: Dictionary of the 'grating', 'filter', 'wheel' and 'gain'
+    :rtype: dict
+    """
+    if end:
+        scan_range = plan.ranges[-1]
+        # The engine returns the monochromator filter and external filter wheel to position 1 after each scan
+        return {'grating': timing.position(plan.gratings, scan_range.stop), 'filter': 1,
+                'wheel': 1, 'gain': scan_range.amp}
+    scan_range = plan.ranges[0]
+    return {'grating': timing.position(plan.gratings, scan_range.start), 'filter': timing.position(plan.filters, scan_range.start),
+            'wheel': scan_range.external_filter if plan.complete else None, 'gain': scan_range.amp}
+
+
+def switch_cost(before, after, model=None):
+    """Function to estimate the time to change the instrument configuration between two jobs
+    :param before: Configuration at the end of the previous job, None if unknown
+    :type before: dict, required
+    :param after: Configuration at the start of the next job
+    :type after: dict, required
+    :param model: Timing model of the setup, the default timings if not given
+    :type model: TimingModel, optional
+    ...
+    :return: Switching time [s]
+    :rtype: float
+    """
+    return (model or timing.TimingModel()).switch(before, after)
+
+
+def optimise_order(plans, state=None, model=None):
+    """Function to order scans to minimise the configuration changes between them
+    :param plans: Scan plans in the current order
+    :type plans: list of ScanPlan, required
+    :param state: Current instrument configuration, None if unknown
+    :type state: dict, optional
+    :param model: Timing model of the setup, the default timings if not given
+    :type model: TimingModel, optional
+    ...
+    :return: Indices of the plans in the new order
+    :rtype: list of int
+    """
+    remaining = list(range(len(plans)))
+    order = []
+    while remaining:
+        # Samples stay behind the references of their experiment that were queued before them
+        available = []
+        for n, index in enumerate(remaining):
+            plan = plans[index]
+            blocked = plan.detector is None and any(plans[other].detector is not None and
+                                                    (plans[other].user, plans[other].experiment) == (plan.user, plan.experiment)
+                                                    for other in remaining[:n])
+            if not blocked:
+                available.append(index)
+        index = min(available, key=lambda index: (switch_cost(state, configuration(plans[index]), model), remaining.index(index)))
+        order.append(index)
+        remaining.remove(index)
+        state = configuration(plans[index], end=True)
+    return order
+
+
+class JobQueue(object):
+    """Class of the persistent scan queue
+    :param path: Queue file
+    :type path: str, optional
+    :param calibration_path: Calibration folder with the timing log of the setup
+    :type calibration_path: str, optional
+    """
+
+    def __init__(self, path=QUEUE_FILE, calibration_path='calibrations'):
+        self.path = path
+        self.calibration_path = calibration_path
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        self.timing = timing.load(calibration_path)
+        self.recover()
+        self.reestimate()
+
+    def close(self):
+        """Function to close the queue
+        :return: None
+        """
+        self.connection.close()
+
+    def recover(self):
+        """Function to return jobs interrupted by a restart to the front of the queue
+        :return: Number of recovered jobs
+        :rtype: int
+        """
+        with self.connection:
+            first = self.connection.execute('SELECT MIN(position) FROM jobs').fetchone()[0] or 0
+            count = self.connection.execute("UPDATE jobs SET status = 'pending', position = ? - 1, started = NULL, "
+                                            "message = 'Interrupted' WHERE status = 'running'", (first,)).rowcount
+        if count:
+            self.logger.info('Requeued %d Interrupted Jobs' % count)
+        return count
+
+    def add(self, recipe):
+        """Function to queue every scan of a recipe as a separate job
+        :param recipe: Recipe
+        :type recipe: dict, required
+        ...
+        :raises ValueError: Raises error if the recipe is invalid
+        ...
+        :return: Job ids
+        :rtype: list of int
+        """
+        errors = recipes.validate(recipe, recipe.get('calibration_path', 'calibrations') if isinstance(recipe, dict) else 'calibrations')
+        if errors:
+            raise ValueError('Invalid Recipe: %s' % '; '.join(errors))
+
+        ids = []
+        with self.connection:
+            last = self.connection.execute('SELECT MAX(position) FROM jobs').fetchone()[0] or 0
+            for scan in recipe['scans']:
+                job = dict(recipe, scans=[scan])
+                plan = recipes.build_plans(job)[0]
+                duration = self.estimate(job, plan)
+                last += 1
+                cursor = self.connection.execute('INSERT INTO jobs (position, name, kind, recipe, duration, added) '
+                                                 'VALUES (?, ?, ?, ?, ?, ?)',
+                                                 (last, plan.name, job_kind(plan), json.dumps(job), duration, time.time()))
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def estimate(self, recipe, plan):
+        """Function to estimate the duration of a job from the timing model
+        :param recipe: Recipe of the job
+        :type recipe: dict, required
+        :param plan: Scan plan of the job
+        :type plan: ScanPlan, required
+        ...
+        :return: Expected duration [s]
+        :rtype: float
+        """
+        settings = recipe.get('engine', {})
+        return recipes.estimate_duration([plan], settings.get('integration_tc', 5), settings.get('settle_accuracy', 0.99), self.timing)
+
+    def reestimate(self):
+        """Function to update the expected durations of the pending jobs with the latest timing model
+        :return: None
+        """
+        self.timing = timing.load(self.calibration_path)
+        with self.connection:
+            for job in self.jobs('pending'):
+                self.connection.execute('UPDATE jobs SET duration = ? WHERE id = ?',
+                                        (self.estimate(self.recipe(job), self.plan(job)), job['id']))
+
+    def jobs(self, status=None):
+        """Function to list the jobs in queue order
+        :param status: Only list jobs of this status
+        :type status: str, optional
+        ...
+        :return: Jobs
+        :rtype: list of sqlite3.Row
+        """
+        if status is None:
+            return self.connection.execute('SELECT * FROM jobs ORDER BY position').fetchall()
+        return self.connection.execute('SELECT * FROM jobs WHERE status = ? ORDER BY position', (status,)).fetchall()
+
+    def get(self, job_id):
+        """Function to look up a job
+        :param job_id: Job id
+        :type job_id: int, required
+        ...
+        :return: Job, or None if not queued
+        :rtype: sqlite3.Row
+        """
+        return self.connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+    def recipe(self, job):
+        """Function to read the recipe of a job
+        :param job: Job
+        :type job: sqlite3.Row, required
+        ...
+        :return: Recipe with one scan
+        :rtype: dict
+        """
+        return json.loads(job['recipe'])
+
+    def plan(self, job):
+        """Function to compile the scan plan of a job
+        :param job: Job
+        :type job: sqlite3.Row, required
+        ...
+        :return: Scan plan
+        :rtype: ScanPlan
+        """
+        return recipes.build_plans(self.recipe(job))[0]
+
+    def remove(self, job_id):
+        """Function to remove a job that is not running
+        :param job_id: Job id
+        :type job_id: int, required
+        ...
+        :return: True if the job was removed
+        :rtype: bool
+        """
+        with self.connection:
+            return self.connection.execute("DELETE FROM jobs WHERE id = ? AND status != 'running'", (job_id,)).rowcount > 0
+
+    def move(self, job_id, offset):
+        """Function to move a pending job up or down among the pending jobs
+        :param job_id: Job id
+        :type job_id: int, required
+        :param offset: Number of places to move, negative to move up
+        :type offset: int, required
+        ...
+        :return: None
+        """
+        pending = [job['id'] for job in self.jobs('pending')]
+        if job_id not in pending:
+            return
+        index = pending.index(job_id)
+        pending.insert(max(0, min(len(pending) - 1, index + offset)), pending.pop(index))
+        self._reposition(pending)
+
+    def _reposition(self, ids):
+        positions = sorted(job['position'] for job in self.jobs('pending'))
+        with self.connection:
+            for job_id, position in zip(ids, positions):
+                self.connection.execute('UPDATE jobs SET position = ? WHERE id = ?', (position, job_id))
+
+    def optimise(self, state=None):
+        """Function to reorder the pending jobs to minimise configuration changes
+        :param state: Current instrument configuration, None if unknown
+        :type state: dict, optional
+        ...
+        :return: Saved switching time [s]
+        :rtype: float
+        """
+        pending = self.jobs('pending')
+        plans = [self.plan(job) for job in pending]
+        before = self.switching_time(plans, state)
+        order = optimise_order(plans, state, self.timing)
+        self._reposition([pending[index]['id'] for index in order])
+        return before - self.switching_time([plans[index] for index in order], state)
+
+    def switching_time(self, plans, state=None):
+        """Function to estimate the time spent changing the configuration between scans
+        :param plans: Scan plans in order
+        :type plans: list of ScanPlan, required
+        :param state: Current instrument configuration, None if unknown
+        :type state: dict, optional
+        ...
+        :return: Switching time [s]
+        :rtype: float
+        """
+        total = 0.0
+        for plan in plans:
+            total += switch_cost(state, configuration(plan), self.timing)
+            state = configuration(plan, end=True)
+        return total
+
+    def remaining(self, state=None):
+        """Function to predict the time to finish all pending jobs
+        :param state: Current instrument configuration, None if unknown
+        :type state: dict, optional
+        ...
+        :return: Predicted duration [s]
+        :rtype: float
+        """
+        pending = self.jobs('pending')
+        return sum(job['duration'] for job in pending) + self.switching_time([self.plan(job) for job in pending], state)
+
+    def claim(self):
+        """Function to take the next pending job and mark it as running
+        :return: Job, or None if the queue is empty
+        :rtype: sqlite3.Row
+        """
+        with self.connection:
+            job = self.connection.execute("SELECT * FROM jobs WHERE status = 'pending' ORDER BY position LIMIT 1").fetchone()
+            if job is None:
+                return None
+            self.connection.execute("UPDATE jobs SET status = 'running', started = ?, message = NULL WHERE id = ?",
+                                    (time.time(), job['id']))
+        return self.get(job['id'])
+
+    def finish(self, job_id, status, message=None):
+        """Function to record the end of a job
+        :param job_id: Job id
+        :type job_id: int, required
+        :param status: 'done', 'stopped' or 'failed'
+        :type status: str, required
+        :param message: Error or note
+        :type message: str, optional
+        ...
+        :return: None
+        """
+        with self.connection:
+            self.connection.execute('UPDATE jobs SET status = ?, finished = ?, message = ? WHERE id = ?',
+                                    (status, time.time(), message, job_id))
+
+    def release(self, job_id):
+        """Function to return a claimed job that did not start to the queue
+        :param job_id: Job id
+        :type job_id: int, required
+        ...
+        :return: None
+        """
+        with self.connection:
+            self.connection.execute("UPDATE jobs SET status = 'pending', started = NULL WHERE id = ? AND status = 'running'",
+                                    (job_id,))
+
+    def retry(self, job_id):
+        """Function to queue a stopped or failed job again at the front
+        :param job_id: Job id
+        :type job_id: int, required
+        ...
+        :return: None
+        """
+        with self.connection:
+            first = self.connection.execute('SELECT MIN(position) FROM jobs').fetchone()[0] or 0
+            self.connection.execute("UPDATE jobs SET status = 'pending', position = ?, started = NULL, finished = NULL "
+                                    "WHERE id = ? AND status IN ('stopped', 'failed')", (first - 1, job_id))
+
+    def clear(self, statuses=('done', 'stopped', 'failed')):
+        """Function to remove finished jobs
+        :param statuses: Statuses of the removed jobs
+        :type statuses: tuple of str, optional
+        ...
+        :return: Number of removed jobs
+        :rtype: int
+        """
+        with self.connection:
+            return self.connection.execute('DELETE FROM jobs WHERE status IN (%s)' % ', '.join('?' * len(statuses)),
+                                           statuses).rowcount
+
+
+def run_queue(queue, scan, job_callback=None, save_path=None):
+    """Function to run the pending jobs back to back until the queue is empty or the scan is stopped
+    :param queue: Job queue
+    :type queue: JobQueue, required
+    :param scan: Scan engine with connected instruments
+    :type scan: ScanEngine, required
+    :param job_callback: Called with the job id whenever a job starts or ends
+    :type job_callback: function, optional
+    :param save_path: Data folder of all jobs instead of the folders of their recipes, e.g. the folder of one of several setups
+    :type save_path: str, optional
+    ...
+    :return: Number of finished jobs
+    :rtype: int
+    """
+    logger = logging.getLogger(__name__)
+    count = 0
+    queue.reestimate()
+    scan.measuring = True # Cleared by the stop button, also between jobs
+    while scan.measuring:
+        job = queue.claim()
+        if job is None:
+            break
+        if job_callback is not None:
+            job_callback(job['id'])
+        if not scan.measuring:
+            queue.release(job['id'])
+            break
+        logger.info('Starting Job %d: %s' % (job['id'], job['name']))
+
+        recipe = queue.recipe(job)
+        job_path = save_path or recipe.get('save_path', scan.save_path)
+        if job_path != scan.save_path:
+            scan.save_path = job_path
+            scan.catalog = None # Each data folder has its own catalog
+
+        # Continue the job from its checkpoint if it was interrupted, e.g. by a crash
+        state = scan.loadCheckpoint()
+        if state is not None and (state.get('context') or {}).get('job') != job['id']:
+            state = None
+        scan.context = {'job': job['id']}
+
+        # Engine settings of the job's recipe, e.g. the averaging or time budget, only apply to this job
+        settings = recipe.get('engine', {})
+        defaults = {key: getattr(scan, key) for key in settings}
+        for key, value in settings.items():
+            setattr(scan, key, value)
+
+        try:
+            if state is not None:
+                logger.info('Resuming Job %d' % job['id'])
+            scan.run(recipes.build_plans(recipe)[0], resume=state)
+        except Exception as ex:
+            logger.error('Job %d Failed: %s' % (job['id'], ex))
+            queue.finish(job['id'], 'failed', str(ex))
+            scan.measuring = False
+        else:
+            queue.finish(job['id'], 'done' if scan.measuring else 'stopped')
+            count += 1
+        finally:
+            for key, value in defaults.items():
+                setattr(scan, key, value)
+        if job_callback is not None:
+            job_callback(job['id'])
+
+    if not scan.measuring:
+        logger.info('Queue Stopped')
+    scan.measuring = False
+    scan.context = None
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Persistent queue of sEQE scan jobs')
+    parser.add_argument('command', choices=['add', 'list', 'remove', 'up', 'down', 'retry', 'optimise', 'run', 'clear'])
+    parser.add_argument('argument', nargs='?', help='Recipe file for add, job id for remove, up, down and retry')
+    parser.add_argument('--queue', default=QUEUE_FILE, help='Queue file')
+    parser.add_argument('--metrics-port', type=int, help='Serve live metrics of the running jobs on this port of localhost')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+                        datefmt='%Y-%m-%d - %H:%M:%S')
+    logger = logging.getLogger(__name__)
+    queue = JobQueue(args.queue)
+
+    if args.command == 'add':
+        try:
+            ids = queue.add(recipes.load(args.argument))
+        except (OSError, TypeError, ValueError) as ex:
+            logger.error('Jobs Not Queued: %s' % ex)
+            return 1
+        logger.info('Queued Jobs %s' % ', '.join(str(job_id) for job_id in ids))
+
+    elif args.command in ('remove', 'up', 'down', 'retry'):
+        if args.argument is None or not args.argument.isdigit():
+            logger.error('Job id required')
+            return 1
+        job_id = int(args.argument)
+        if args.command == 'remove':
+            queue.remove(job_id)
+        elif args.command == 'retry':
+            queue.retry(job_id)
+        else:
+            queue.move(job_id, -1 if args.command == 'up' else 1)
+
+    elif args.command == 'optimise':
+        saved = queue.optimise()
+        logger.info('Reordered Pending Jobs, Saving %s' % scheduler.format_duration(saved))
+
+    elif args.command == 'clear':
+        logger.info('Removed %d Finished Jobs' % queue.clear())
+
+    elif args.command == 'run':
+        pending = queue.jobs('pending')
+        if not pending:
+            logger.info('Queue Empty')
+            return 0
+        logger.info('Running %d Jobs, Predicted Duration %s' % (len(pending), scheduler.format_duration(queue.remaining())))
+        scan = recipes.create_engine(dict(queue.recipe(pending[0]), engine={})) # Connections of the first job, each job applies its own engine settings
+        for instrument in (scan.lockin, scan.mono, scan.wheel):
+            instrument.connect()
+        if not scan.connected():
+            logger.error('Instruments Not Connected')
+            return 1
+        if args.metrics_port is not None:
+            metrics.serve(scan, port=args.metrics_port)
+        run_queue(queue, scan)
+
+    if args.command != 'run':
+        for job in queue.jobs():
+            print('%4d  %-8s %-10s %s  %s%s' % (job['id'], job['status'], job['kind'], scheduler.format_duration(job['duration']),
+                                                job['name'], '  (%s)' % job['message'] if job['message'] else ''))
+        print('Remaining: %s' % scheduler.format_duration(queue.remaining()))
+    queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Live measurement plot embedded in the main window
+
+Measured points are appended through a Qt signal and only stored. A timer repaints the canvas at a
+fixed rate: the finished ranges and axes are cached as a background image and only the lines of the
+current range are redrawn on top of it (blitting). A full redraw only happens when the data leaves
+the axis limits, which are then expanded with a margin so that this stays rare. Each line is
+min/max decimated to about twice the canvas width in pixels, so redraws take the same time however
+long the scan gets.
+"""
+
+import numpy as np
+from matplotlib import style
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
+from matplotlib.figure import Figure
+from PyQt5 import QtCore, QtWidgets
+
+import decimation
+
+PANELS = (('R', 'R component (V)', 'linear'),
+          ('Log R', 'Log(R)', 'linear'),
+          ('Phase', 'Phase', 'linear'),
+          ('EQE', 'EQE', 'log'))
+
+MARGIN = 0.1   # Fraction of the data range added when axis limits are expanded
+
+
+class LivePlot(QtWidgets.QWidget):
+    """Class of the live plot widget
+    :param parent: Parent widget
+    :type parent: QWidget, optional
+    :param rate: Repaint rate [Hz]
+    :type rate: float, optional
+    """
+
+    def __init__(self, parent=None, rate=10):
+        QtWidgets.QWidget.__init__(self, parent)
+
+        self.figure = Figure(facecolor='white', edgecolor='white')
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(NavigationToolbar2QT(self.canvas, self))
+        layout.addWidget(self.canvas)
+
+        self.axes = []
+        self.lines = []
+        self.data = {}
+        self.eqe = None
+        self.background = None
+        self.changed = False
+        self.scaled = set()   # Panels with axis limits taken from the data
+        self.overlays = []
+        self.overlay_lines = []
+
+        self.canvas.mpl_connect('draw_event', self.cacheBackground)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(int(1000/rate))
+
+    def clear(self):
+        """Function to remove all ranges, e.g. when a new sample is measured
+        :return: None
+        """
+        self.eqe = None
+
+    def start(self, eqe=False, xlim=None):
+        """Function to start the lines of a new range
+        :param eqe: Show the panel of the live EQE
+        :type eqe: bool, optional
+        :param xlim: Wavelength range of the scan
+        :type xlim: tuple, optional
+        ...
+        :return: None
+        """
+        if self.eqe != eqe:
+            self.setUpAxes(eqe)
+
+        # Lines of the previous range become part of the cached background
+        for line in self.lines:
+            line.set_animated(False)
+
+        width = max(self.canvas.width(), 200)
+        self.data = {name: decimation.MinMaxDecimator(width) for name, label, scale in PANELS[:len(self.axes)]}
+        self.lines = []
+        for ax in self.axes:
+            line, = ax.plot([], [], color='#000000', animated=True)
+            self.lines.append(line)
+
+        if xlim is not None:
+            for ax in self.axes:
+                left, right = ax.get_xlim() if len(ax.lines) > 1 else xlim
+                ax.set_xlim(min(left, xlim[0]), max(right, xlim[1]))
+        self.canvas.draw_idle()
+
+    def setUpAxes(self, eqe):
+        """Function to set up the panels
+        :param eqe: Add a panel for the live EQE
+        :type eqe: bool, required
+        ...
+        :return: None
+        """
+        self.figure.clear()
+        self.eqe = eqe
+        panels = PANELS if eqe else PANELS[:3]
+        self.axes = []
+        for index, (name, label, scale) in enumerate(panels):
+            with style.context('ggplot'):
+                ax = self.figure.add_subplot(len(panels), 1, index+1)
+            ax.set_ylabel(label, fontsize=12, fontweight='medium')
+            ax.set_yscale(scale)
+            ax.grid(True)
+            ax.minorticks_on()
+            ax.tick_params(labelsize=10, direction='in', axis='both', which='major', length=8, width=2)
+            ax.tick_params(labelsize=10, direction='in', axis='both', which='minor', length=4, width=2)
+            self.axes.append(ax)
+        self.axes[0].set_title('Demodulator data', fontsize=12, fontweight='medium')
+        self.axes[-1].set_xlabel('Wavelength [nm]', fontsize=12, fontweight='medium')
+        self.figure.tight_layout()
+        self.lines = []
+        self.background = None
+        self.scaled = set()
+        self.overlay_lines = []
+        self.drawOverlays()
+
+    @QtCore.pyqtSlot(list)
+    def setOverlays(self, overlays):
+        """Function to show previous scans as reference traces
+        :param overlays: List of (label, dictionary with 'Wavelength' and panel name arrays)
+        :type overlays: list, required
+        ...
+        :return: None
+        """
+        self.overlays = overlays
+        self.drawOverlays()
+        self.canvas.draw_idle()
+
+    def drawOverlays(self):
+        """Function to draw the overlays on the R, log R and phase panels, decimated to the canvas width
+        :return: None
+        """
+        for line in self.overlay_lines:
+            line.remove()
+        self.overlay_lines = []
+        width = max(self.canvas.width(), 200)
+        for index, (label, scan) in enumerate(self.overlays):
+            for ax, (name, ylabel, scale) in zip(self.axes[:3], PANELS):
+                x, y = decimation.decimate(scan['Wavelength'], scan[name], width)
+                line, = ax.plot(x, y, color='C%d' % (index % 10), alpha=0.6, linewidth=1, label=label)
+                self.overlay_lines.append(line)
+        if len(self.axes) > 0:
+            legend = self.axes[0].get_legend()
+            if len(self.overlays) > 0:
+                self.axes[0].legend(handles=self.overlay_lines[::3], fontsize=8, loc='best')
+            elif legend is not None:
+                legend.remove()
+
+    @QtCore.pyqtSlot(dict)
+    def addPoint(self, point):
+        """Function to store a measured point until the next repaint
+        :param point: Dictionary with 'Wavelength' and any of the panel names
+        :type point: dict, required
+        ...
+        :return: None
+        """
+        for name, series in self.data.items():
+            value = point.get(name)
+            if value is not None and np.isfinite(value):
+                series.append(point['Wavelength'], value)
+                self.changed = True
+
+    def cacheBackground(self, event):
+        """Function to cache the background after a full redraw and draw the current lines on top
+        :return: None
+        """
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        for ax, line in zip(self.axes, self.lines):
+            ax.draw_artist(line)
+
+    def refresh(self):
+        """Function to repaint the canvas if new points arrived, called by the timer
+        :return: None
+        """
+        if not self.changed or not self.isVisible():
+            return
+        self.changed = False
+
+        rescale = False
+        for ax, line, series in zip(self.axes, self.lines, self.data.values()):
+            line.set_data(*series.data())
+            if len(series) > 0:
+                rescale |= self.expandLimits(ax, series)
+
+        if rescale or self.background is None:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            for ax, line in zip(self.axes, self.lines):
+                ax.draw_artist(line)
+            self.canvas.blit(self.figure.bbox)
+
+    def expandLimits(self, ax, series):
+        """Function to expand the axis limits if the data does not fit
+        :param ax: Panel
+        :type ax: Axes, required
+        :param series: Data of the current range
+        :type series: MinMaxDecimator, required
+        ...
+        :return: True if the limits changed
+        :rtype: bool
+        """
+        changed = False
+        xmin, xmax = series.xmin, series.xmax
+        left, right = ax.get_xlim()
+        if xmin < left or xmax > right:
+            ax.set_xlim(min(xmin, left), max(xmax, right))
+            changed = True
+
+        ymin, ymax = series.ymin, series.ymax
+        bottom, top = ax.get_ylim()
+        first = ax not in self.scaled
+        if first:
+            self.scaled.add(ax)
+            bottom, top = ymin, ymax   # First point of the panel replaces the default limits
+        if first or ymin < bottom or ymax > top:
+            low, high = min(ymin, bottom), max(ymax, top)
+            if ax.get_yscale() == 'log':
+                low, high = low/(1+MARGIN) if low > 0 else ymin, high*(1+MARGIN)
+            else:
+                margin = MARGIN*(high-low) or MARGIN*abs(high) or 1
+                low, high = low - margin, high + margin
+            ax.set_ylim(low, high)
+            changed = True
+        return changed
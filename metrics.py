@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Live metrics of running scans, served over HTTP on localhost
+
+The scan engine updates a ScanMetrics object after every point: the scan, point, wavelength and
+expected end, latency histograms of the motion, poll and processing phases, counts of polls with
+sample loss and failed serial responses, and the last points of R. There is one writer and the
+server never blocks it, like the ring buffer of the scope: the engine only assigns numbers and
+fills preallocated arrays between advancing a counter of the points it is writing and one of the
+written points, and readers take copies and drop the points overwritten meanwhile.
+
+A small asyncio server on its own thread answers GET requests for all setups of the process:
+/status (JSON of every setup), /status/NAME (one setup) and /metrics (Prometheus text format),
+e.g. curl http://localhost:8765/status
+"""
+
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+PHASES = ('motion', 'poll', 'processing', 'point')
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, math.inf) # Upper bounds of the latency histograms [s]
+PORT = 8765
+
+
+class ScanMetrics(object):
+    """Class of the live metrics of one setup
+    :param name: Name of the setup
+    :type name: str, required
+    :param history: Number of points of R kept
+    :type history: int, optional
+    """
+
+    def __init__(self, name, history=200):
+        self.name = name
+        self.state = 'idle'
+        self.scan = None
+        self.run = None
+        self.started = None
+        self.finished = None
+        self.point = 0
+        self.wavelength = None
+        self.range_index = None
+        self.ranges = None
+        self.eta = None # Expected end [s since epoch]
+        self.remaining = None # Expected remaining time when the ETA was updated [s]
+        self.updated = None
+        self.dataloss = 0
+        self.serial_failures = 0
+
+        self.counts = np.zeros((len(PHASES), len(BUCKETS)), dtype=np.int64)
+        self.sums = np.zeros(len(PHASES))
+        self.history = np.zeros((int(history), 3)) # Time, wavelength and R of the last points
+        self.writing = 0 # Advanced before a point is filled in
+        self.written = 0 # Advanced after a point is filled in
+
+    def start(self, scan, run=None, ranges=None, when=None):
+        """Function to reset the progress when a scan starts
+        :param scan: Scan name
+        :type scan: str, required
+        :param run: Run id of the event log
+        :type run: str, optional
+        :param ranges: Number of ranges
+        :type ranges: int, optional
+        :param when: Start time [s since epoch]
+        :type when: float, optional
+        ...
+        :return: None
+        """
+        self.scan = scan
+        self.run = run
+        self.ranges = ranges
+        self.range_index = 0
+        self.point = 0
+        self.wavelength = None
+        self.eta = None
+        self.remaining = None
+        self.finished = None
+        self.started = time.time() if when is None else when
+        self.updated = self.started
+        self.state = 'measuring'
+
+    def finish(self, stopped=False, when=None):
+        """Function to mark the end of a scan
+        :param stopped: True if the scan was stopped before the end
+        :type stopped: bool, optional
+        :param when: End time [s since epoch]
+        :type when: float, optional
+        ...
+        :return: None
+        """
+        self.finished = time.time() if when is None else when
+        self.updated = self.finished
+        self.remaining = None
+        self.state = 'stopped' if stopped else 'idle'
+
+    def phase(self, name, seconds):
+        """Function to add a phase duration to its latency histogram
+        :param name: One of PHASES
+        :type name: str, required
+        :param seconds: Duration [s]
+        :type seconds: float, required
+        ...
+        :return: None
+        """
+        row = PHASES.index(name)
+        self.counts[row, np.searchsorted(BUCKETS, seconds)] += 1
+        self.sums[row] += seconds
+
+    def record(self, wavelength, r, when):
+        """Function to add a measured point
+        :param wavelength: Wavelength [nm]
+        :type wavelength: float, required
+        :param r: Mean R [V]
+        :type r: float, required
+        :param when: Time [s since epoch]
+        :type when: float, required
+        ...
+        :return: None
+        """
+        self.writing += 1 # Readers treat the row as overwritten from here on
+        self.history[self.written % len(self.history)] = (when, wavelength, r)
+        self.written = self.writing
+        self.point += 1
+        self.wavelength = wavelength
+        self.updated = when
+
+    def points(self):
+        """Function to copy the last points of R
+        :return: Time, wavelength and R of the last points, oldest first
+        :rtype: array
+        """
+        written = self.written
+        count = min(written, len(self.history))
+        block = self.history[np.arange(written - count, written) % len(self.history)]
+        # Points the writer overwrote or was overwriting while they were copied are dropped
+        return block[self.writing - written:]
+
+    def snapshot(self):
+        """Function to copy the metrics
+        :return: JSON serialisable metrics
+        :rtype: dict
+        """
+        counts = self.counts.copy()
+        sums = self.sums.copy()
+        return {'name': self.name, 'state': self.state, 'scan': self.scan, 'run': self.run, 'started': self.started,
+                'finished': self.finished, 'updated': self.updated, 'point': self.point, 'wavelength': self.wavelength,
+                'range': self.range_index, 'ranges': self.ranges, 'eta': self.eta,
+                'remaining': self.remaining,
+                'dataloss': self.dataloss, 'serial_failures': self.serial_failures,
+                'phases': {name: {'buckets': [[bound if math.isfinite(bound) else 'inf', int(count)]
+                                              for bound, count in zip(BUCKETS, counts[row])],
+                                  'count': int(counts[row].sum()), 'sum': float(sums[row])}
+                           for row, name in enumerate(PHASES)},
+                'last_points': [{'time': when, 'wavelength': wavelength, 'r': r} for when, wavelength, r in self.points()]}
+
+
+def prometheus(snapshots):
+    """Function to format snapshots in the Prometheus text format
+    :param snapshots: Snapshots of the setups
+    :type snapshots: list of dict, required
+    ...
+    :return: Metrics text
+    :rtype: str
+    """
+    lines = []
+    gauges = (('seqe_point', 'point', 'Points measured in the current scan'),
+              ('seqe_wavelength_nm', 'wavelength', 'Current wavelength'),
+              ('seqe_remaining_seconds', 'remaining', 'Expected remaining time of the current scan'),
+              ('seqe_dataloss_total', 'dataloss', 'Lock-in polls with sample loss'),
+              ('seqe_serial_failures_total', 'serial_failures', 'Serial commands without a valid response'))
+    for metric, key, description in gauges:
+        lines += ['# HELP %s %s' % (metric, description), '# TYPE %s %s' % (metric, 'counter' if metric.endswith('_total') else 'gauge')]
+        for snapshot in snapshots:
+            if snapshot[key] is not None:
+                lines.append('%s{setup="%s"} %s' % (metric, snapshot['name'], snapshot[key]))
+
+    lines += ['# HELP seqe_phase_seconds Duration of the phases of a point', '# TYPE seqe_phase_seconds histogram']
+    for snapshot in snapshots:
+        for name, phase in snapshot['phases'].items():
+            labels = 'setup="%s",phase="%s"' % (snapshot['name'], name)
+            total = 0
+            for bound, count in phase['buckets']:
+                total += count
+                lines.append('seqe_phase_seconds_bucket{%s,le="%s"} %d' % (labels, '+Inf' if bound == 'inf' else bound, total))
+            lines.append('seqe_phase_seconds_sum{%s} %s' % (labels, phase['sum']))
+            lines.append('seqe_phase_seconds_count{%s} %d' % (labels, phase['count']))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer(object):
+    """Class of the HTTP server of the metrics of all setups, running an asyncio loop on a background thread
+    :param setups: Dictionary of setup name and metrics, new setups can be added while the server runs
+    :type setups: dict, optional
+    :param host: Address to listen on, only local connections by default
+    :type host: str, optional
+    :param port: Port, 0 for any free port
+    :type port: int, optional
+    """
+
+    def __init__(self, setups=None, host='127.0.0.1', port=PORT):
+        self.setups = {} if setups is None else setups
+        self.host = host
+        self.port = port
+        self.logger = logging.getLogger(__name__)
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    def add(self, metrics):
+        """Function to serve the metrics of a setup
+        :param metrics: Metrics of the setup
+        :type metrics: ScanMetrics, required
+        ...
+        :return: None
+        """
+        self.setups[metrics.name] = metrics
+
+    def start(self):
+        """Function to start the server thread
+        :return: True if the server is listening
+        :rtype: bool
+        """
+        ready = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.serve, args=(ready,), name='metrics', daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self.server is not None
+
+    def serve(self, ready):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+        except OSError as ex:
+            self.logger.error('Metrics Server Not Started: %s' % ex)
+            ready.set()
+            self.loop.close()
+            return
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.logger.info('Serving Metrics on http://%s:%d/status' % (self.host, self.port))
+        ready.set()
+        self.loop.run_forever()
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    def stop(self):
+        """Function to stop the server thread
+        :return: None
+        """
+        if self.server is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def respond(self, path):
+        """Function to answer a request
+        :param path: Requested path
+        :type path: str, required
+        ...
+        :return: HTTP status, content type and body
+        :rtype: tuple
+        """
+        path = path.split('?')[0].rstrip('/') or '/status'
+        if path == '/status':
+            return '200 OK', 'application/json', json.dumps({name: metrics.snapshot() for name, metrics in list(self.setups.items())})
+        if path.startswith('/status/'):
+            metrics = self.setups.get(path[len('/status/'):])
+            if metrics is not None:
+                return '200 OK', 'application/json', json.dumps(metrics.snapshot())
+        if path == '/metrics':
+            return '200 OK', 'text/plain; version=0.0.4', prometheus([metrics.snapshot() for metrics in list(self.setups.values())])
+        return '404 Not Found', 'text/plain', 'Not found\n'
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''): # Skip the headers
+                pass
+            if len(request) < 2 or request[0] != 'GET':
+                status, content_type, body = '405 Method Not Allowed', 'text/plain', 'Only GET is supported\n'
+            else:
+                status, content_type, body = self.respond(request[1])
+            body = body.encode()
+            writer.write(('HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n\r\n'
+                          % (status, content_type, len(body))).encode() + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def serve(scan, name='sEQE', port=PORT, host='127.0.0.1'):
+    """Function to attach live metrics to a scan engine and serve them
+    :param scan: Scan engine
+    :type scan: ScanEngine, required
+    :param name: Name of the setup
+    :type name: str, optional
+    :param port: Port, 0 for any free port
+    :type port: int, optional
+    :param host: Address to listen on
+    :type host: str, optional
+    ...
+    :return: Running server, or None if it could not be started
+    :rtype: MetricsServer
+    """
+    scan.metrics = ScanMetrics(name)
+    server = MetricsServer(host=host, port=port)
+    server.add(scan.metrics)
+    return server if server.start() else None
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Overlay of previous scans on the live plot
+
+The overlay panel lists the scans of the current experiment, from the catalog when there is one. Checked
+scans are loaded on a background thread into an LRU cache of NumPy arrays with a memory cap, so
+switching between overlays is instant after the first load and never waits for the disk.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from PyQt5 import QtCore, QtWidgets
+
+import filenames
+
+COLUMNS = ('Wavelength', 'Mean R', 'Mean Phase')
+
+
+def load_scan(path):
+    """Function to load the plotted columns of a scan
+    :param path: Data file
+    :type path: str, required
+    ...
+    :return: Dictionary with the arrays 'Wavelength', 'R', 'Log R' and 'Phase'
+    :rtype: dict
+    """
+    scan_df = pd.read_csv(path, usecols=lambda column: column in COLUMNS).dropna().sort_values('Wavelength')
+    r = scan_df['Mean R'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_r = np.log(r)
+    return {'Wavelength': scan_df['Wavelength'].to_numpy(dtype=float),
+            'R': r,
+            'Log R': log_r,
+            'Phase': scan_df['Mean Phase'].to_numpy(dtype=float)}
+
+
+class ScanCache(object):
+    """Class of the LRU cache of loaded scans
+    :param max_bytes: Memory cap of the cached arrays
+    :type max_bytes: int, optional
+    """
+
+    def __init__(self, max_bytes=200*2**20):
+        self.max_bytes = max_bytes
+        self.scans = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, path):
+        with self.lock:
+            return path in self.scans
+
+    def get(self, path):
+        """Function to look up a cached scan and mark it as recently used
+        :param path: Data file
+        :type path: str, required
+        ...
+        :return: Arrays of the scan, or None if not cached
+        :rtype: dict
+        """
+        with self.lock:
+            scan = self.scans.get(path)
+            if scan is not None:
+                self.scans.move_to_end(path)
+            return scan
+
+    def put(self, path, scan):
+        """Function to cache a scan, evicting the least recently used scans above the memory cap
+        :param path: Data file
+        :type path: str, required
+        :param scan: Arrays of the scan
+        :type scan: dict, required
+        ...
+        :return: None
+        """
+        nbytes = sum(values.nbytes for values in scan.values())
+        with self.lock:
+            if path in self.scans:
+                self.size -= sum(values.nbytes for values in self.scans.pop(path).values())
+            self.scans[path] = scan
+            self.size += nbytes
+            while self.size > self.max_bytes and len(self.scans) > 1:
+                old_path, old_scan = self.scans.popitem(last=False)
+                self.size -= sum(values.nbytes for values in old_scan.values())
+
+
+class OverlayPanel(QtWidgets.QWidget):
+    """Class of the overlay panel next to the live plot
+    :param cache: Cache of loaded scans
+    :type cache: ScanCache, required
+    :param parent: Parent widget
+    :type parent: QWidget, optional
+    """
+
+    overlaysChanged = QtCore.pyqtSignal(list)   # List of (label, arrays) of the checked scans
+    scanLoaded = QtCore.pyqtSignal(str, object)
+
+    def __init__(self, cache, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.logger = logging.getLogger(__name__)
+        self.cache = cache
+        self.folder = None
+        self.catalog = None
+        self.pending = set()
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+        self.list = QtWidgets.QListWidget()
+        self.list.itemChanged.connect(self.updateOverlays)
+        refresh = QtWidgets.QPushButton('Refresh')
+        refresh.clicked.connect(lambda: self.listScans(self.folder, self.catalog))
+        browse = QtWidgets.QPushButton('Folder...')
+        browse.clicked.connect(self.chooseFolder)
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(refresh)
+        buttons.addWidget(browse)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(QtWidgets.QLabel('Overlay Scans'))
+        layout.addWidget(self.list)
+        layout.addLayout(buttons)
+
+        self.scanLoaded.connect(self.handleLoaded)
+
+    def chooseFolder(self):
+        """Function to list the scans of a folder chosen in a dialog
+        :return: None
+        """
+        folder = QtWidgets.QFileDialog.getExistingDirectory(self, 'Overlay Scans', self.folder or '')
+        if folder:
+            self.listScans(folder)
+
+    def listScans(self, folder, catalog=None):
+        """Function to list the scans of an experiment folder
+        :param folder: Experiment folder
+        :type folder: str, required
+        :param catalog: Catalog of the data folder, to list the scans without a directory scan
+        :type catalog: Catalog, optional
+        ...
+        :return: None
+        """
+        if folder is None:
+            return
+        self.folder = folder
+        self.catalog = catalog
+        checked = set(self.checkedPaths())
+
+        parts = os.path.relpath(folder, catalog.root).split(os.sep) if catalog is not None else []
+        if len(parts) == 2 and '..' not in parts:
+            paths = [catalog.full_path(scan) for scan in catalog.find(order='finished', user=parts[0], experiment=parts[1])
+                     if scan['finished'] is not None]
+        else:
+            paths = sorted((os.path.join(folder, file_name) for file_name in os.listdir(folder)
+                            if filenames.parse_filename(file_name) is not None), key=os.path.getmtime)
+
+        self.list.blockSignals(True)
+        self.list.clear()
+        for path in reversed(paths):   # Newest first
+            item = QtWidgets.QListWidgetItem(os.path.basename(path))
+            item.setData(QtCore.Qt.UserRole, path)
+            item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+            item.setCheckState(QtCore.Qt.Checked if path in checked else QtCore.Qt.Unchecked)
+            self.list.addItem(item)
+        self.list.blockSignals(False)
+        self.updateOverlays()
+
+    def checkedPaths(self):
+        """Function to get the checked scans
+        :return: Data files
+        :rtype: list of str
+        """
+        return [self.list.item(index).data(QtCore.Qt.UserRole) for index in range(self.list.count())
+                if self.list.item(index).checkState() == QtCore.Qt.Checked]
+
+    def updateOverlays(self, item=None):
+        """Function to emit the checked scans that are cached and load the others in the background
+        :return: None
+        """
+        overlays = []
+        for path in self.checkedPaths():
+            scan = self.cache.get(path)
+            if scan is not None:
+                overlays.append((os.path.basename(path), scan))
+            elif path not in self.pending:
+                self.pending.add(path)
+                self.pool.submit(self.load, path)
+        self.overlaysChanged.emit(overlays)
+
+    def load(self, path):
+        """Function to load a scan on the background thread
+        :param path: Data file
+        :type path: str, required
+        ...
+        :return: None
+        """
+        try:
+            scan = load_scan(path)
+        except (OSError, ValueError, KeyError, pd.errors.ParserError) as err:
+            self.logger.error('Overlay Not Loaded: %s' % err)
+            scan = None
+        self.scanLoaded.emit(path, scan)   # Queued to the GUI thread
+
+    def handleLoaded(self, path, scan):
+        """Function to cache a scan loaded in the background and update the overlays
+        :return: None
+        """
+        self.pending.discard(path)
+        if scan is not None:
+            self.cache.put(path, scan)
+            self.updateOverlays()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase-referenced detection of weak lock-in signals
+
+R = sqrt(X^2 + Y^2) is always positive, so close to the noise floor the noise adds a positive
+bias to the mean of R. Projecting X and Y onto the known signal phase gives an unbiased
+estimate instead. The signal phase is learned from strong points and tracked slowly, so
+that it follows phase changes introduced by grating and filter changes.
+"""
+
+import numpy as np
+
+
+class PhaseTracker(object):
+    """Class to track the signal phase on strong points and project weak points onto it
+    :param snr_threshold: Minimum signal-to-noise ratio of a point to update the reference phase
+    :type snr_threshold: float, optional
+    :param smoothing: Weight of a new strong point in the reference phase, between 0 and 1
+    :type smoothing: float, optional
+    """
+
+    def __init__(self, snr_threshold=20, smoothing=0.2):
+        self.snr_threshold = snr_threshold
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        """Function to forget the reference phase
+        :return: None
+        """
+        self._vector = None
+
+    @property
+    def locked(self):
+        """Returns True once a reference phase has been determined"""
+        return self._vector is not None
+
+    @property
+    def reference(self):
+        """Reference phase in radians, or NaN if not locked"""
+        if self._vector is None:
+            return np.nan
+        return float(np.angle(self._vector))
+
+    def update(self, x, y, noise):
+        """Function to update the reference phase if the point is strong
+        :param x: Averaged X component
+        :type x: float, required
+        :param y: Averaged Y component
+        :type y: float, required
+        :param noise: Noise of the R component
+        :type noise: float, required
+        ...
+        :return: Returns True if the point was strong enough to update the reference phase
+        :rtype: bool
+        """
+        r = np.hypot(x, y)
+        if r == 0 or not (noise == 0 or r / noise >= self.snr_threshold):
+            return False
+
+        unit = complex(x, y) / r
+        if self._vector is None:
+            self._vector = unit
+        else:
+            vector = (1 - self.smoothing) * self._vector + self.smoothing * unit
+            self._vector = vector / abs(vector)
+        return True
+
+    def project(self, x, y):
+        """Function to project X and Y onto the reference phase
+        :param x: X component(s)
+        :type x: float or array, required
+        :param y: Y component(s)
+        :type y: float or array, required
+        ...
+        :return: Signal component in phase with the reference, or NaN if not locked
+        :rtype: float or array
+        """
+        if self._vector is None:
+            return np.full(np.shape(x), np.nan)[()]
+        return x * self._vector.real + y * self._vector.imag
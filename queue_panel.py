@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Queue tab of the GUI
+
+Lists the jobs of the persistent scan queue with their predicted durations. Scans set up in the
+measurement tabs or whole recipes can be queued, reordered and run back to back.
+"""
+
+import logging
+import time
+
+from PyQt5 import QtCore, QtWidgets
+
+import recipe as recipes
+import scheduler
+
+HEADERS = ('Job', 'Name', 'Kind', 'Duration', 'Status', 'Note')
+
+
+class QueuePanel(QtWidgets.QWidget):
+    """Class of the queue tab
+    :param queue: Job queue
+    :type queue: JobQueue, required
+    :param parent: Parent widget
+    :type parent: QWidget, optional
+    """
+
+    addRequested = QtCore.pyqtSignal(str)   # 'Si', 'InGaAs', 'sample' or 'complete', queued from the measurement tabs
+    runRequested = QtCore.pyqtSignal()
+    stopRequested = QtCore.pyqtSignal()
+
+    def __init__(self, queue, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.logger = logging.getLogger(__name__)
+        self.queue = queue
+
+        self.table = QtWidgets.QTableWidget(0, len(HEADERS))
+        self.table.setHorizontalHeaderLabels(HEADERS)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False)
+        self.remaining = QtWidgets.QLabel()
+        self.controls = {} # Buttons by label
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addLayout(self.buttons([('Queue Si Reference', lambda: self.addRequested.emit('Si')),
+                                       ('Queue InGaAs Reference', lambda: self.addRequested.emit('InGaAs')),
+                                       ('Queue Sample', lambda: self.addRequested.emit('sample')),
+                                       ('Queue Complete Scan', lambda: self.addRequested.emit('complete')),
+                                       ('Queue Recipe...', self.addRecipe)]))
+        layout.addWidget(self.table)
+        layout.addLayout(self.buttons([('Up', lambda: self.moveSelected(-1)),
+                                       ('Down', lambda: self.moveSelected(1)),
+                                       ('Remove', self.removeSelected),
+                                       ('Retry', self.retrySelected),
+                                       ('Optimise Order', self.optimise),
+                                       ('Clear Finished', self.clearFinished)]))
+        layout.addWidget(self.remaining)
+        layout.addLayout(self.buttons([('Run Queue', self.runRequested.emit),
+                                       ('Stop', self.stopRequested.emit)]))
+        self.refresh()
+
+    def buttons(self, actions):
+        row = QtWidgets.QHBoxLayout()
+        for label, slot in actions:
+            button = QtWidgets.QPushButton(label)
+            button.clicked.connect(slot)
+            row.addWidget(button)
+            self.controls[label] = button
+        return row
+
+    def setRunning(self, running):
+        """Function to disable the run button while a scan or the queue runs
+        :param running: True while a scan runs
+        :type running: bool, required
+        ...
+        :return: None
+        """
+        self.controls['Run Queue'].setEnabled(not running)
+
+    def refresh(self):
+        """Function to show the current jobs and the remaining queue duration
+        :return: None
+        """
+        selected = self.selectedId()
+        jobs = self.queue.jobs()
+        self.table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            values = (job['id'], job['name'], job['kind'], scheduler.format_duration(job['duration']), job['status'],
+                      job['message'] or '')
+            for column, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem(str(value))
+                item.setData(QtCore.Qt.UserRole, job['id'])
+                self.table.setItem(row, column, item)
+            if job['id'] == selected:
+                self.table.selectRow(row)
+        remaining = self.queue.remaining()
+        self.remaining.setText('Remaining: %s, done at about %s' % (scheduler.format_duration(remaining),
+                                                                   time.strftime('%H:%M', time.localtime(time.time() + remaining))))
+
+    def selectedId(self):
+        """Function to get the selected job
+        :return: Job id, or None if no job is selected
+        :rtype: int
+        """
+        items = self.table.selectedItems()
+        return items[0].data(QtCore.Qt.UserRole) if items else None
+
+    def addJob(self, recipe):
+        """Function to queue the scans of a recipe
+        :param recipe: Recipe
+        :type recipe: dict, required
+        ...
+        :return: None
+        """
+        try:
+            ids = self.queue.add(recipe)
+        except ValueError as ex:
+            self.logger.error('Jobs Not Queued: %s' % ex)
+            QtWidgets.QMessageBox.warning(self, 'Jobs Not Queued', str(ex))
+            return
+        self.logger.info('Queued Jobs %s' % ', '.join(str(job_id) for job_id in ids))
+        self.refresh()
+
+    def addRecipe(self):
+        """Function to queue the scans of a recipe file chosen in a dialog
+        :return: None
+        """
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Queue Recipe', '', 'Recipes (*.yaml *.yml *.json)')
+        if not path:
+            return
+        try:
+            recipe = recipes.load(path)
+        except (OSError, ValueError) as ex:
+            self.logger.error('Recipe Not Loaded: %s' % ex)
+            return
+        self.addJob(recipe)
+
+    def moveSelected(self, offset):
+        job_id = self.selectedId()
+        if job_id is not None:
+            self.queue.move(job_id, offset)
+            self.refresh()
+
+    def removeSelected(self):
+        job_id = self.selectedId()
+        if job_id is not None:
+            self.queue.remove(job_id)
+            self.refresh()
+
+    def retrySelected(self):
+        job_id = self.selectedId()
+        if job_id is not None:
+            self.queue.retry(job_id)
+            self.refresh()
+
+    def optimise(self):
+        saved = self.queue.optimise()
+        self.logger.info('Reordered Pending Jobs, Saving %s' % scheduler.format_duration(saved))
+        self.refresh()
+
+    def clearFinished(self):
+        self.queue.clear()
+        self.refresh()
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Recipe-driven scans from the command line
+
+A recipe is a YAML or JSON file describing the instrument connections, reference and sample scans,
+grating, filter and gain maps, Lock-in settings and output naming. It is validated and its expected
+duration printed before the instruments are touched, then run with the headless scan engine:
+
+    python recipe.py overnight.yaml            # validate, estimate and run
+    python recipe.py overnight.yaml --check    # validate and estimate only
+
+Example:
+    connections: {mono: /dev/ttyUSB1, filter_wheel: /dev/ttyUSB0, lockin: {host: localhost, port: 8005, channel: 1}}
+    save_path: /home/user/sEQE Data
+    user: USER
+    experiment: EXPERIMENT
+    lockin: {tc: 0.1, rate: 224.9, order: 4}
+    speed: 1000
+    gratings: {1: [350, 535], 2: [535, 1150], 3: [1150, 1800]}
+    filters: {2: [350, 410], 3: [410, 650], 4: [650, 985], 5: [985, 1800]}
+    gains: {Si: 1e6, InGaAs: 1e6, sample: 1e8}
+    scans:
+      - {name: Si_ref, detector: Si, ranges: [{start: 350, stop: 1100, step: 5}]}
+      - {name: '{experiment}_A', ranges: [{start: 350, stop: 1100, step: 5, amp: 1e9}]}
+      - name: '{experiment}_A'
+        complete: true
+        ranges:
+          - {start: 350, stop: 700, step: 5, filter: 1, label: 'no'}
+          - {start: 650, stop: 1100, step: 5, filter: 2, label: '600'}
+"""
+
+import argparse
+import json
+import logging
+import numbers
+import os
+import re
+import sys
+import time
+
+import calibration
+import engine
+import metrics
+import scheduler
+import timing
+
+DEFAULT_CONNECTIONS = {'mono': '/dev/ttyUSB1', 'filter_wheel': '/dev/ttyUSB0',
+                       'lockin': {'host': 'localhost', 'port': 8005, 'channel': 1}}
+
+# Scan engine attributes that a recipe may set in its 'engine' section
+ENGINE_SETTINGS = ('averaging', 'clip_sigma', 'trim_fraction', 'detection', 'settle_accuracy', 'integration_tc',
+                   'time_budget', 'target_snr', 'pilot_step', 'pilot_tc', 'min_window_tc', 'max_window_tc',
+                   'monitor_wavelength', 'monitor_points', 'monitor_minutes', 'drift_correction', 'live_eqe',
+                   'use_catalog', 'use_checkpoints', 'log_timings', 'event_log')
+
+
+def load(path):
+    """Function to read a recipe file
+    :param path: YAML (.yaml, .yml) or JSON recipe file
+    :type path: str, required
+    ...
+    :raises ValueError: Raises error if the file cannot be parsed
+    ...
+    :return: Recipe
+    :rtype: dict
+    """
+    with open(path) as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+
+            # YAML 1.1 reads gains like 1e6 as strings, resolve them as floats like JSON does
+            class Loader(yaml.SafeLoader):
+                pass
+            Loader.add_implicit_resolver('tag:yaml.org,2002:float',
+                                         re.compile(r'^[-+]?(?:\d+\.?\d*|\.\d+)[eE][-+]?\d+$'), list('-+0123456789.'))
+            try:
+                return yaml.load(f, Loader=Loader)
+            except yaml.YAMLError as ex:
+                raise ValueError('Invalid YAML: %s' % ex)
+        return json.load(f)
+
+
+def _number(value, positive=True):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and (value > 0 or not positive)
+
+
+def _check_map(recipe, key, positions, errors):
+    ranges = recipe.get(key)
+    if ranges is None:
+        return {}
+    if not isinstance(ranges, dict) or len(ranges) == 0:
+        errors.append('%s: expected a mapping of position to [start, stop]' % key)
+        return {}
+    count = len(errors)
+    for position, bounds in ranges.items():
+        try:
+            valid = int(position) in positions
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            errors.append('%s: invalid position %s' % (key, position))
+        if not (isinstance(bounds, (list, tuple)) and len(bounds) == 2 and _number(bounds[0], False)
+                and _number(bounds[1], False) and bounds[0] < bounds[1]):
+            errors.append('%s %s: expected [start, stop] with start < stop' % (key, position))
+    return ranges if len(errors) == count else {}
+
+
+def _covered(ranges, wavelength):
+    return any(start <= wavelength <= stop for start, stop in ranges.values())
+
+
+def validate(recipe, calibration_path='calibrations'):
+    """Function to check a recipe before running it
+    :param recipe: Recipe
+    :type recipe: dict, required
+    :param calibration_path: Folder of the reference detector calibrations
+    :type calibration_path: str, optional
+    ...
+    :return: Problems found, empty if the recipe is valid
+    :rtype: list of str
+    """
+    if not isinstance(recipe, dict):
+        return ['Recipe: expected a mapping']
+    errors = []
+
+    for key in ('user', 'experiment', 'save_path'):
+        if not isinstance(recipe.get(key), str) or not recipe[key]:
+            errors.append('%s: required' % key)
+
+    connections = recipe.get('connections', {})
+    if not isinstance(connections, dict):
+        errors.append('connections: expected a mapping')
+    elif not isinstance(connections.get('lockin', {}), dict):
+        errors.append('connections.lockin: expected a mapping with host, port and channel')
+
+    lockin = recipe.get('lockin', {})
+    if not isinstance(lockin, dict):
+        errors.append('lockin: expected a mapping')
+        lockin = {}
+    for key in ('tc', 'rate'):
+        if key in lockin and not _number(lockin[key]):
+            errors.append('lockin.%s: expected a positive number' % key)
+    if 'order' in lockin and lockin['order'] not in range(1, 9):
+        errors.append('lockin.order: expected 1 to 8')
+
+    if 'speed' in recipe and not _number(recipe['speed']):
+        errors.append('speed: expected a positive number')
+
+    gratings = _check_map(recipe, 'gratings', range(1, 4), errors) if 'gratings' in recipe else engine.GRATINGS
+    filters = _check_map(recipe, 'filters', range(1, 7), errors) if 'filters' in recipe else engine.FILTERS
+
+    gains = recipe.get('gains', {})
+    if not isinstance(gains, dict) or not all(_number(gain) for gain in gains.values()):
+        errors.append('gains: expected a mapping of detector or "sample" to a positive amplification')
+        gains = {}
+
+    settings = recipe.get('engine', {})
+    if not isinstance(settings, dict):
+        errors.append('engine: expected a mapping')
+    else:
+        for key in settings:
+            if key not in ENGINE_SETTINGS:
+                errors.append('engine.%s: unknown setting' % key)
+
+    scans = recipe.get('scans')
+    if not isinstance(scans, list) or len(scans) == 0:
+        errors.append('scans: expected a list of scans')
+        return errors
+
+    detectors = None
+
+    for index, scan in enumerate(scans):
+        where = 'scans[%d]' % index
+        if not isinstance(scan, dict):
+            errors.append('%s: expected a mapping' % where)
+            continue
+        if not isinstance(scan.get('name'), str) or not scan['name']:
+            errors.append('%s.name: required' % where)
+        else:
+            try:
+                scan_name(recipe, scan, index)
+            except (KeyError, IndexError, ValueError) as ex:
+                errors.append('%s.name: invalid placeholder %s' % (where, ex))
+
+        detector = scan.get('detector')
+        if detector is not None:
+            if detectors is None:
+                detectors = calibration.DetectorRegistry(calibration_path).names()
+            if detector not in detectors:
+                errors.append('%s.detector: unknown reference detector %s, available: %s' % (where, detector, ', '.join(detectors)))
+        complete = bool(scan.get('complete', False))
+
+        ranges = scan.get('ranges')
+        if not isinstance(ranges, list) or len(ranges) == 0:
+            errors.append('%s.ranges: expected a list of ranges' % where)
+            continue
+        for n, scan_range in enumerate(ranges):
+            here = '%s.ranges[%d]' % (where, n)
+            if not isinstance(scan_range, dict):
+                errors.append('%s: expected a mapping' % here)
+                continue
+            if not all(_number(scan_range.get(key)) for key in ('start', 'stop', 'step')):
+                errors.append('%s: start, stop and step must be positive numbers' % here)
+                continue
+            if scan_range['start'] > scan_range['stop']:
+                errors.append('%s: start must not exceed stop' % here)
+            amp = scan_range.get('amp', gains.get(detector or 'sample'))
+            if not _number(amp):
+                errors.append('%s.amp: required, either in the range or in gains' % here)
+            for wavelength in (scan_range['start'], scan_range['stop']):
+                if gratings and not _covered(gratings, wavelength):
+                    errors.append('%s: %g nm outside the grating map' % (here, wavelength))
+                if filters and not _covered(filters, wavelength):
+                    errors.append('%s: %g nm outside the filter map' % (here, wavelength))
+            if complete and scan_range.get('filter') not in range(1, 7):
+                errors.append('%s.filter: external filter position 1 to 6 required for complete scans' % here)
+
+    return errors
+
+
+def scan_name(recipe, scan, index):
+    """Function to compile the file name of a scan from its name template
+    :param recipe: Recipe
+    :type recipe: dict, required
+    :param scan: Scan of the recipe
+    :type scan: dict, required
+    :param index: Position of the scan in the recipe, starting at 1 in the name
+    :type index: int, required
+    ...
+    :return: File name, e.g. '{experiment}_A' becomes 'EXPERIMENT_A'
+    :rtype: str
+    """
+    return scan['name'].format(user=recipe.get('user'), experiment=recipe.get('experiment'),
+                               date=time.strftime('%Y%m%d'), index=index+1)
+
+
+def build_plans(recipe):
+    """Function to compile the scan plans of a validated recipe
+    :param recipe: Recipe
+    :type recipe: dict, required
+    ...
+    :return: Scan plans in the order of the recipe
+    :rtype: list of ScanPlan
+    """
+    lockin = recipe.get('lockin', {})
+    settings = engine.LockinSettings(tc=lockin.get('tc', 0.1), rate=lockin.get('rate', 224.9), order=lockin.get('order', 4),
+                                     input_range=lockin.get('range', 2), ac=lockin.get('ac', 0), imp50=lockin.get('imp50', 0),
+                                     imp50_ref=lockin.get('imp50_ref', 1), diff=lockin.get('diff', 1))
+    gratings = engine.GratingMap(recipe['gratings']) if 'gratings' in recipe else None
+    filters = engine.FilterMap(recipe['filters']) if 'filters' in recipe else None
+    gains = recipe.get('gains', {})
+
+    plans = []
+    for index, scan in enumerate(recipe['scans']):
+        detector = scan.get('detector')
+        complete = bool(scan.get('complete', False))
+        ranges = []
+        for scan_range in scan['ranges']:
+            label = None
+            if complete:
+                label = str(scan_range.get('label', 'no' if scan_range['filter'] == 1 else scan_range['filter']))
+            ranges.append(engine.ScanRange(scan_range['start'], scan_range['stop'], scan_range['step'],
+                                           scan_range.get('amp', gains.get(detector or 'sample')),
+                                           external_filter=scan_range.get('filter'), filter_label=label))
+        plans.append(engine.ScanPlan(scan_name(recipe, scan, index), recipe['user'], recipe['experiment'], ranges,
+                                     detector=detector, complete=complete, gratings=gratings, filters=filters,
+                                     lockin=settings, speed=recipe.get('speed', 1000)))
+    return plans
+
+
+def from_plan(plan, save_path=None):
+    """Function to describe a scan plan as a recipe with one scan, e.g. to queue a scan set up in the GUI
+    :param plan: Scan plan
+    :type plan: ScanPlan, required
+    :param save_path: Data folder
+    :type save_path: str, optional
+    ...
+    :return: Recipe
+    :rtype: dict
+    """
+    ranges = []
+    for scan_range in plan.ranges:
+        values = {'start': scan_range.start, 'stop': scan_range.stop, 'step': scan_range.step, 'amp': scan_range.amp}
+        if plan.complete:
+            values.update(filter=scan_range.external_filter, label=scan_range.filter_label)
+        ranges.append(values)
+    scan = {'name': plan.name, 'ranges': ranges}
+    if plan.detector is not None:
+        scan['detector'] = plan.detector
+    if plan.complete:
+        scan['complete'] = True
+
+    settings = plan.lockin
+    recipe = {'user': plan.user, 'experiment': plan.experiment,
+              'lockin': {'tc': settings.tc, 'rate': settings.rate, 'order': settings.order, 'range': settings.input_range,
+                         'ac': settings.ac, 'imp50': settings.imp50, 'imp50_ref': settings.imp50_ref, 'diff': settings.diff},
+              'speed': plan.speed,
+              'gratings': {position: list(bounds) for position, bounds in plan.gratings.ranges.items()},
+              'filters': {position: list(bounds) for position, bounds in plan.filters.ranges.items()},
+              'scans': [scan]}
+    if save_path is not None:
+        recipe['save_path'] = save_path
+    return recipe
+
+
+def estimate_duration(plans, integration_tc=5, settle_accuracy=0.99, model=None):
+    """Function to estimate the duration of scan plans with fixed measurement windows
+    :param plans: Scan plans
+    :type plans: list of ScanPlan, required
+    :param integration_tc: Measurement window after settling in time constants
+    :type integration_tc: float, optional
+    :param settle_accuracy: Settled fraction to wait for after moves and setting changes
+    :type settle_accuracy: float, optional
+    :param model: Timing model of the setup, the default timings if not given
+    :type model: TimingModel, optional
+    ...
+    :return: Expected duration [s]
+    :rtype: float
+    """
+    model = model or timing.TimingModel()
+    return sum(model.scan(plan, integration_tc, settle_accuracy) for plan in plans)
+
+
+def create_engine(recipe):
+    """Function to create the scan engine and instrument drivers of a recipe
+    :param recipe: Recipe
+    :type recipe: dict, required
+    ...
+    :return: Scan engine
+    :rtype: ScanEngine
+    """
+    connections = dict(DEFAULT_CONNECTIONS, **recipe.get('connections', {}))
+    lockin = dict(DEFAULT_CONNECTIONS['lockin'], **connections['lockin'])
+    scan = engine.ScanEngine(engine.Monochromator(connections['mono']),
+                             engine.LockIn(lockin['host'], lockin['port'], channel=lockin['channel']),
+                             engine.FilterWheel(connections['filter_wheel']),
+                             recipe['save_path'], calibration_path=recipe.get('calibration_path', 'calibrations'))
+    for key, value in recipe.get('engine', {}).items():
+        setattr(scan, key, value)
+    return scan
+
+
+def run(recipe, scan=None, resume=False):
+    """Function to connect the instruments and run all scans of a recipe
+    :param recipe: Validated recipe
+    :type recipe: dict, required
+    :param scan: Scan engine, defaults to one created from the recipe connections
+    :type scan: ScanEngine, optional
+    :param resume: Continue an interrupted run of the recipe from the checkpoint of the data folder
+    :type resume: bool, optional
+    ...
+    :return: True if all instruments connected and the scans ran
+    :rtype: bool
+    """
+    logger = logging.getLogger(__name__)
+    scan = scan or create_engine(recipe)
+    for instrument in (scan.lockin, scan.mono, scan.wheel):
+        if not instrument.connected:
+            instrument.connect()
+    if not scan.connected():
+        logger.error('Instruments Not Connected')
+        return False
+
+    plans = build_plans(recipe)
+    first, state = 0, None
+    if resume:
+        state = scan.loadCheckpoint()
+        context = (state or {}).get('context') or {}
+        if context.get('scan') is None or context['scan'] >= len(plans) or context.get('name') != plans[context['scan']].name:
+            logger.error('No Interrupted Scan Of This Recipe Found')
+            return False
+        first = context['scan']
+
+    for number, plan in enumerate(plans):
+        if number < first:
+            continue
+        if not scan.measuring and number > first:
+            logger.info('Recipe Stopped')
+            break
+        logger.info('Scan %d of %d: %s' % (number+1, len(plans), plan.name))
+        scan.context = {'scan': number, 'name': plan.name}
+        if state is not None and number == first:
+            scan.run(plan, resume=state)
+        else:
+            scan.run(plan)
+    scan.context = None
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the sEQE scans described in a YAML or JSON recipe')
+    parser.add_argument('recipe', help='Recipe file')
+    parser.add_argument('--check', action='store_true', help='Only validate the recipe and print the expected duration')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run from its checkpoint')
+    parser.add_argument('--metrics-port', type=int, help='Serve live metrics of the running scans on this port of localhost')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+                        datefmt='%Y-%m-%d - %H:%M:%S')
+    logger = logging.getLogger(__name__)
+
+    try:
+        recipe = load(args.recipe)
+    except (OSError, ValueError) as ex:
+        logger.error('Recipe Not Loaded: %s' % ex)
+        return 1
+
+    errors = validate(recipe, recipe.get('calibration_path', 'calibrations') if isinstance(recipe, dict) else 'calibrations')
+    if errors:
+        for error in errors:
+            logger.error('Invalid Recipe: %s' % error)
+        return 1
+
+    plans = build_plans(recipe)
+    settings = recipe.get('engine', {})
+    duration = estimate_duration(plans, settings.get('integration_tc', 5), settings.get('settle_accuracy', 0.99),
+                                 timing.load(recipe.get('calibration_path', 'calibrations')))
+    points = sum(len(scan_range.wavelengths()) for plan in plans for scan_range in plan.ranges)
+    print('%d scans, %d points, expected duration %s' % (len(plans), points, scheduler.format_duration(duration)))
+    if settings.get('time_budget') is not None or settings.get('target_snr') is not None:
+        print('Measurement windows are allocated from pilot measurements, the actual duration may differ')
+
+    if args.check:
+        return 0
+    scan = create_engine(recipe)
+    if args.metrics_port is not None:
+        metrics.serve(scan, port=args.metrics_port)
+    return 0 if run(recipe, scan, resume=args.resume) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ring buffer of raw demodulator samples
+
+The acquisition writes every polled demodulator sample into a ring buffer of fixed size together
+with markers of the monochromator moves, the discarded settling samples and the measurement windows.
+There is one writer and readers never block it: the writer advances a counter of the slots it is
+writing, fills them and then advances the counter of the written samples, and a reader drops the
+samples that were overwritten or were being overwritten while it was copying.
+"""
+
+import collections
+import time
+
+import numpy as np
+
+FIELDS = ('time', 'x', 'y', 'frequency', 'phase')
+
+
+class RingBuffer(object):
+    """Class of the ring buffer of demodulator samples
+    :param capacity: Number of samples kept
+    :type capacity: int, optional
+    :param max_markers: Number of markers kept
+    :type max_markers: int, optional
+    """
+
+    def __init__(self, capacity=2**18, max_markers=512):
+        self.capacity = int(capacity)
+        self.samples = np.zeros((len(FIELDS), self.capacity))
+        self.writing = 0 # Advanced before the slots are filled
+        self.written = 0 # Advanced after the slots are filled
+        self.markers = collections.deque(maxlen=max_markers)
+
+    def extend(self, times, x, y, frequency, phase):
+        """Function to add demodulator samples
+        :param times: Sample times [s since epoch]
+        :type times: array, required
+        ...
+        :return: None
+        """
+        block = np.vstack((times, x, y, frequency, phase))[:, -self.capacity:]
+        count = block.shape[1]
+        start = self.written % self.capacity
+        first = min(count, self.capacity - start)
+        self.writing += count # Readers treat the slots as overwritten from here on
+        self.samples[:, start:start+first] = block[:, :first]
+        self.samples[:, :count-first] = block[:, first:]
+        self.written = self.writing
+
+    def mark(self, kind, start, stop):
+        """Function to add a marker to the timeline
+        :param kind: One of MARKERS
+        :type kind: str, required
+        :param start: Start time [s since epoch]
+        :type start: float, required
+        :param stop: Stop time [s since epoch]
+        :type stop: float, required
+        ...
+        :return: None
+        """
+        self.markers.append((kind, start, stop))
+
+    def latest(self, seconds):
+        """Function to copy the samples of the last seconds
+        :param seconds: Length of the time span
+        :type seconds: float, required
+        ...
+        :return: Array with one row per field of FIELDS, oldest sample first
+        :rtype: array
+        """
+        written = self.written
+        count = min(written, self.capacity)
+        index = (np.arange(written - count, written)) % self.capacity
+        block = self.samples[:, index]
+
+        # Samples the writer overwrote or was overwriting while they were copied are dropped
+        overwritten = self.writing - written
+        block = block[:, overwritten:]
+
+        if block.shape[1] > 0:
+            block = block[:, block[0] >= block[0, -1] - seconds]
+        return block
+
+
+def host_times(timestamps, clockbase, now=None):
+    """Function to convert device timestamps of a poll to host times
+    :param timestamps: Device timestamps of the polled samples [ticks]
+    :type timestamps: array, required
+    :param clockbase: Timestamp ticks per second
+    :type clockbase: float, required
+    :param now: Host time of the last sample, the time of the call by default
+    :type now: float, optional
+    ...
+    :return: Sample times [s since epoch], with the last sample at now
+    :rtype: array
+    """
+    timestamps = timestamps.astype(np.int64)   # Unsigned ticks would wrap around when subtracted
+    seconds = (timestamps - timestamps[-1])/clockbase
+    return seconds + (time.time() if now is None else now)
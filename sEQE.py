@@ -6,32 +6,34 @@ Created on Fri Sep 28 11:59:40 2018
 @author: jungbluth
 """
 
-import io
-import itertools
-import math
-import os
-import re
 import sys
-import time
 import logging
 import warnings
 
+import eventlog
+import startup
+startup.profile_imports('--profile-startup' in sys.argv)
+
 import GUI_template
-import matplotlib
-import matplotlib.animation as animation
-import matplotlib.pyplot as plt
-import pandas as pd
-import serial
-import zhinst.utils
-import zhinst.ziPython
 # for the gui
 from PyQt5 import QtCore, QtGui, QtWidgets
-from matplotlib import style
-from numpy import *
-from scipy.interpolate import interp1d
+
+# Heavy modules are imported on first use, so that the window opens quickly
+engine = startup.lazy_import('engine')
+jobqueue = startup.lazy_import('jobqueue')
+live_plot = startup.lazy_import('live_plot')
+overlay = startup.lazy_import('overlay')
+queue_panel = startup.lazy_import('queue_panel')
+recipe = startup.lazy_import('recipe')
+metrics = startup.lazy_import('metrics')
+ringbuffer = startup.lazy_import('ringbuffer')
+scope = startup.lazy_import('scope')
 
 
 class MainWindow(QtWidgets.QMainWindow):
+    
+    pointMeasured = QtCore.pyqtSignal(dict) # Measured point for the live plot
+    
     def __init__(self):
         
         QtWidgets.QMainWindow.__init__(self)
@@ -43,26 +45,13 @@ class MainWindow(QtWidgets.QMainWindow):
         # Set up the user interface from Designer
         
         self.ui = GUI_template.Ui_MainWindow()
-        self.ui.setupUi(self)         
-        
-        # Connections
-        
-        self.mono_connected = False   # Set the monochromator connection to False
-        self.lockin_connected = False   # Set the Lock-in connection to False
-        self.filter_connected = False  # Set the filterwheel connection to False
+        with startup.phase('setupUi'):
+            self.ui.setupUi(self)         
         
         # General Setup
-         
-        self.channel = 1
-        self.c = str(self.channel-1) 
-        self.c6 = str(6)
 
         self.do_plot = True
 
-        self.complete_scan = False
-
-        self.filter_addition = 'None' ####################################################################################
-        
         # Handle Monochromator Buttons
         
         self.ui.connectButton_Mono.clicked.connect(self.connectToMono)  # Connect only to Monochromator        
@@ -94,15 +83,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.completeScanButton_start.clicked.connect(self.MonoHandleCompleteScanButton)  #########################################################################################
         self.ui.completeScanButton_stop.clicked.connect(self.HandleStopCompleteScanButton)   #########################################################################################
         
-        # Import photodiode calibration files
-
-        Si_file = pd.ExcelFile("FDS100-CAL.xlsx") # The files are in the sEQE Analysis folder
-#        print(Si_file.sheet_names)
-        self.Si_cal = Si_file.parse('Sheet1')
-#        print(self.Si_cal)
-        
-        InGaAs_file = pd.ExcelFile("FGA21-CAL.xlsx")
-        self.InGaAs_cal = InGaAs_file.parse('Sheet1')     
+        self.reference_detectors = {1: 'Si', 2: 'InGaAs'} # Detector used for each measurement number
 
         # Path to USB connections 
         self.filter_usb = '/dev/ttyUSB0' # NOTE: Change this if necessary
@@ -111,118 +92,163 @@ class MainWindow(QtWidgets.QMainWindow):
         # Path to save data
         self.save_path = '/home/jungbluthl/Desktop/sEQE Data' # NOTE: Change this if necessary
         
+        self.queue_path = 'queue.sqlite' # Scan queue, kept across restarts. NOTE: Change this if necessary
+        
+        self.metrics_port = 8765 # Live metrics on http://localhost:8765/status, None to disable. NOTE: Change this if necessary
+        
+        self.engine = None # Headless scan engine with the instrument drivers, created after the window is shown
+        self.running = False # True while a scan or the queue started from the GUI runs
+        
+        # Scan engine, plot tabs and calibrations are set up once the window is shown
+        
+        QtCore.QTimer.singleShot(0, self.finishSetup)
+        
+    def finishSetup(self):
+        """Function to set up the plot tabs and reference detectors after the window is shown
+        :return: None
+        """
+        # Live plot, embedded as a tab and repainted at a fixed rate, with previous scans of the experiment as overlays
+        
+        with startup.phase('live plot'):
+            self.live_plot = live_plot.LivePlot(rate=10)
+            self.overlays = overlay.OverlayPanel(overlay.ScanCache(max_bytes=200*2**20))
+            self.plot_tab = QtWidgets.QSplitter()
+            self.plot_tab.addWidget(self.live_plot)
+            self.plot_tab.addWidget(self.overlays)
+            self.plot_tab.setStretchFactor(0, 4)
+            self.ui.tabs.addTab(self.plot_tab, 'Live Plot')
+            self.pointMeasured.connect(self.live_plot.addPoint)
+            self.overlays.overlaysChanged.connect(self.live_plot.setOverlays)
+        
+        # Raw demodulator samples of the last polls, shown in the scope tab
+        
+        with startup.phase('scope'):
+            self.scope_buffer = ringbuffer.RingBuffer(capacity=2**18)
+            self.scope_view = scope.ScopeView(self.scope_buffer, seconds=30, rate=5)
+            self.ui.tabs.addTab(self.scope_view, 'Scope')
+        
+        with startup.phase('engine'):
+            self.engine = self.createEngine()
+        
+        with startup.phase('reference detectors'):
+            self.engine.loadDetectors()
+        
+        # Live metrics of running scans for remote monitoring, served on localhost only
+        
+        self.metrics_server = None
+        if self.metrics_port is not None:
+            with startup.phase('metrics server'):
+                self.metrics_server = metrics.serve(self.engine, 'sEQE', self.metrics_port)
+        
+        # Scans interrupted by a crash or power cut can be continued from their checkpoint
+        
+        self.resume_action = self.ui.menu.addAction('Resume Interrupted Scan')
+        self.resume_action.triggered.connect(self.resumeScan)
+        interrupted = self.engine.loadCheckpoint()
+        if interrupted is not None:
+            self.statusBar().showMessage('Interrupted Scan Found: %s, Resume From The Menu' % interrupted['recipe']['scans'][0]['name'])
+        
+        # Persistent queue of scan jobs, run back to back
+        
+        with startup.phase('queue'):
+            self.queue = jobqueue.JobQueue(self.queue_path)
+            self.queue_panel = queue_panel.QueuePanel(self.queue)
+            self.ui.tabs.addTab(self.queue_panel, 'Queue')
+            self.queue_panel.addRequested.connect(self.queueScan)
+            self.queue_panel.runRequested.connect(self.runQueue)
+            self.queue_panel.stopRequested.connect(self.HandleStopButton)
+        
+        startup.report(self.logger)
+        
+    def createEngine(self):
+        """Function to create the scan engine with the instrument drivers
+        :return: Scan engine
+        :rtype: ScanEngine
+        """
+        mono = engine.Monochromator(self.mono_usb)
+        lockin = engine.LockIn('localhost', 8005, channel=1) # NOTE: Modify address if necessary
+        wheel = engine.FilterWheel(self.filter_usb)
+        scan = engine.ScanEngine(mono, lockin, wheel, self.save_path, calibration_path='calibrations') # NOTE: Change this if necessary
+
+        # Averaging of the demodulator samples of each point ('mean', 'sigma_clip', 'median', 'trimmed_mean', 'hodges_lehmann')
+        scan.averaging = 'mean' # NOTE: Change this if necessary
+        scan.clip_sigma = 3 # Outlier threshold in standard deviations
+        scan.trim_fraction = 0.1 # Fraction of samples cut from each end for the trimmed mean
+
+        # Detection mode ('magnitude' uses R, 'projection' projects X and Y of weak points onto the phase of strong points)
+        scan.detection = 'magnitude' # NOTE: Change this if necessary
+
+        # Lock-in low-pass filter settling
+        scan.settle_accuracy = 0.99 # Settled fraction to wait for after moves and setting changes. NOTE: Change this if necessary
+        scan.integration_tc = 5 # Measurement window after settling in time constants
+
+        # Noise-budgeted allocation of the measurement window per wavelength. Set either a time budget or a target SNR to enable it
+        scan.time_budget = None # Total time per range [s]. NOTE: Change this if necessary
+        scan.target_snr = None # Target signal-to-noise ratio of each point. NOTE: Change this if necessary
+
+        # Drift monitor. Set a monitor wavelength to revisit it every few points or minutes during a scan
+        scan.monitor_wavelength = None # [nm]. NOTE: Change this if necessary
+        scan.monitor_points = 20 # Revisit after this many points
+        scan.monitor_minutes = None # Revisit after this many minutes
+        scan.drift_correction = False # Normalise the current to the latest monitor reading
+
+        scan.live_eqe = True # Calculate the EQE of sample scans from the latest reference measurements of the experiment
+        scan.use_catalog = True # Register every scan in the catalog of the data folder
+        scan.use_checkpoints = True # Checkpoint every point to resume interrupted scans
+        scan.log_timings = True # Log the time of moves, swaps and points to calibrate the duration estimates
+        scan.event_log = True # Write a JSON-lines event log of every run to the _logs folder of the data folder
+
+        scan.scope_buffer = self.scope_buffer
+        scan.range_callback = self.set_up_plot
+        scan.point_callback = self.showPoint
+        scan.status_callback = self.statusBar().showMessage
+        return scan
+        
     # Close connection to Monochromator when window is closed
-    
+
     def __del__(self):
         try:
-            self.p.close()
+            self.engine.mono.close()
         except:
-            pass 
+            pass
 
-# -----------------------------------------------------------------------------------------------------------        
+# -----------------------------------------------------------------------------------------------------------
 
     #### Functions to connect to Monochromator and Lock-in
 
 # -----------------------------------------------------------------------------------------------------------
-        
+
     # Establish serial connection to Monochromator
-    
+
     def connectToMono(self):
         """Function to establish connection to monochromator
         :return: None
         """
-        self.p = serial.Serial(self.mono_usb, 9600, timeout=0)    
-        
-        self.p.write('HELLO\r'.encode())   # "Hello" initializes the Monochromator
-        time.sleep(25)   # Sleep function makes window time out. This is to avoid that the user sends signals while the Monochromator is still initializing
-        self.mono_connected = self.waitForOK()   # Checks for OK response of Monochromator
+        if self.engine.mono.connect():   # Sleep in connect makes window time out. This is to avoid that the user sends signals while the Monochromator is still initializing
+            self.ui.imageConnect_mono.setPixmap(QtGui.QPixmap("Button_on.png"))
 
-        if self.mono_connected:
-            self.logger.info('Connection to Monochromator Established')
-            self.ui.imageConnect_mono.setPixmap(QtGui.QPixmap("Button_on.png"))           
-    
-    # Check Monochromator response
-    
-    def waitForOK(self):
-        """Function to wait for acceptance signal from monochromator
-        :raises LoggerError: Raises error if monochromator connection failed
-        ...
-        :return: Returns True of connection successful, and False otherwise
-        :rtype: bool
-        """
-        ret = False
-        self.p.timeout = 40000
-        shouldbEOk = self.p.readline() 
-        
-        if (shouldbEOk == ' ok\r\n'.encode()) or (shouldbEOk == '  ok\r\n'.encode()):
-            ret = True
-        else:
-            self.logger.error('Connection to Monochromator Could Not Be Established')   
-            
-        self.p.timeout = 0
-        return ret        
-        
     # Establish connection to LOCKIN
-    
-    def connectToLockin(self):    
-        """Function to establish connection to Lockin
-        :return: Returns Zurich Instruments localhost name and device details
-        """    
-        self.lockin_connected = False
-        
-        # Open connection to ziServer
-        daq = zhinst.ziPython.ziDAQServer('localhost', 8005) # NOTE: Modify address if necessary
-        self.daq = daq
-        
-        # Detect device
-        self.device = zhinst.utils.autoDetect(daq)
 
-        self.logger.info('Connection to Lock-In Established')
-        
-        self.lockin_connected = True       
-        self.ui.imageConnect_lockin.setPixmap(QtGui.QPixmap("Button_on.png"))
-        
-        return self.daq, self.device
+    def connectToLockin(self):
+        """Function to establish connection to Lockin
+        :return: None
+        """
+        if self.engine.lockin.connect():
+            self.ui.imageConnect_lockin.setPixmap(QtGui.QPixmap("Button_on.png"))
 
     # Establish connection to Filterwheel
 
     def connectToFilter(self):
         """Function to establish connection to filter wheel
-        :raises SerialException: Raises exception if filter wheel USB port is inaccessible
-        :raises OSError: Raises exception if filter wheel USB port is inaccessible
-        ...
         :return: None
-        """ 
-        try:
-            self._fw = serial.Serial(port=self.filter_usb, baudrate=115200,
-                                     bytesize=8, parity='N', stopbits=1,
-                                     timeout=1, xonxoff=0, rtscts=0)
-        except  serial.SerialException as ex:
-            self.logger.error('Port {0} is unavailable: {1}'.format(self.filter_usb, ex))
-            self.filter_connected = False
-            return
-        except  OSError as ex:
-            self.logger.error('Port {0} is unavailable: {1}'.format(self.filter_usb, ex))
-            self.filter_connected = False
-            return
-
-        self._sio = io.TextIOWrapper(io.BufferedRWPair(self._fw, self._fw, 1),
-                                     newline=None, encoding='ascii')
-
-        self.logger.info("Connection to External Filter Wheel Established")
-
-#        self._sio.write('*idn?\r')
-#        devInfo = self._sio.readlines(2048)[1][:-1]
-#        print(devInfo)
+        """
+        if self.engine.wheel.connect():
+            self.ui.imageConnect_filter.setPixmap(QtGui.QPixmap("Button_on.png"))
 
-        self._sio.flush()
-        self.filter_connected = True
-        self.ui.imageConnect_filter.setPixmap(QtGui.QPixmap("Button_on.png"))
+# -----------------------------------------------------------------------------------------------------------
 
-# -----------------------------------------------------------------------------------------------------------        
-        
     # Establish connection to both
-        
+
     def connectToEquipment(self):
         """Function to establish connection to monochromator, Lockin & filter wheel
         :return: None
@@ -230,71 +256,38 @@ class MainWindow(QtWidgets.QMainWindow):
         self.connectToLockin()
         self.connectToMono()
         self.connectToFilter()
-        
-        self.ui.imageConnect.setPixmap(QtGui.QPixmap("Button_on.png"))        
-    
-# -----------------------------------------------------------------------------------------------------------        
-    
+
+        self.ui.imageConnect.setPixmap(QtGui.QPixmap("Button_on.png"))
+
+# -----------------------------------------------------------------------------------------------------------
+
     #### Functions to handle parameter buttons for Monochromator and Lock-in
-    
-# -----------------------------------------------------------------------------------------------------------            
-       
+
+# -----------------------------------------------------------------------------------------------------------
+
     ## Monochromator Functions
-    
+
     # Set and GOTO wavelength
-    
-    def MonoHandleWavelengthButton(self):   # Function sets desired wavelength and calls chooseWavelength function
+
+    def MonoHandleWavelengthButton(self):   # Function sets desired wavelength and sends it to the monochromator
         """Function to read wavelength value from GUI
         :return: None
         """
         wavelength = self.ui.pickNM.value()
-        self.chooseWavelength(wavelength)
-      
-    def chooseWavelength(self, wavelength):   # Function to send GOTO command to monochromator
-        """Function to send wavelength command to monochromator
-        :param wavelength: target wavelength
-        :type wavelength: float, required
-        ...
-        :raises LoggerError: Raises error if monochromator not connected
-        ...
-        :return: None
-        """
-        if self.mono_connected:
-            print('%d nm' % wavelength)
-            self.p.write('{:.2f} GOTO\r'.format(wavelength).encode())
-            self.waitForOK()
-                
-        else:
-            self.logger.error('Monochromator Not Connected')
-            
+        self.engine.mono.goto(wavelength)
+
     # Update the scan speed
-            
-    def MonoHandleSpeedButton(self):   # Function sets desired scan speed and calls chooseScanSpeed function
+
+    def MonoHandleSpeedButton(self):   # Function sets desired scan speed and sends it to the monochromator
         """Function to read monochromator speed from GUI
         :return: None
         """
         speed = self.ui.pickScanSpeed.value()
-        self.chooseScanSpeed(speed)
-        
-    def chooseScanSpeed(self, speed):   # Function to send scan speed command to monochromator
-        """Function to send scan speed command to monochromator
-        :param speed: monochromator grating scan speed
-        :type speed: float, required
-        ...
-        :raises LoggerError: Raises error if monochromator not connected
-        ...
-        :return: None
-        """
-        if self.mono_connected:
-#            self.logger.info('Updating Scan Speed to %d nm/min.' % speed)
-            self.p.write('{:.2f} NM/MIN\r'.format(speed).encode())
-            self.waitForOK()
-        else:
-            self.logger.error('Monochromator Not Connected')   
-
-    # Set and move to grating 
-    
-    def MonoHandleGratingButtons(self):   # Function sets desired grating number and calls chooseGrating function
+        self.engine.mono.setSpeed(speed)
+
+    # Set and move to grating
+
+    def MonoHandleGratingButtons(self):   # Function sets desired grating number and sends it to the monochromator
         """Function to read grating number from monochromator
         :return: None
         """
@@ -304,50 +297,18 @@ class MainWindow(QtWidgets.QMainWindow):
             gratingNo = 2
         elif self.ui.Blaze_1600.isChecked():
             gratingNo = 3
-        self.chooseGrating(gratingNo)
-      
-    def chooseGrating(self, gratingNo):   # Function to send grating command to monochromator
-        """Function to send grating command to monochromator
-        :param gratingNo: Monochromator grating number
-        :type gratingNo: float, required
-        ...
-        :raises LoggerError: Raises error if monochromator not connected
-        ...
-        :return: None
-        """
-        if self.mono_connected:
-            self.logger.info('Moving to Grating %d' % gratingNo)
-            self.p.write('{:d} grating\r'.format(gratingNo).encode())
-            self.waitForOK()
-        else:
-            self.logger.error('Monochromator Not Connected')
-            
+        self.engine.mono.setGrating(gratingNo)
+
     # Update filter number
-            
+
     def MonoHandleFilterButton(self):
         """Function to read filter position from GUI
         :return: None
         """
         filterNo = int(self.ui.pickFilter.value())
-        self.chooseFilter(filterNo)
-
-    def chooseFilter(self, filterNo):
-        """Function to send filter selection command to filter wheel
-        :param filterNo: Filter position
-        :type filterNo: float, required
-        ...
-        :raises LoggerError: Raises error if monochromator not connected
-        ...
-        :return: None
-        """
-        if self.mono_connected:
-#            self.logger.info('Moving to Monochromator Filter %d' % filterNo)
-            self.p.write('{:d} FILTER\r'.format(filterNo).encode())
-            self.waitForOK()
-        else:
-            self.logger.error('Monochromator Not Connected')  
+        self.engine.mono.setFilter(filterNo)
 
-    # Initialize filter 
+    # Initialize filter
 
     def MonoHandleFilterInitButton(self):
         """Function to read filter initialization position from GUI
@@ -355,295 +316,78 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         filterStart = self.ui.pickFilterInitStart.value()
         filterDiff = int(8-filterStart)
-        self.initializeFilter(filterDiff)                
-
-    def initializeFilter(self, filterDiff):
-        """Function to initialize filter wheel
-        :param filterDiff: Difference between filter position and initialization position
-        :type filterDiff: int, required
-        ...
-        :raises LoggerError: Raises error if monochromator not connected
-        ...
-        :return: None
-        """
-        if self.mono_connected:
-            self.logger.info('Initializing Monochromator Filter Wheel')
-            self.p.write('{:d} FILTER\r'.format(filterDiff).encode())
-            self.p.write('FHOME\r'.encode())
-            self.waitForOK()
+        if self.engine.mono.initializeFilter(filterDiff):
             self.ui.imageInit_filterwheel.setPixmap(QtGui.QPixmap("Button_on.png"))
-        else:
-            self.logger.error('Monochromator Not Connected') 
-    
-# -----------------------------------------------------------------------------------------------------------        
-    
+
+# -----------------------------------------------------------------------------------------------------------
+
     ## Lock-in Functions
-    
+
     # Define and set Lock-in parameters
-    
+
     def LockinHandleParameterButton(self):
         """Function to read Lockin amplification value from GUI
         :return: None
         """
-        if self.lockin_connected:
-            self.amplification = self.ui.pickAmp.value()
-            self.LockinUpdateParameters()
-        
-    def LockinUpdateParameters(self):   # Function sets desired Lock-in parameters and calls setParameter function 
-        """Function to update Lockin parameters
-        :raises LoggerError: Raises error if Lockin not connected
-        ...
-        :return: None
-        """        
-        if self.lockin_connected:  
-            self.c_2 = str(self.channel) # Channel 2, with value 1, for the reference input
-            self.tc = self.ui.pickTC.value() # Import value for time constant
-            self.rate = self.ui.pickDTR.value() # Import value for data transfer rate
-            self.lowpass = self.ui.pickLPFO.value() # Import value for low pass filter order
-            self.range = 2 # This sets the default voltage range to 2
-            self.ac = 0 # AC off
-            self.imp50 = 0 # 50 Ohm off
-            self.imp50_2 = 1 # Turn on 50 Ohm on channel 2 to attenuate signal from chopper controller as reference signal
-            self.diff = 1 # Diff off
-#            if self.ui.acButton.isChecked(): # AC on if button is checked
-#                self.ac = 1
-#            if self.ui.imp50Button.isChecked(): # 50 Ohm on if button is checked
-#                self.imp50 = 1
-#            if self.ui.diffButton.isChecked(): # Diff on if button is checked
-#                self.diff = 1                
-#            self.frequency = self.ui.pickFreq.value() # For manual frequency control. The frequency tab is currently not implemented in the GUI
-            
-            self.setParameters()
-            self.logger.info('Updating Lock-In Settings')
-            
-        else:
-            self.logger.error("Lock-In Not Connected")
-             
-    def setParameters(self):       
-        """Function to set default Lockin parameters
-        :return: None
-        """
- #       c = str(0)      
- #       print(self.amplification)
-     
-        # Disable all outputs and all demods
-        general_setting = [
-             [['/', self.device, '/demods/0/trigger'], 0],
-             [['/', self.device, '/demods/1/trigger'], 0],
-             [['/', self.device, '/demods/2/trigger'], 0],
-             [['/', self.device, '/demods/3/trigger'], 0],
-             [['/', self.device, '/demods/4/trigger'], 0],
-             [['/', self.device, '/demods/5/trigger'], 0],
-             [['/', self.device, '/sigouts/0/enables/*'], 0],
-             [['/', self.device, '/sigouts/1/enables/*'], 0]
-        ]
-        self.daq.set(general_setting)
-       
-        # Set test settings
-        t1_sigOutIn_setting = [
-            [['/', self.device, '/sigins/',self.c,'/diff'], self.diff],  # Diff Button (Enable for differential mode to measure the difference between +In and -In.)
-            [['/', self.device, '/sigins/',self.c,'/imp50'], self.imp50],  # 50 Ohm Button (Enable to switch input impedance between low (50 Ohm) and high (approx 1 MOhm). Select for signal frequencies of > 10 MHz.) 
-            [['/', self.device, '/sigins/',self.c,'/ac'], self.ac],  # AC Button (Enable for AC coupling to remove DC signal. Cutoff frequency = 1kHz) 
-            [['/', self.device, '/sigins/',self.c,'/range'], self.range],  # Input Range               
-            [['/', self.device, '/demods/',self.c,'/order'], self.lowpass],  # Low-Pass Filter Order                        
-            [['/', self.device, '/demods/',self.c,'/timeconstant'], self.tc],  # Time Constant
-            [['/', self.device, '/demods/',self.c,'/rate'], self.rate],  # Data Transfer Rate 
-            [['/', self.device, '/demods/',self.c,'/oscselect'], self.channel-1],  # Oscillators
-            [['/', self.device, '/demods/',self.c,'/harmonic'], 1],  # Harmonicss
-            [['/', self.device, '/demods/',self.c,'/phaseshift'], 0],  # Phase Shift       
-            [['/', self.device, '/zctrls/',self.c,'/tamp/0/currentgain'], self.amplification],  #  Amplifier Setting
-            [['/', self.device, '/demods/',self.c,'/adcselect'], self.channel-1], # ???
-                        
-        # For locked reference signal
-            [['/', self.device, '/sigins/', self.c_2,'/imp50'], self.imp50_2],  # 50 Ohm Button (Enable to switch input impedance between low (50 Ohm) and high (approx 1 MOhm). Select for signal frequencies of > 10 MHz.)
-            [['/', self.device, '/plls/',self.c,'/enable'], 1],  # Manual [0], External Reference [1]
-            [['/', self.device, '/plls/',self.c,'/adcselect'], 1], # ???
-
-        # For manual reference signal - The frequency tab is currently not implemented in the GUI
-#            [['/', self.device, '/plls/',self.c,'/enable'], 0],  # Manual [0], External Reference [1]
-#            [['/', self.device, '/oscs/',self.c,'/freq'], self.frequency],  # Demodulation Frequency
-            
-        # Additional settings ?                        
-    #        [['/', self.device, '/sigouts/',self.c,'/add'], -179.8390],  # Output Add Button (Adds signal from "Add" connection)
-    #        [['/', self.device, '/sigouts/',self.c,'/on'], 1],  # Turn on Output Channel
-    #        [['/', self.device, '/sigouts/',self.c,'/enables/',c6], 1],  # Enable Output Channel
-    #        [['/', self.device, '/sigouts/',self.c,'/range'], 1],  # Output Range
-    #        [['/', self.device, '/sigouts/',self.c,'/amplitudes/',c6], amplitude],  # Output Amplitude
-    #        [['/', self.device, '/sigouts/',self.c,'/offset'], 0],  # Output Offset
-            
-        ]
-        self.daq.set(t1_sigOutIn_setting);       
-        time.sleep(1)  # wait 1s to get a settled lowpass filter
-        self.daq.flush()   # clean queue
-        
-#        self.logger.info("Lock-in settings have been updated")
-        
-# -----------------------------------------------------------------------------------------------------------        
-    
-    #### Functions to handle filter and grating changes
+        if self.engine.lockin.connected:
+            self.engine.configure(self.lockinSettings(), self.ui.pickAmp.value())
 
-# -----------------------------------------------------------------------------------------------------------  
-  
-        
-    def monoCheckFilter(self, wavelength):   # Filter switching points from GUI
-        """Function to update position of first filter wheel from GUI defaults 
-        :param wavelength: Current wavelength position of monochromator
-        :type wavelength: float, required
-        ...
-        :raises LoggerError: Raises error if filter wheel commands are invalid or monochromator not connected
-        ...
-        :return: None
+    def lockinSettings(self):
+        """Function to read the Lockin parameters from GUI
+        :return: Lock-in settings
+        :rtype: LockinSettings
         """
-        if self.mono_connected:                       
-            self.p.write('?filter\r'.encode())
-            self.p.timeout = 30000
-            response = self.p.readline() 
-            
-            if (response == '1  ok\r\n'.encode()) or (response == ' 1  ok\r\n'.encode()):
-                filterNo = 1
-            elif (response == '2  ok\r\n'.encode()) or (response == ' 2  ok\r\n'.encode()):
-                filterNo = 2 
-            elif (response == '3  ok\r\n'.encode()) or (response == ' 3  ok\r\n'.encode()):
-                filterNo = 3
-            elif (response == '4  ok\r\n'.encode()) or (response == ' 4  ok\r\n'.encode()):
-                filterNo = 4 
-            elif (response == '5  ok\r\n'.encode()) or (response == ' 5  ok\r\n'.encode()):
-                filterNo = 5
-            elif (response == '6  ok\r\n'.encode()) or (response == ' 6  ok\r\n'.encode()):
-                filterNo = 6
-            else:   # Do I need this?
-                self.logger.error('Error: Filter Response')
-
-            startNM_F2 = int(self.ui.startNM_F2.value())
-            stopNM_F2 = int(self.ui.stopNM_F2.value())                
-            startNM_F3 = int(self.ui.startNM_F3.value())
-            stopNM_F3 = int(self.ui.stopNM_F3.value())
-            startNM_F4 = int(self.ui.startNM_F4.value())
-            stopNM_F4 = int(self.ui.stopNM_F4.value())
-            startNM_F5 = int(self.ui.startNM_F5.value())
-            stopNM_F5 = int(self.ui.stopNM_F5.value())            
-
-            if startNM_F2 <= wavelength < stopNM_F2: # Filter 3 [FESH0700]: from 350 - 649  -- including start, excluing end
-                shouldbeFilterNo = 2                  
-            elif startNM_F3 <= wavelength < stopNM_F3: # Filter 3 [FESH0700]: from 350 - 649  -- including start, excluing end
-                shouldbeFilterNo = 3  
-            elif startNM_F4 <= wavelength < stopNM_F4: # Filter 4 [FESH1000]: from 650 - 984  -- including start, excluding end
-                shouldbeFilterNo = 4 
-            elif startNM_F5 <= wavelength <= stopNM_F5: # Filter 5 [FELH0950]: from 985 - 1800  -- including start, including end
-                shouldbeFilterNo = 5
-            else:   
-#                shouldbeFilterNo = 2
-                self.logger.error('Error: Filter Out Of Range')
-                
-            if shouldbeFilterNo != filterNo:
-                self.chooseFilter(shouldbeFilterNo)    
-                
-                
-                # Take data and discard it, this is required to avoid kinks
-                # Poll data for 5 time constants, second parameter is poll timeout in [ms] (recomended value is 500ms) 
-                dataDict = self.daq.poll(5*self.tc,500)  # Dictionary with ['timestamp']['x']['y']['frequency']['phase']['dio']['trigger']['auxin0']['auxin1']['time']
-                                   
-            else:
-                pass
-                
-        else:
-            self.logger.error('Monochromator Not Connected') 
-    
-    
-    def monoCheckGrating(self, wavelength):   # Grating switching points from GUI
-        """Function to update monochromator grating position from GUI defaults 
-        :param wavelength: Current wavelength position of monochromator
-        :type wavelength: float, required
-        ...
-        :raises LoggerError: Raises error if grating commands are invalid or monochromator not connected
-        ...
-        :return: None
-        """   
-        if self.mono_connected:
-            self.p.write('?grating\r'.encode())
-            self.p.timeout = 30000
-            response = self.p.readline() 
-            
-            if (response == '1  ok\r\n'.encode()) or (response == ' 1  ok\r\n'.encode()):
-                gratingNo = 1
-            elif (response == '2  ok\r\n'.encode()) or (response == ' 2  ok\r\n'.encode()):
-                gratingNo = 2 
-            elif (response == '3  ok\r\n'.encode()) or (response == ' 3  ok\r\n'.encode()):
-                gratingNo = 3
-            else:   # Do I need this?
-                self.logger.error('Error: Grating Response')
-                
-            startNM_G1 = int(self.ui.startNM_G1.value())
-            stopNM_G1 = int(self.ui.stopNM_G1.value())
-            startNM_G2 = int(self.ui.startNM_G2.value())
-            stopNM_G2 = int(self.ui.stopNM_G2.value())
-            startNM_G3 = int(self.ui.startNM_G3.value())
-            stopNM_G3 = int(self.ui.stopNM_G3.value()) 
-                
-            if startNM_G1 <= wavelength < stopNM_G1: # Grating 1: from 350 - 549  -- including start, excluding end
-                shouldbeGratingNo = 1  
-            elif startNM_G2 <= wavelength < stopNM_G2: # Grating 2: from 550 - 1299  -- including start, excluding end
-                shouldbeGratingNo = 2  
-            elif startNM_G3 <= wavelength <= stopNM_G3: # Grating 3: from 1300 - 1800  -- including start, including end
-                shouldbeGratingNo = 3
-            else:   # Do I need this?
-                self.logger.error('Error: Grating Out Of Range')
-                
-            if shouldbeGratingNo != gratingNo:
-                self.chooseGrating(shouldbeGratingNo)
-                
-                # Take data and discard it, this is required to avoid kinks                
-                # Poll data for 5 time constants, second parameter is poll timeout in [ms] (recomended value is 500ms) 
-                dataDict = self.daq.poll(5*self.tc,500)  # Dictionary with ['timestamp']['x']['y']['frequency']['phase']['dio']['trigger']['auxin0']['auxin1']['time']
-   
-            else:
-                pass
-                
-        else:
-            self.logger.error('Monochromator Not Connected')
+        # AC, 50 Ohm and Diff are fixed, the 50 Ohm input of channel 2 attenuates the signal from the chopper controller as reference signal.
+        # The frequency tab for manual frequency control is currently not implemented in the GUI
+        return engine.LockinSettings(tc=self.ui.pickTC.value(), rate=self.ui.pickDTR.value(), order=self.ui.pickLPFO.value(),
+                                     input_range=2, ac=0, imp50=0, imp50_ref=1, diff=1)
 
 # -----------------------------------------------------------------------------------------------------------
 
-    #### Function to handle filter changes of Thorlabs filterwheel
+    #### Functions to read filter and grating switching points from GUI
 
 # -----------------------------------------------------------------------------------------------------------
 
-    def changeFilter(self, pos):
-        """Function to update position of second filter wheel 
-        :param pos: Target filter position, between 1-6
-        :type pos: int, required
-        ...
-        :raises LoggerError: Raises error if second filter wheel not connected
+    def gratingMap(self):
+        """Function to read the grating switching points from GUI
+        :return: Grating lookup
+        :rtype: PositionMap
+        """
+        return engine.GratingMap({1: (int(self.ui.startNM_G1.value()), int(self.ui.stopNM_G1.value())),   # Grating 1: from 350 - 534  -- including start, excluding end
+                                  2: (int(self.ui.startNM_G2.value()), int(self.ui.stopNM_G2.value())),   # Grating 2: from 535 - 1149  -- including start, excluding end
+                                  3: (int(self.ui.startNM_G3.value()), int(self.ui.stopNM_G3.value()))})  # Grating 3: from 1150 - 1800  -- including start, including end
+
+    def filterMap(self):
+        """Function to read the monochromator filter switching points from GUI
+        :return: Filter lookup
+        :rtype: PositionMap
+        """
+        return engine.FilterMap({2: (int(self.ui.startNM_F2.value()), int(self.ui.stopNM_F2.value())),
+                                 3: (int(self.ui.startNM_F3.value()), int(self.ui.stopNM_F3.value())),   # Filter 3 [FESH0700]  -- including start, excluding end
+                                 4: (int(self.ui.startNM_F4.value()), int(self.ui.stopNM_F4.value())),   # Filter 4 [FESH1000]  -- including start, excluding end
+                                 5: (int(self.ui.startNM_F5.value()), int(self.ui.stopNM_F5.value()))})  # Filter 5 [FELH0950]  -- including start, including end
+
+    def scanPlan(self, ranges, detector=None, complete=False):
+        """Function to compile a scan plan from GUI
+        :param ranges: Wavelength ranges, measured in order
+        :type ranges: list of ScanRange, required
+        :param detector: Reference detector name, None for samples
+        :type detector: str, optional
+        :param complete: Complete scan with external filters
+        :type complete: bool, optional
         ...
-        :return: Returns True if connection to second filter wheel is successful, False otherwise
+        :return: Scan plan
+        :rtype: ScanPlan
         """
-        if not self.filter_connected:
-            self.logger.error("External Filter Wheel Not Connected")
-            return False
-
-        #ans = 'ERROR'
-
-        self._sio.flush()
-        self._sio.write('pos=' + str(pos) + '\r')
-
-        # ans = self._sio.readlines(2048)
-        # regerr = re.compile("Command error.*")
-        # errors = [m.group(0) for l in ans for m in [regerr.search(l)] if m]
-        # # print 'res=',repr(res),'ans=',repr(ans),cmd
-        # if len(errors) > 0:
-        #     print(errors[0])
-        #     return False
-        # ans = self.query(cmd + '?')
-        # print 'ans=',repr(ans),cmd+'?'
-        # print(ans)
-
-        return True
-        
-# -----------------------------------------------------------------------------------------------------------        
-    
+        return engine.ScanPlan(self.ui.file.text(), self.ui.user.text(), self.ui.experiment.text(), ranges,
+                               detector=detector, complete=complete, gratings=self.gratingMap(), filters=self.filterMap(),
+                               lockin=self.lockinSettings(), speed=self.ui.pickScanSpeed.value())
+
+# -----------------------------------------------------------------------------------------------------------
+
     #### Functions to handle measurement buttons
-    
-# -----------------------------------------------------------------------------------------------------------  
+
+# -----------------------------------------------------------------------------------------------------------
 
     # Set parameters and measure Silicon reference diode
 
@@ -651,108 +395,58 @@ class MainWindow(QtWidgets.QMainWindow):
         """Function to meausure silicon reference photodiode
         :return: None
         """
-        start_si = self.ui.startNM_Si.value()
-        stop_si = self.ui.stopNM_Si.value()
-        step_si = self.ui.stepNM_Si.value()
-        amp_si = self.ui.pickAmp_Si.value()
-            
-        self.amplification = amp_si
-        self.LockinUpdateParameters()
-        self.MonoHandleSpeedButton()
-        
-        scan_list = self.createScanJob(start_si, stop_si, step_si)
-        self.HandleMeasurement(scan_list, start_si, stop_si, step_si, amp_si, 1)
-        
-        self.chooseFilter(1)        
-        self.ui.imageRef_Si.setPixmap(QtGui.QPixmap("Button_on.png"))      
-        self.logger.info('Finished Measurement')        
-    
-        
+        self.runPlan(self.siRefPlan())
+        self.ui.imageRef_Si.setPixmap(QtGui.QPixmap("Button_on.png"))
+
+    def siRefPlan(self):
+        """Function to compile the Si reference diode scan from GUI
+        :return: Scan plan
+        :rtype: ScanPlan
+        """
+        scan_range = engine.ScanRange(self.ui.startNM_Si.value(), self.ui.stopNM_Si.value(), self.ui.stepNM_Si.value(),
+                                      self.ui.pickAmp_Si.value())
+        return self.scanPlan([scan_range], detector=self.reference_detectors[1])
+
     # Set parameters and measure InGaAs reference diode
-               
+
     def MonoHandleGARefButton(self):
-        """Function to meausure silicon reference photodiode
+        """Function to meausure InGaAs reference photodiode
         :return: None
         """
-        start_ga = self.ui.startNM_GA.value()
-        stop_ga = self.ui.stopNM_GA.value()
-        step_ga = self.ui.stepNM_GA.value()
-        amp_ga = self.ui.pickAmp_GA.value()
+        self.runPlan(self.gaRefPlan())
+        self.ui.imageRef_GA.setPixmap(QtGui.QPixmap("Button_on.png"))
 
-        self.amplification = amp_ga
-        self.LockinUpdateParameters()
-        self.MonoHandleSpeedButton()
+    def gaRefPlan(self):
+        """Function to compile the InGaAs reference diode scan from GUI
+        :return: Scan plan
+        :rtype: ScanPlan
+        """
+        scan_range = engine.ScanRange(self.ui.startNM_GA.value(), self.ui.stopNM_GA.value(), self.ui.stepNM_GA.value(),
+                                      self.ui.pickAmp_GA.value())
+        return self.scanPlan([scan_range], detector=self.reference_detectors[2])
 
-        scan_list = self.createScanJob(start_ga, stop_ga, step_ga)
-        self.HandleMeasurement(scan_list, start_ga, stop_ga, step_ga, amp_ga, 2)
-        
-        self.chooseFilter(1)              
-        self.ui.imageRef_GA.setPixmap(QtGui.QPixmap("Button_on.png"))       
-        self.logger.info('Finished Measurement')  
-        
-        
     # Set parameters and measure sample
-        
+
     def MonoHandleMeasureButton(self):
         """Function to meausure samples with different wavelength ranges
         :return: None
         """
-        if self.ui.Range1.isChecked():    
-            start_r1 = self.ui.startNM_R1.value()
-            stop_r1 = self.ui.stopNM_R1.value()
-            step_r1 = self.ui.stepNM_R1.value()
-            amp_r1 = self.ui.pickAmp_R1.value()
-
-            self.amplification = amp_r1
-            self.LockinUpdateParameters()
-            self.MonoHandleSpeedButton()
-                        
-            scan_list = self.createScanJob(start_r1, stop_r1, step_r1)
-            self.HandleMeasurement(scan_list, start_r1, stop_r1, step_r1, amp_r1, 3)
-        
-        if self.ui.Range2.isChecked():         
-            start_r2 = self.ui.startNM_R2.value()
-            stop_r2 = self.ui.stopNM_R2.value()
-            step_r2 = self.ui.stepNM_R2.value()
-            amp_r2 = self.ui.pickAmp_R2.value()
-
-            self.amplification = amp_r2
-            self.LockinUpdateParameters()
-            self.MonoHandleSpeedButton()        
-            
-            scan_list = self.createScanJob(start_r2, stop_r2, step_r2)
-            self.HandleMeasurement(scan_list, start_r2, stop_r2, step_r2, amp_r2, 3)
-            
-        if self.ui.Range3.isChecked():   
-            start_r3 = self.ui.startNM_R3.value()
-            stop_r3 = self.ui.stopNM_R3.value()
-            step_r3 = self.ui.stepNM_R3.value()
-            amp_r3 = self.ui.pickAmp_R3.value()
-
-            self.amplification = amp_r3
-            self.LockinUpdateParameters()
-            self.MonoHandleSpeedButton()
-            
-            scan_list = self.createScanJob(start_r3, stop_r3, step_r3)
-            self.HandleMeasurement(scan_list, start_r3, stop_r3, step_r3, amp_r3, 3)       
-        
-        if self.ui.Range4.isChecked():   
-            start_r4 = self.ui.startNM_R4.value()
-            stop_r4 = self.ui.stopNM_R4.value()
-            step_r4 = self.ui.stepNM_R4.value()
-            amp_r4 = self.ui.pickAmp_R4.value()
-
-            self.amplification = amp_r4
-            self.LockinUpdateParameters()
-            self.MonoHandleSpeedButton()
-            
-            scan_list = self.createScanJob(start_r4, stop_r4, step_r4)
-            self.HandleMeasurement(scan_list, start_r4, stop_r4, step_r4, amp_r4, 3)
-            
-        self.chooseFilter(1)
+        self.runPlan(self.samplePlan())
         self.ui.imageMeasure.setPixmap(QtGui.QPixmap("Button_on.png"))
-        self.logger.info('Finished Measurement')
 
+    def samplePlan(self):
+        """Function to compile the sample scan of the checked ranges from GUI
+        :return: Scan plan
+        :rtype: ScanPlan
+        """
+        ranges = []
+        for n in range(1, 5):
+            if getattr(self.ui, 'Range%d' % n).isChecked():
+                ranges.append(engine.ScanRange(getattr(self.ui, 'startNM_R%d' % n).value(),
+                                               getattr(self.ui, 'stopNM_R%d' % n).value(),
+                                               getattr(self.ui, 'stepNM_R%d' % n).value(),
+                                               getattr(self.ui, 'pickAmp_R%d' % n).value()))
+        return self.scanPlan(ranges)
 
     # Set parameters for complete scan and measure sample
 
@@ -760,496 +454,182 @@ class MainWindow(QtWidgets.QMainWindow):
         """Function to meausure samples with different filters
         :return: None
         """
-        self.complete_scan = True
-
-        if self.ui.scan_noFilter.isChecked():
-
-            self.changeFilter(1)
-
-            if self.changeFilter(1):
-
-                self.filter_addition = 'no'
-
-                self.logger.info('Moving to Open Filter Position')
-
-                start_f1 = self.ui.scan_startNM_1.value()
-                stop_f1 = self.ui.scan_stopNM_1.value()
-                step_f1 = self.ui.scan_stepNM_1.value()
-                amp_f1 = self.ui.scan_pickAmp_1.value()
-
-                self.amplification = amp_f1
-                self.LockinUpdateParameters()
-                self.MonoHandleSpeedButton() 
-                
-                scan_list = self.createScanJob(start_f1, stop_f1, step_f1)
-                self.HandleMeasurement(scan_list, start_f1, stop_f1, step_f1, amp_f1, 3)
-                
-        if self.ui.scan_Filter2.isChecked():
-
-            self.changeFilter(2)
-
-            if self.changeFilter(2):
-                
-                self.filter_addition = str(int(self.ui.cuton_filter_2.value()))
+        self.runPlan(self.completePlan())
+        self.ui.imageCompleteScan_start.setPixmap(QtGui.QPixmap("Button_on.png"))
 
-                self.logger.info('Moving to %s nm Filter' % self.filter_addition)
-
-                start_f2 = self.ui.scan_startNM_2.value()
-                stop_f2 = self.ui.scan_stopNM_2.value()
-                step_f2 = self.ui.scan_stepNM_2.value()
-                amp_f2 = self.ui.scan_pickAmp_2.value()
-
-                self.amplification = amp_f2
-                self.LockinUpdateParameters()
-                self.MonoHandleSpeedButton()
-
-                scan_list = self.createScanJob(start_f2, stop_f2, step_f2)
-                self.HandleMeasurement(scan_list, start_f2, stop_f2, step_f2, amp_f2, 3)
-
-        if self.ui.scan_Filter3.isChecked():
-
-            self.changeFilter(3)
-
-            if self.changeFilter(3):
-                
-                self.filter_addition = str(int(self.ui.cuton_filter_3.value()))
-
-                self.logger.info('Moving to %s nm Filter' % self.filter_addition)
-
-                start_f3 = self.ui.scan_startNM_3.value()
-                stop_f3 = self.ui.scan_stopNM_3.value()
-                step_f3 = self.ui.scan_stepNM_3.value()
-                amp_f3 = self.ui.scan_pickAmp_3.value()
-
-                self.amplification = amp_f3
-                self.LockinUpdateParameters()
-                self.MonoHandleSpeedButton()
-
-                scan_list = self.createScanJob(start_f3, stop_f3, step_f3)
-                self.HandleMeasurement(scan_list, start_f3, stop_f3, step_f3, amp_f3, 3)
-
-        if self.ui.scan_Filter4.isChecked():
-
-            self.changeFilter(4)
-
-            if self.changeFilter(4):
-                
-                self.filter_addition = str(int(self.ui.cuton_filter_4.value()))
-
-                self.logger.info('Moving to %s nm Filter' % self.filter_addition)
-
-                start_f4 = self.ui.scan_startNM_4.value()
-                stop_f4 = self.ui.scan_stopNM_4.value()
-                step_f4 = self.ui.scan_stepNM_4.value()
-                amp_f4 = self.ui.scan_pickAmp_4.value()
-
-                self.amplification = amp_f4
-                self.LockinUpdateParameters()
-                self.MonoHandleSpeedButton()
-
-                scan_list = self.createScanJob(start_f4, stop_f4, step_f4)
-                self.HandleMeasurement(scan_list, start_f4, stop_f4, step_f4, amp_f4, 3)
-
-        if self.ui.scan_Filter5.isChecked():
-
-            self.changeFilter(5)
-
-            if self.changeFilter(5):
-
-                self.filter_addition = str(int(self.ui.cuton_filter_5.value()))
-
-                self.logger.info('Moving to %s nm Filter' % self.filter_addition)
-
-                start_f5 = self.ui.scan_startNM_5.value()
-                stop_f5 = self.ui.scan_stopNM_5.value()
-                step_f5 = self.ui.scan_stepNM_5.value()
-                amp_f5 = self.ui.scan_pickAmp_5.value()
-
-                self.amplification = amp_f5
-                self.LockinUpdateParameters()
-                self.MonoHandleSpeedButton()
-
-                scan_list = self.createScanJob(start_f5, stop_f5, step_f5)
-                self.HandleMeasurement(scan_list, start_f5, stop_f5, step_f5, amp_f5, 3)
-
-        if self.ui.scan_Filter6.isChecked():
-
-            self.changeFilter(6)
-
-            if self.changeFilter(6):
-
-                self.filter_addition = str(int(self.ui.cuton_filter_6.value()))
-
-                self.logger.info('Moving to %s nm Filter' % self.filter_addition)
+    def completePlan(self):
+        """Function to compile the complete scan of the checked filters from GUI
+        :return: Scan plan
+        :rtype: ScanPlan
+        """
+        ranges = []
+        for n in range(1, 7):
+            checkbox = self.ui.scan_noFilter if n == 1 else getattr(self.ui, 'scan_Filter%d' % n)
+            if checkbox.isChecked():
+                label = 'no' if n == 1 else str(int(getattr(self.ui, 'cuton_filter_%d' % n).value()))
+                ranges.append(engine.ScanRange(getattr(self.ui, 'scan_startNM_%d' % n).value(),
+                                               getattr(self.ui, 'scan_stopNM_%d' % n).value(),
+                                               getattr(self.ui, 'scan_stepNM_%d' % n).value(),
+                                               getattr(self.ui, 'scan_pickAmp_%d' % n).value(),
+                                               external_filter=n, filter_label=label))
+        return self.scanPlan(ranges, complete=True)
+
+    def runPlan(self, plan):
+        """Function to run a scan plan on the scan engine
+        :param plan: Scan plan
+        :type plan: ScanPlan, required
+        ...
+        :return: DataFrames of the measured ranges
+        :rtype: list of DataFrame
+        """
+        if self.scanRunning():
+            return []
+        self.live_plot.clear()
+        self.ui.imageStop.setPixmap(QtGui.QPixmap("Button_off.png"))
+        self.setRunning(True)
+        try:
+            return self.engine.run(plan)
+        finally:
+            self.setRunning(False)
 
-                start_f6 = self.ui.scan_startNM_6.value()
-                stop_f6 = self.ui.scan_stopNM_6.value()
-                step_f6 = self.ui.scan_stepNM_6.value()
-                amp_f6 = self.ui.scan_pickAmp_6.value()
+    def scanRunning(self):
+        """Function to check for a running scan before starting another one
+        :return: True if a scan or the queue is running
+        :rtype: bool
+        """
+        # The live plot and queue updates process events during a scan, so buttons can be clicked while it runs
+        if self.running:
+            self.logger.error('Scan Already Running')
+            return True
+        return False
+
+    def setRunning(self, running):
+        """Function to disable the buttons that start scans while a scan or the queue runs
+        :param running: True while a scan runs
+        :type running: bool, required
+        ...
+        :return: None
+        """
+        self.running = running
+        for button in (self.ui.measureButtonRef_Si, self.ui.measureButtonRef_GA, self.ui.measureButtonDev,
+                       self.ui.completeScanButton_start, self.resume_action):
+            button.setEnabled(not running)
+        self.queue_panel.setRunning(running)
+
+    def resumeScan(self):
+        """Function to continue the interrupted scan of the data folder from its checkpoint
+        :return: None
+        """
+        if self.scanRunning():
+            return
+        if not self.engine.connected():
+            self.logger.error('Instruments Not Connected')
+            return
+        state = self.engine.loadCheckpoint()
+        if state is None:
+            self.logger.info('No Interrupted Scan Found')
+            return
+        if (state.get('context') or {}).get('job') is not None:
+            self.logger.info('Interrupted Scan Belongs To Job %d, Run The Queue To Resume It' % state['context']['job'])
+            return
+        self.live_plot.clear()
+        self.ui.imageStop.setPixmap(QtGui.QPixmap("Button_off.png"))
+        self.engine.context = None
+        self.setRunning(True)
+        try:
+            self.engine.resume(state)
+        finally:
+            self.setRunning(False)
 
-                self.amplification = amp_f6
-                self.LockinUpdateParameters()
-                self.MonoHandleSpeedButton()
+# -----------------------------------------------------------------------------------------------------------
 
-                scan_list = self.createScanJob(start_f6, stop_f6, step_f6)
-                self.HandleMeasurement(scan_list, start_f6, stop_f6, step_f6, amp_f6, 3)
+    #### Functions to handle the scan queue
 
-        self.changeFilter(1) 
-        self.logger.info('Moving to open filter')               
-        self.chooseFilter(1)
-        self.complete_scan = False   
-        self.ui.imageCompleteScan_start.setPixmap(QtGui.QPixmap("Button_on.png"))     
-        self.logger.info('Finished Measurement') 
+# -----------------------------------------------------------------------------------------------------------
 
-    # General function to create scanning list
-        
-    def createScanJob(self, start, stop, step):
-        """Function to compile scan parameters 
-        :param start: Wavelength start value
-        :type start: float, required
-        :param stop: Wavelength stop value
-        :type stop: float, required
-        :param step: Wavelength step value
-        :type step: float, required
+    def queueScan(self, kind):
+        """Function to queue the scan set up in the measurement tabs
+        :param kind: 'Si', 'InGaAs', 'sample' or 'complete'
+        :type kind: str, required
         ...
-        :return: List of integer wavelength values
+        :return: None
         """
-        scan_list = []       
-        number = int((stop-start)/step)
-        
-        for n in range(-1, number + 1): # -1 to start from before the beginning, +1 to include the last iteration of 'number', [and +2 to go above stop (this can be changed later])
-            wavelength = start + n*step
-            scan_list.append(wavelength)
-            
-        return scan_list
-           
-    # Scan through wavelength range   ### Not being used currently
-           
-    def Scan(self, scan_list):
-        """Function to send commmands to monochromator and move through wavelength list
-        :param scan_list: List of wavelength values to scan
-        :type scan_list: list of ints, required
-        ...
-        :raises LoggerError: Raises error if second filter wheel not connected
+        plans = {'Si': self.siRefPlan, 'InGaAs': self.gaRefPlan, 'sample': self.samplePlan, 'complete': self.completePlan}
+        self.queue_panel.addJob(recipe.from_plan(plans[kind](), self.save_path))
+
+    def runQueue(self):
+        """Function to run the queued jobs back to back
+        :return: None
+        """
+        if self.scanRunning():
+            return
+        if not self.engine.connected():
+            self.logger.error('Instruments Not Connected')
+            return
+        self.ui.imageStop.setPixmap(QtGui.QPixmap("Button_off.png"))
+        self.setRunning(True)
+        try:
+            jobqueue.run_queue(self.queue, self.engine, self.showJob)
+        finally:
+            self.setRunning(False)
+        self.queue_panel.refresh()
+
+    def showJob(self, job_id):
+        """Function to update the queue tab and clear the live plot when a job starts
+        :param job_id: Job id
+        :type job_id: int, required
         ...
         :return: None
         """
-        if self.mono_connected:
-            for element in scan_list:
-                self.p.write('{:.2f} GOTO\r'.format(element).encode())
-#                self.p.write('{:.2f} NM\r'.format(stop).encode())
-                self.waitForOK()
-                
-        else:
-            self.logger.error('Monochromator Not Connected')
+        if self.queue.get(job_id)['status'] == 'running':
+            self.live_plot.clear()
+        self.queue_panel.refresh()
+        QtWidgets.QApplication.processEvents()
 
-        
-# -----------------------------------------------------------------------------------------------------------        
-    
-    #### Functions to handle measurement
+# -----------------------------------------------------------------------------------------------------------
 
-# -----------------------------------------------------------------------------------------------------------       
-        
-    # Measure LOCKIN response    
-     
-    def HandleMeasurement(self, scan_list, start, stop, step, amp, number):  
-        """Function to prepare sample measurement
+    def set_up_plot(self, scan_list, eqe=False):
+        """Function to set up the live plot for a new range
         :param scan_list: List of wavelength values to scan
         :type scan_list: list of ints, required
-        :param start: Wavelength start value
-        :type start: float, required
-        :param stop: Wavelength stop value
-        :type stop: float, required
-        :param step: Wavelength step value
-        :type step: float, required
-        :param amp: Pre-amplifier amplification value
-        :type amp: float, required
-        :param number: Specifier to decide if power value is calculated (1) or not (0)
-        :type number: int, required
+        :param eqe: Add a panel for the live EQE
+        :type eqe: bool, optional
         ...
         :return: None
-        """      
-        if self.mono_connected and self.lockin_connected and self.filter_connected:   
-            # Assign user, expriment and file name for current measurement
-            userName = self.ui.user.text()
-            experimentName = self.ui.experiment.text()
-            
-            start_no = str(int(start))
-            stop_no = str(int(stop))
-            step_no = str(int(step))
-            amp_no = str(int(amp))
-            if number == 1:
-#                name = 'Si_ref_diode'
-                name = self.ui.file.text()  
-            if number == 2:
-#                name = 'InGaAs_ref_diode'
-                name = self.ui.file.text()  
-            if number == 3:
-                name = self.ui.file.text()
-
-            if not self.complete_scan: # If not a complete scan is taken
-                fileName = name + '_(' + start_no + '-' + stop_no + 'nm_' + step_no + 'nm_' + amp_no + 'x)'
-            elif self.complete_scan:
-                fileName = name + '_' + self.filter_addition + 'Filter' + '_(' + start_no + '-' + stop_no + 'nm_' + step_no + 'nm_' + amp_no + 'x)' 
-        
-            #Set up path to save data
-            self.path =f'{self.save_path}/{userName}/{experimentName}'
-            self.logger.info(f'Saving data to: {self.path}')
-            if not os.path.exists(self.path):
-                os.makedirs(self.path)
-            else:
-                pass       
-            self.naming(fileName, self.path, 2)  # This function defines a variable called self.file_name
-            
-            self.measure(scan_list, number)            
-         
-         
-    def measure(self, scan_list, number):     
-        """Function to perform sample measurement
-        :param scan_list: List of wavelength values to scan
-        :type scan_list: list of ints, required
-        :param number: Specifier to decide if power value is calculated (1) or not (0)
-        :type number: int, required
+        """
+        if not self.do_plot:
+            return
+        self.live_plot.start(eqe, (min(scan_list), max(scan_list)))
+        self.ui.tabs.setCurrentWidget(self.plot_tab)
+        if self.overlays.folder != self.engine.path:
+            self.overlays.listScans(self.engine.path, self.engine.catalog)
+        self.ax1, self.ax2, self.ax3 = self.live_plot.axes[:3]
+
+    def showPoint(self, point):
+        """Function to pass a measured point to the live plot
+        :param point: Dictionary with the 'Wavelength', 'R', 'Log R', 'Phase' and optionally 'EQE' of the point
+        :type point: dict, required
         ...
         :return: None
         """
-#        columns = ['Wavelength', 'Mean Current', 'Amplification', 'Mean R', 'Log Mean R', 'Mean RMS', 'Mean X', 'Mean Y', 'Mean Frequency', 'Mean Phase']
-        columns = ['Wavelength', 'Mean Current', 'Amplification', 'Mean R', 'Mean Frequency', 'Mean Phase']    
-        
-        self.measuring = True 
-        self.ui.imageStop.setPixmap(QtGui.QPixmap("Button_off.png"))
-        
-        # Set up plot style                
         if self.do_plot:
-#            plt.close()
-            self.set_up_plot()
-            
-        time.sleep(1)
-
-        # Set up empty lists for measurements
-        plot_list_x = []
-        plot_list_y = []
-        plot_log_list_y = []
-        plot_list_phase = []
-        data_list = []
-        data_df = pd.DataFrame(data_list, columns = columns) 
-                    
-        # Subscribe to scope
-        self.path0 = '/' + self.device + '/demods/', self.c,'/sample'
-        self.daq.subscribe(self.path0) 
-        
-        count = 0
-        
-#        self.chooseFilter(2)
-        
-        while len(scan_list)>0:            
-            if self.measuring:                
-                wavelength = scan_list[0]
-
-                self.monoCheckFilter(wavelength)
-                self.monoCheckGrating(wavelength)
-                
-                self.chooseWavelength(wavelength)
-                
-                # Poll data for 5 time constants, second parameter is poll timeout in [ms] (recomended value is 500ms) 
-                dataDict = self.daq.poll(5*self.tc,500)  # Dictionary with ['timestamp']['x']['y']['frequency']['phase']['dio']['trigger']['auxin0']['auxin1']['time']
-#                print(dataDict[self.device]['demods'][self.c]['sample']['timestamp'])
-                
-            
-                # Recreate data
-                if self.device in dataDict:
-                    if dataDict[self.device]['demods'][self.c]['sample']['time']['dataloss']:
-                        self.logger.info('Sample Loss Detected')
-                    else:
-                        if count>0: # Cut off the first measurement before the start to cut off the initial spike in the spectrum                         
-#                           if self.imp50==0:     #### FIX THIS TO HANDLE IMP 50
-#                                e = amp_coeff*amplitude/sqrt(2)
-#                           elif self.imp50==1:  # If 50 Ohm impedance is enabled, the signal is cut in half
-#                                e = 0.5*amp_coeff*amplitude/sqrt(2) 
-                            
-                            data = dataDict[self.device]['demods'][self.c]['sample']
-                            rdata = sqrt(data['x']**2+data['y']**2)
-                            rms = sqrt(0.5*(data['x']**2+data['y']**2))
-                            current = rdata/self.amplification
-                            
-                            mean_curr = mean(current)
-                            mean_r = mean(rdata)
-                            log_mean_r = log(mean_r)
-                            mean_rms = mean(rms)
-                            mean_x = mean(data['x'])
-                            mean_y = mean(data['y'])
-                            mean_freq = mean(data['frequency'])
-                            mean_phase = mean(data['phase'])
-                                                                                         
-                            
-#                            scanValues = [wavelength, mean_curr, self.amplification, mean_r, log_mean_r, mean_rms, mean_x, mean_y, mean_freq, mean_phase]
-                            scanValues = [wavelength, mean_curr, self.amplification, mean_r, mean_freq, mean_phase]
-                           
-                            plot_list_x.append(wavelength)
-                            plot_list_y.append(mean_r)
-                            plot_log_list_y.append(log_mean_r)
-                            plot_list_phase.append(mean_phase)
-        
-                            data_list.append(scanValues)
-                            
-                            data_df = pd.DataFrame(data_list, columns = columns)
-                            
-                            if number == 1:
-                                self.calculatePower(data_df, self.Si_cal)
-                            elif number == 2:
-                                self.calculatePower(data_df, self.InGaAs_cal)
-                            else: #### CHECK THAT THIS WORKS!!!
-                                pass
-                            
-                            data_file = data_df.to_csv(os.path.join(self.path, self.file_name))
-                            
-                            if self.do_plot:
-                                self.ax1.plot(plot_list_x, plot_list_y, color = '#000000')
-                                self.ax2.plot(plot_list_x, plot_log_list_y, color = '#000000')
-                                self.ax3.plot(plot_list_x, plot_list_phase, color = '#000000')
-                                plt.draw()
-                                plt.pause(0.0001)
-                                    
-                del scan_list[0]
-                count+=1  
-                
-            else:
-                break
-        
-        # Unsubscribe to scope 
-        self.daq.unsubscribe(self.path0)        
+            self.pointMeasured.emit(point)
+        QtWidgets.QApplication.processEvents() # Lets the plot timer and buttons run, the canvas repaints at its own rate
 
-# -----------------------------------------------------------------------------------------------------------   
-
-    # Function to calculate the reference power
-
-    def calculatePower(self, ref_df, cal_df):
-        """Function to calculate power
-        :param ref_df: DataFrame of reference measurements
-        :type ref_df: DataFrame, required
-        :param cal_df: DataFrame of reference calibration measurements
-        :type cal_df: DataFrame, required
-        ...
-        :return: DataFrame of reference diode measurements incl. power
-        :rtype: DataFrame
-        """        
-        cal_wave_dict = {} # Create an empty dictionary
-        power = [] # Create an empty list
-            
-        for x in range(len(cal_df['Wavelength [nm]'])): # Iterate through columns of calibration file
-            cal_wave_dict[cal_df['Wavelength [nm]'][x]] = cal_df['Responsivity [A/W]'][x] # Add wavelength and corresponding responsivity to dictionary
-
-
-        for y in range(len(ref_df['Wavelength'])): # Iterate through columns of reference file
-#            print(ref_df['Wavelength'][y])
-            if ref_df['Wavelength'][y] in cal_wave_dict.keys(): # Check if reference wavelength is in calibraton file
-                power.append(float(ref_df['Mean Current'][y]) / float(cal_wave_dict[ref_df['Wavelength'][y]])) # Add power to the list
-            else: # If reference wavelength is not in calibration file
-                resp_int = self.interpolate(ref_df['Wavelength'][y], cal_df['Wavelength [nm]'], cal_df['Responsivity [A/W]']) # Interpolate responsivity
-                power.append(float(ref_df['Mean Current'][y]) / float(resp_int)) # Add power to the list                
-                
-        ref_df['Power'] = power # Create new column in reference file
-        
-        return ref_df['Power']        
-    
-    # Function to interpolate values    
-        
-    def interpolate(self, num, x, y):     
-        f = interp1d(x, y)
-        return f(num)
-        
-# -----------------------------------------------------------------------------------------------------------   
-            
-    def set_up_plot(self): 
-        """Function to set up plot
-        :return: None
-        """               
-        style.use('ggplot')
-        fig1 = plt.figure()
-                    
-        self.ax1 = fig1.add_subplot(3,1,1)
-#        plt.xlabel('Time (s)', fontsize=17, fontweight='medium')
-        plt.ylabel('R component (V)', fontsize=17, fontweight='medium')              
-        plt.grid(True)
-#        plt.box()
-        plt.title('Demodulator data', fontsize=17, fontweight='medium')
-        plt.tick_params(labelsize=14)
-        plt.minorticks_on()
-        plt.rcParams['figure.facecolor']='white'
-        plt.rcParams['figure.edgecolor']='white'
-        plt.tick_params(labelsize=15, direction='in', axis='both', which='major', length=8, width=2)
-        plt.tick_params(labelsize=15, direction='in', axis='both', which='minor', length=4, width=2)
-
-        self.ax2 = fig1.add_subplot(3,1,2)
-#        plt.xlabel('Time (s)', fontsize=17, fontweight='medium')
-        plt.ylabel('Log(R)', fontsize=17, fontweight='medium')              
-        plt.grid(True)
-#        plt.box()
-        plt.tick_params(labelsize=14)
-        plt.minorticks_on()
-        plt.rcParams['figure.facecolor']='white'
-        plt.rcParams['figure.edgecolor']='white'
-        plt.tick_params(labelsize=15, direction='in', axis='both', which='major', length=8, width=2)
-        plt.tick_params(labelsize=15, direction='in', axis='both', which='minor', length=4, width=2)
-        
-        self.ax3 = fig1.add_subplot(3,1,3)
-        plt.xlabel('Wavelength [nm]', fontsize=17, fontweight='medium')
-        plt.ylabel('Phase', fontsize=17, fontweight='medium') 
-        plt.grid(True)
-#        plt.box()
-#        plt.title('Demodulator data', fontsize=17, fontweight='medium')
-        plt.tick_params(labelsize=14)
-        plt.minorticks_on()
-        plt.rcParams['figure.facecolor']='white'
-        plt.rcParams['figure.edgecolor']='white'
-        plt.tick_params(labelsize=15, direction='in', axis='both', which='major', length=8, width=2)
-        plt.tick_params(labelsize=15, direction='in', axis='both', which='minor', length=4, width=2)
-        
-#        plt.rcParams['font.family']='sans-serif'
-#        plt.rcParams['font.sans-serif']='Times'   
-        
-#        plt.show()
+# -----------------------------------------------------------------------------------------------------------
 
-# -----------------------------------------------------------------------------------------------------------   
-        
-    def naming(self, file_name, path_name, num):
-        """Function to compile filename
-        :param file_name: File name
-        :type file_name: str, required
-        :param path_name: Path name
-        :type path_name: str, required
-        :param num: Filter number
-        :type num: str, required
-        ...
-        :return: None
-        """        
-        name = os.path.join(path_name, file_name)
-        exists = os.path.exists(name)
-        
-        if exists:
-            if num ==2:
-                filename = file_name + '_%d' % num
-            else:
-                filename = file_name[:-1] + str(num)
-            num += 1
-            self.naming(filename, path_name, num)
-        else:
-            self.file_name = file_name
-
-# -----------------------------------------------------------------------------------------------------------   
-        
     def HandleStopButton(self):
         """Function to stop measurement
         :return: None
         """
-        self.measuring = False
+        self.engine.stop()
         self.ui.imageStop.setPixmap(QtGui.QPixmap("Button_on.png"))
 
     def HandleStopCompleteScanButton(self):
         """Function to stop multi-filter measurement
         :return: None
         """
-        self.measuring = False
+        self.engine.stop()
         self.ui.imageCompleteScan_stop.setPixmap(QtGui.QPixmap("Button_on.png"))
 
 # -----------------------------------------------------------------------------------------------------------
@@ -1258,30 +638,19 @@ class MainWindow(QtWidgets.QMainWindow):
         """Function to set up logger
         :return: Returns logger
         """
-        logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)
-        formatter = logging.Formatter(fmt="%(asctime)s %(levelname)s %(name)s: %(message)s",
-                                      datefmt="%Y-%m-%d - %H:%M:%S")
-        console = logging.StreamHandler(sys.stdout)
-        console.setLevel(logging.DEBUG)
-        console.setFormatter(formatter)
-    
-#        logfile = logging.FileHandler('run.log', 'w')
-#        logfile.setLevel(logging.DEBUG)
-#        logfile.setFormatter(formatter)
-    
-        logger.addHandler(console)
-#        logger.addHandler(logfile)
-    
-        return logger
+        # Console output is written by a background thread and only set up once, the event log of each run is
+        # written to the _logs folder of the data folder
+        return eventlog.setup_console(logging.DEBUG)
 
 # -----------------------------------------------------------------------------------------------------------
         
 def main():
 
   app = QtWidgets.QApplication(sys.argv)
-  monoUI = MainWindow()
-  monoUI.show()
+  with startup.phase('window'):
+      monoUI = MainWindow()
+  with startup.phase('show'):
+      monoUI.show()
   sys.exit(app.exec_())
 
 if __name__ == "__main__": 
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Allocation of integration time per wavelength from pilot measurements
+
+The standard error of a point averaged over a window T is noise/sqrt(T), where noise is the
+noise density estimated from a short pilot measurement. To reach the same signal-to-noise
+ratio everywhere, weak points therefore need a window proportional to (noise/signal)^2.
+"""
+
+import numpy as np
+
+
+def allocate_windows(signal, noise, budget=None, target_snr=None, overhead=0.0, min_window=0.0, max_window=np.inf):
+    """Function to allocate the measurement window of each point
+    :param signal: Signal estimate of each point from the pilot measurement
+    :type signal: array, required
+    :param noise: Noise density of each point [signal unit * sqrt(s)]
+    :type noise: array, required
+    :param budget: Total time for the scan [s], including the overhead
+    :type budget: float, optional
+    :param target_snr: Target signal-to-noise ratio, either a single value or one per point
+    :type target_snr: float or array, optional
+    :param overhead: Time per point spent outside the measurement window, e.g. moving and settling [s]
+    :type overhead: float, optional
+    :param min_window: Shortest allowed measurement window [s]
+    :type min_window: float, optional
+    :param max_window: Longest allowed measurement window [s]
+    :type max_window: float, optional
+    ...
+    :raises ValueError: Raises error if neither or both of budget and target_snr are given
+    ...
+    :return: Measurement window of each point [s]
+    :rtype: array
+    """
+    if (budget is None) == (target_snr is None):
+        raise ValueError('Specify either a time budget or a target SNR')
+
+    signal = np.abs(np.asarray(signal, dtype=float))
+    noise = np.asarray(noise, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = (noise / signal)**2   # Window per unit SNR^2
+    weight[~np.isfinite(weight)] = np.inf   # Points without measurable signal get the longest window
+
+    if target_snr is not None:
+        with np.errstate(invalid='ignore'):
+            windows = np.broadcast_to(np.asarray(target_snr, dtype=float)**2, weight.shape) * weight
+        return np.clip(np.nan_to_num(windows, nan=max_window), min_window, max_window)
+
+    available = budget - overhead * weight.size
+    if available <= min_window * weight.size:
+        return np.full(weight.shape, float(min_window))
+    if available >= max_window * weight.size:
+        return np.full(weight.shape, float(max_window))
+
+    # Equalise the SNR: find the common scale for which the clipped windows fill the budget
+    def total(scale):
+        with np.errstate(invalid='ignore'):
+            return np.clip(np.nan_to_num(scale * weight, nan=0.0), min_window, max_window)
+
+    finite = weight[np.isfinite(weight) & (weight > 0)]
+    low = 0.0
+    high = available / finite.sum() if finite.size else 1.0
+    while total(high).sum() < available:
+        high *= 2
+    for _ in range(100):
+        middle = 0.5 * (low + high)
+        if total(middle).sum() < available:
+            low = middle
+        else:
+            high = middle
+    return total(high)
+
+
+def predict_duration(windows, overhead):
+    """Function to predict the duration of a scan
+    :param windows: Measurement window of each remaining point [s]
+    :type windows: array, required
+    :param overhead: Time per point spent outside the measurement window [s]
+    :type overhead: float, required
+    ...
+    :return: Predicted duration [s]
+    :rtype: float
+    """
+    return float(np.sum(windows) + overhead * len(windows))
+
+
+def format_duration(seconds):
+    """Function to format a duration as h:mm:ss
+    :param seconds: Duration [s]
+    :type seconds: float, required
+    ...
+    :return: Formatted duration
+    :rtype: str
+    """
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Raw demodulator scope
+
+The scope tab reads the last seconds of the ring buffer written by the acquisition at a capped rate
+and marks monochromator moves, discarded settling samples and measurement windows on the timeline.
+"""
+
+import numpy as np
+from matplotlib import style
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+from PyQt5 import QtCore, QtWidgets
+
+import decimation
+
+MARKERS = {'motion': ('#1f77b4', 'Mono motion'),
+           'discard': ('#ff7f0e', 'Settling, discarded'),
+           'window': ('#2ca02c', 'Measurement window'),
+           'dataloss': ('#d62728', 'Sample loss')}
+
+
+class ScopeView(QtWidgets.QWidget):
+    """Class of the scope tab
+    :param buffer: Ring buffer written by the acquisition
+    :type buffer: RingBuffer, required
+    :param seconds: Displayed time span [s]
+    :type seconds: float, optional
+    :param rate: Maximum refresh rate [Hz]
+    :type rate: float, optional
+    """
+
+    def __init__(self, buffer, seconds=30, rate=5, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.buffer = buffer
+        self.seconds = seconds
+        self.shown = None
+
+        self.figure = Figure(facecolor='white', edgecolor='white')
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(NavigationToolbar2QT(self.canvas, self))
+        layout.addWidget(self.canvas)
+
+        with style.context('ggplot'):
+            self.axes = [self.figure.add_subplot(3, 1, index+1) for index in range(3)]
+        for ax, label in zip(self.axes, ('R (V)', 'Phase', 'Frequency (Hz)')):
+            ax.set_ylabel(label, fontsize=12, fontweight='medium')
+            ax.grid(True)
+        self.axes[0].set_title('Raw demodulator samples', fontsize=12, fontweight='medium')
+        self.axes[-1].set_xlabel('Time (s)', fontsize=12, fontweight='medium')
+        self.lines = [ax.plot([], [], color='#000000', linewidth=0.8)[0] for ax in self.axes]
+        self.spans = []
+        self.axes[0].legend(handles=[Patch(color=color, alpha=0.2, label=label) for color, label in MARKERS.values()],
+                            loc='upper left', fontsize=8)
+        self.figure.tight_layout()
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(int(1000/rate))
+
+    def refresh(self):
+        """Function to redraw the scope if new samples arrived, called by the timer
+        :return: None
+        """
+        if not self.isVisible() or self.buffer.written == self.shown:
+            return
+        self.shown = self.buffer.written
+
+        block = self.buffer.latest(self.seconds)
+        if block.shape[1] == 0:
+            return
+        now = block[0, -1]
+        times = block[0] - now
+        r = np.sqrt(block[1]**2 + block[2]**2)
+
+        width = max(self.canvas.width(), 200)
+        for ax, line, values in zip(self.axes, self.lines, (r, block[4], block[3])):
+            line.set_data(*decimation.decimate(times, values, width))
+            ax.set_xlim(-self.seconds, 0)
+            low, high = np.nanmin(values), np.nanmax(values)
+            margin = 0.1*(high - low) or 0.1*abs(high) or 1
+            ax.set_ylim(low - margin, high + margin)
+
+        for span in self.spans:
+            span.remove()
+        self.spans = []
+        for kind, start, stop in list(self.buffer.markers):
+            if stop - now < -self.seconds:
+                continue
+            color = MARKERS[kind][0]
+            for ax in self.axes:
+                self.spans.append(ax.axvspan(start - now, max(stop - now, start - now + 0.01), color=color, alpha=0.2, linewidth=0))
+
+        self.canvas.draw_idle()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Settling time model of the lock-in low-pass filter
+
+The demodulator low-pass filter of order n is a cascade of n identical RC stages with time
+constant tc. Its step response after a time t is
+
+    1 - exp(-t/tc) * sum_{k=0}^{n-1} (t/tc)^k / k!
+
+so the wait needed for a given settling accuracy depends strongly on the filter order
+(e.g. 4.6 tc for 99% with a 1st order filter, but 10.0 tc with a 4th order filter).
+"""
+
+import functools
+import math
+
+
+def step_response(multiple, order):
+    """Function to calculate the step response of the low-pass filter
+    :param multiple: Time since the step in units of the time constant
+    :type multiple: float, required
+    :param order: Low-pass filter order
+    :type order: int, required
+    ...
+    :return: Settled fraction between 0 and 1
+    :rtype: float
+    """
+    if multiple <= 0:
+        return 0.0
+    term = 1.0
+    total = 1.0
+    for k in range(1, int(order)):
+        term *= multiple / k
+        total += term
+    return 1.0 - math.exp(-multiple) * total
+
+
+@functools.lru_cache(maxsize=64) # Called several times per point with the same settings
+def settle_multiple(order, accuracy=0.99):
+    """Function to calculate the minimum wait in time constants to reach the settling accuracy
+    :param order: Low-pass filter order, between 1 and 8
+    :type order: int, required
+    :param accuracy: Settled fraction to reach, e.g. 0.99 or 0.999
+    :type accuracy: float, optional
+    ...
+    :raises ValueError: Raises error if the order or accuracy is invalid
+    ...
+    :return: Wait in units of the time constant
+    :rtype: float
+    """
+    order = int(order)
+    if order < 1:
+        raise ValueError('Filter order must be at least 1')
+    if not 0 < accuracy < 1:
+        raise ValueError('Settling accuracy must be between 0 and 1')
+
+    # The step response increases monotonically, so bisect for the crossing point
+    low, high = 0.0, 1.0
+    while step_response(high, order) < accuracy:
+        high *= 2
+    for _ in range(60):
+        middle = 0.5 * (low + high)
+        if step_response(middle, order) < accuracy:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def settle_time(tc, order, accuracy=0.99):
+    """Function to calculate the minimum settling time of the low-pass filter
+    :param tc: Time constant [s]
+    :type tc: float, required
+    :param order: Low-pass filter order
+    :type order: int, required
+    :param accuracy: Settled fraction to reach, e.g. 0.99 or 0.999
+    :type accuracy: float, optional
+    ...
+    :return: Settling time [s]
+    :rtype: float
+    """
+    return tc * settle_multiple(order, accuracy)
+
+
+def noise_bandwidth(tc, order):
+    """Function to calculate the equivalent noise bandwidth of the low-pass filter
+    :param tc: Time constant [s]
+    :type tc: float, required
+    :param order: Low-pass filter order
+    :type order: int, required
+    ...
+    :return: Equivalent noise bandwidth [Hz]
+    :rtype: float
+    """
+    order = int(order)
+    return math.gamma(order - 0.5) / (4 * math.sqrt(math.pi) * math.gamma(order) * tc)
+
+
+def correlation_time(tc, order):
+    """Function to calculate the correlation time of the filtered noise
+    :param tc: Time constant [s]
+    :type tc: float, required
+    :param order: Low-pass filter order
+    :type order: int, required
+    ...
+    :return: Correlation time [s]. Averaging the filter output over a window T >> tc reduces the
+             noise standard deviation by sqrt(correlation time / T).
+    :rtype: float
+    """
+    return 1 / (2 * noise_bandwidth(tc, order))
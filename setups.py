@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Several independent setups driven from one process
+
+Each setup has its own instruments, scan engine, scan queue, data folder, event log and live
+metrics, and runs its queue on its own worker thread, so that several benches are controlled
+from one PC and monitored from one metrics server. The workers spend nearly all of their time
+waiting for serial responses, Lock-in polls and settling, and these waits release the GIL;
+the processing of a point takes a few milliseconds of Python. Workers therefore do not slow
+each other down, which the benchmark checks on simulated instruments.
+
+Setups file (YAML or JSON):
+
+    metrics_port: 8765
+    setups:
+      - name: bench1
+        save_path: /data/bench1
+        queue: queue_bench1.sqlite
+        calibration_path: calibrations
+        timing_path: /data/bench1    # Folder of the timing log of the bench, the data folder by default
+        connections: {mono: /dev/ttyUSB1, filter_wheel: /dev/ttyUSB0, lockin: {host: localhost, port: 8005, channel: 1}}
+      - name: bench2
+        ...
+
+Jobs are added to the queue of a setup with python jobqueue.py add RECIPE --queue QUEUE_FILE.
+
+Usage: python setups.py run SETUPS_FILE [--metrics-port PORT]
+       python setups.py benchmark RECIPE [--setups 1 2 4] [--speed 50]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import clocks
+import jobqueue
+import metrics
+import recipe as recipes
+
+
+class Setup(object):
+    """Class of one setup, running the jobs of its queue on a worker thread
+    :param name: Name of the setup
+    :type name: str, required
+    :param scan: Scan engine with the instruments of the setup
+    :type scan: ScanEngine, required
+    :param queue_path: Queue file of the setup
+    :type queue_path: str, required
+    """
+
+    def __init__(self, name, scan, queue_path):
+        self.name = name
+        self.scan = scan
+        self.queue_path = queue_path
+        self.logger = logging.getLogger(__name__)
+        self.scan.metrics = metrics.ScanMetrics(name)
+        self.thread = None
+        self.finished = 0 # Jobs finished by the last run
+        self.elapsed = None # Wall time of the last run after connecting [s]
+
+    def start(self):
+        """Function to run the pending jobs of the queue on the worker thread
+        :return: False if the worker is still running
+        :rtype: bool
+        """
+        if self.running():
+            return False
+        self.thread = threading.Thread(target=self.work, name=self.name, daemon=True)
+        self.thread.start()
+        return True
+
+    def work(self):
+        # The instruments connect in parallel, and the SQLite connections of the queue, catalog and timing log
+        # are opened by the worker thread that uses them
+        for instrument in (self.scan.lockin, self.scan.mono, self.scan.wheel):
+            if not instrument.connected:
+                instrument.connect()
+        if not self.scan.connected():
+            self.logger.error('Setup %s: Instruments Not Connected' % self.name)
+            return
+
+        queue = jobqueue.JobQueue(self.queue_path, self.scan.timingFolder())
+        start = time.perf_counter()
+        try:
+            self.finished = jobqueue.run_queue(queue, self.scan, save_path=self.scan.save_path)
+        except Exception as ex:
+            self.logger.exception('Setup %s Failed: %s' % (self.name, ex))
+        finally:
+            self.elapsed = time.perf_counter() - start
+            queue.close()
+            self.scan.release()
+        self.logger.info('Setup %s: %d Jobs Finished' % (self.name, self.finished))
+
+    def stop(self):
+        """Function to stop the running job after the current point
+        :return: None
+        """
+        self.scan.stop()
+
+    def running(self):
+        """Function to check whether the worker is running
+        :return: True if the worker is running
+        :rtype: bool
+        """
+        return self.thread is not None and self.thread.is_alive()
+
+    def join(self, timeout=None):
+        """Function to wait for the worker
+        :param timeout: Longest wait [s]
+        :type timeout: float, optional
+        ...
+        :return: None
+        """
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+class Setups(object):
+    """Class of the setups of the process and their metrics server
+    """
+
+    def __init__(self):
+        self.setups = {}
+        self.server = None
+
+    def add(self, setup):
+        """Function to add a setup
+        :param setup: Setup with a unique name
+        :type setup: Setup, required
+        ...
+        :raises ValueError: Raises error if the name is taken
+        ...
+        :return: None
+        """
+        if setup.name in self.setups:
+            raise ValueError('Setup %s exists' % setup.name)
+        self.setups[setup.name] = setup
+        if self.server is not None:
+            self.server.add(setup.scan.metrics)
+
+    def serve(self, port=metrics.PORT, host='127.0.0.1'):
+        """Function to serve the live metrics of all setups
+        :param port: Port, 0 for any free port
+        :type port: int, optional
+        :param host: Address to listen on
+        :type host: str, optional
+        ...
+        :return: True if the server is listening
+        :rtype: bool
+        """
+        self.server = metrics.MetricsServer({name: setup.scan.metrics for name, setup in self.setups.items()}, host, port)
+        return self.server.start()
+
+    def start(self):
+        """Function to start the workers of all setups
+        :return: None
+        """
+        for setup in self.setups.values():
+            setup.start()
+
+    def stop(self):
+        """Function to stop all setups after their current point
+        :return: None
+        """
+        for setup in self.setups.values():
+            setup.stop()
+
+    def join(self):
+        """Function to wait for the workers of all setups
+        :return: None
+        """
+        # Short waits, so that the main thread still handles Ctrl+C
+        while any(setup.running() for setup in self.setups.values()):
+            for setup in self.setups.values():
+                setup.join(0.5)
+
+    def close(self):
+        """Function to stop the metrics server
+        :return: None
+        """
+        if self.server is not None:
+            self.server.stop()
+
+
+def validate(config):
+    """Function to check a setups file
+    :param config: Setups file
+    :type config: dict, required
+    ...
+    :return: Problems found, empty if the setups are valid
+    :rtype: list of str
+    """
+    if not isinstance(config, dict) or not isinstance(config.get('setups'), list) or len(config['setups']) == 0:
+        return ['setups: expected a list of setups']
+    errors = []
+    used = {'name': set(), 'save_path': set(), 'queue': set(), 'timing_path': set()}
+    for index, setup in enumerate(config['setups']):
+        where = 'setups[%d]' % index
+        if not isinstance(setup, dict):
+            errors.append('%s: expected a mapping' % where)
+            continue
+        missing = [key for key in ('name', 'save_path') if not isinstance(setup.get(key), str) or not setup[key]]
+        if missing:
+            errors += ['%s.%s: required' % (where, key) for key in missing]
+            continue
+        # Setups sharing a data folder or queue would overwrite each other's checkpoints and jobs, and a shared
+        # timing log would fit the timing model of each bench to the moves and swaps of the others
+        values = {'name': setup['name'], 'save_path': os.path.abspath(setup['save_path']),
+                  'queue': os.path.abspath(queue_file(setup)), 'timing_path': os.path.abspath(timing_folder(setup))}
+        for key, value in values.items():
+            if value in used[key]:
+                errors.append('%s.%s: used by another setup' % (where, key))
+            used[key].add(value)
+        if not isinstance(setup.get('connections', {}), dict):
+            errors.append('%s.connections: expected a mapping' % where)
+        settings = setup.get('engine', {})
+        if not isinstance(settings, dict):
+            errors.append('%s.engine: expected a mapping' % where)
+            continue
+        errors += ['%s.engine.%s: unknown setting' % (where, key) for key in settings if key not in recipes.ENGINE_SETTINGS]
+    return errors
+
+
+def queue_file(setup):
+    """Function to look up the queue file of a setup
+    :param setup: Setup of the setups file
+    :type setup: dict, required
+    ...
+    :return: Queue file, queue_NAME.sqlite by default
+    :rtype: str
+    """
+    return setup.get('queue') or 'queue_%s.sqlite' % setup['name']
+
+
+def timing_folder(setup):
+    """Function to look up the folder of the timing log of a setup
+    :param setup: Setup of the setups file
+    :type setup: dict, required
+    ...
+    :return: Folder of timings.sqlite, the data folder of the setup by default
+    :rtype: str
+    """
+    return setup.get('timing_path') or setup['save_path']
+
+
+def load(config):
+    """Function to create the setups of a setups file
+    :param config: Validated setups file
+    :type config: dict, required
+    ...
+    :return: Setups
+    :rtype: Setups
+    """
+    setups = Setups()
+    for setup in config['setups']:
+        # A setup has the connections, data folder, calibration folder and engine settings of a recipe
+        scan = recipes.create_engine(setup)
+        scan.timing_path = timing_folder(setup)
+        setups.add(Setup(setup['name'], scan, queue_file(setup)))
+    return setups
+
+
+def benchmark(recipe, counts=(1, 2, 4), speed=50, save_path=None):
+    """Function to run the recipe on 1, 2, 4, ... simulated setups side by side and compare the throughput per setup
+    :param recipe: Validated recipe, queued on every setup
+    :type recipe: dict, required
+    :param counts: Numbers of setups
+    :type counts: list of int, optional
+    :param speed: Speed of the simulated clocks, simulated seconds per wall second
+    :type speed: float, optional
+    :param save_path: Data folder of the runs, a temporary folder by default
+    :type save_path: str, optional
+    ...
+    :return: Number of setups, points per setup and points per simulated hour of each setup, for every count
+    :rtype: list of tuple
+    """
+    import simulation
+
+    save_path = save_path or tempfile.mkdtemp(prefix='seqe_setups_')
+    calibration_path = recipe.get('calibration_path', 'calibrations')
+    results = []
+    for count in counts:
+        setups = Setups()
+        for number in range(1, count + 1):
+            name = 'setup%d' % number
+            folder = os.path.join(save_path, '%d_setups' % count, name)
+            queue_path = os.path.join(folder, jobqueue.QUEUE_FILE)
+            os.makedirs(folder, exist_ok=True)
+            queue = jobqueue.JobQueue(queue_path, calibration_path)
+            queue.add(dict(recipe, save_path=folder))
+            queue.close()
+
+            simulated = simulation.SimulatedSetup(clock=clocks.ScaledClock(speed), seed=number)
+            scan = simulated.createEngine(folder, calibration_path)
+            for key, value in recipe.get('engine', {}).items():
+                setattr(scan, key, value)
+            # The queue applies the engine settings of each job again, so even with log_timings in the recipe the
+            # simulated timings only go to the folder of the simulated setup
+            scan.log_timings = False
+            scan.timing_path = folder
+            setups.add(Setup(name, scan, queue_path))
+
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        setups.start()
+        setups.join()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+
+        rates = [3600*setup.scan.metrics.written/(setup.elapsed*speed) for setup in setups.setups.values()]
+        points = [setup.scan.metrics.written for setup in setups.setups.values()]
+        results.append((count, points, rates))
+        print('%d setups: %s points, %s points per simulated hour, wall %.1f s, CPU load %.0f %%'
+              % (count, '/'.join(str(p) for p in points), '/'.join('%.0f' % rate for rate in rates), wall, 100*cpu/wall))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the scan queues of several setups side by side')
+    parser.add_argument('command', choices=['run', 'benchmark'])
+    parser.add_argument('path', help='Setups file for run, recipe file for benchmark')
+    parser.add_argument('--metrics-port', type=int, help='Serve live metrics of all setups on this port of localhost')
+    parser.add_argument('--setups', type=int, nargs='+', default=[1, 2, 4], help='Numbers of simulated setups to benchmark')
+    parser.add_argument('--speed', type=float, default=50, help='Simulated seconds per wall second of the benchmark')
+    parser.add_argument('--save-path', help='Data folder of the benchmark, a temporary folder by default')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.command == 'run' else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(threadName)s %(name)s: %(message)s',
+                        datefmt='%Y-%m-%d - %H:%M:%S')
+    logger = logging.getLogger(__name__)
+
+    try:
+        config = recipes.load(args.path)
+    except (OSError, ValueError) as ex:
+        logger.error('File Not Loaded: %s' % ex)
+        return 1
+
+    if args.command == 'benchmark':
+        errors = recipes.validate(config, config.get('calibration_path', 'calibrations') if isinstance(config, dict) else 'calibrations')
+        if errors:
+            for error in errors:
+                logger.error('Invalid Recipe: %s' % error)
+            return 1
+        results = benchmark(config, args.setups, args.speed, args.save_path)
+        single = min(results[0][2])
+        for count, _, rates in results[1:]:
+            print('%d setups: slowest setup at %.1f %% of the throughput of one setup' % (count, 100*min(rates)/single))
+        return 0
+
+    errors = validate(config)
+    if errors:
+        for error in errors:
+            logger.error('Invalid Setups: %s' % error)
+        return 1
+    setups = load(config)
+    port = args.metrics_port if args.metrics_port is not None else config.get('metrics_port')
+    if port is not None:
+        setups.serve(port)
+    setups.start()
+    try:
+        setups.join()
+    except KeyboardInterrupt:
+        logger.info('Stopping All Setups')
+        setups.stop()
+        setups.join()
+    setups.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Simulated instruments on a virtual clock
+
+The simulated monochromator, Lock-in and filter wheel replace the serial ports and the data
+server below the real drivers, so that the drivers and the scan engine run unchanged. Moves,
+grating and filter swaps, the 25 s initialisation, serial timeouts and Lock-in polls advance a
+virtual clock shared with the scan engine instead of waiting, and the Lock-in returns samples
+of a smooth spectrum through the settling low-pass filter. A complete recipe is dry-run in
+seconds, which validates the plans, exercises stopping and resuming, and separates the software
+time of the scan loop from the physical time of the setup:
+
+Usage: python simulation.py RECIPE [--stop-after POINTS] [--dataloss P] [--fail-after SECONDS] [--save-path FOLDER]
+"""
+
+import argparse
+import io
+import logging
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import clocks
+import engine
+import metrics
+import recipe as recipes
+import scheduler
+import settling
+import timing
+
+# Physical timings of the simulated setup [s]
+TIMINGS = {'init': 25.0, 'goto_fixed': 0.3, 'grating': 15.0, 'filter': 3.0, 'fhome': 5.0, 'query': 0.02,
+           'poll_latency': 0.05}
+SPEED = 1000.0 # GOTO speed until set [nm/min]
+CLOCKBASE = 60e6 # Lock-in timestamp ticks per second
+DEVICE = 'dev0000'
+
+
+def default_spectrum(wavelength):
+    """Function of the simulated photocurrent, a broad peak on a small background
+    :param wavelength: Wavelength [nm]
+    :type wavelength: float, required
+    ...
+    :return: Photocurrent [A]
+    :rtype: float
+    """
+    return 1e-9*np.exp(-((wavelength - 700)/250)**2) + 1e-12
+
+
+def step_response(multiple, order):
+    """Function to calculate the step response of the low-pass filter for many times, see settling.step_response
+    :param multiple: Times since the step in units of the time constant
+    :type multiple: array, required
+    :param order: Low-pass filter order
+    :type order: int, required
+    ...
+    :return: Settled fractions between 0 and 1
+    :rtype: array
+    """
+    term = np.ones_like(multiple)
+    total = np.ones_like(multiple)
+    for k in range(1, int(order)):
+        term = term*multiple/k
+        total = total + term
+    return 1.0 - np.exp(-multiple)*total
+
+
+class SimulatedSetup(object):
+    """Class of a simulated setup, holding the instruments and their shared physical state
+    :param clock: Clock of the simulation, a new virtual clock by default
+    :type clock: VirtualClock or ScaledClock, optional
+    :param spectrum: Photocurrent [A] as a function of the wavelength [nm]
+    :type spectrum: function, optional
+    :param noise: Current noise density [A/sqrt(Hz)]
+    :type noise: float, optional
+    :param phase: Signal phase [deg]
+    :type phase: float, optional
+    :param dataloss: Probability of a poll with sample loss
+    :type dataloss: float, optional
+    :param fail_after: Simulated time after connecting [s] after which the monochromator stops responding
+    :type fail_after: float, optional
+    :param seed: Seed of the random noise
+    :type seed: int, optional
+    """
+
+    def __init__(self, clock=None, spectrum=None, noise=1e-13, phase=30, dataloss=0.0, fail_after=None, seed=0):
+        self.clock = clock or clocks.VirtualClock()
+        self.spectrum = spectrum or default_spectrum
+        self.noise = noise
+        self.phase = np.radians(phase)
+        self.dataloss = dataloss
+        self.fail_after = fail_after
+        self.rng = np.random.default_rng(seed)
+
+        # Light on the sample: the wavelength switches at the end of each move
+        self.wavelength = None
+        self.changed = self.clock.time()
+        self.previous = 0.0
+
+        self.mono = SimulatedMonochromator(self)
+        self.lockin = SimulatedLockIn(self)
+        self.wheel = SimulatedFilterWheel(self)
+
+    def createEngine(self, save_path, calibration_path='calibrations'):
+        """Function to create a scan engine on the simulated instruments
+        :param save_path: Data folder
+        :type save_path: str, required
+        :param calibration_path: Folder of the reference detector calibrations
+        :type calibration_path: str, optional
+        ...
+        :return: Scan engine
+        :rtype: ScanEngine
+        """
+        scan = engine.ScanEngine(self.mono, self.lockin, self.wheel, save_path, calibration_path, clock=self.clock)
+        scan.log_timings = False # Simulated timings would spoil the timing model of the real setup
+        return scan
+
+    def move(self, wavelength, when):
+        """Function to change the wavelength on the sample
+        :param wavelength: New wavelength [nm]
+        :type wavelength: float, required
+        :param when: End of the move [s since epoch]
+        :type when: float, required
+        ...
+        :return: None
+        """
+        self.previous = self.current(when)
+        self.wavelength = wavelength
+        self.changed = when
+
+    def current(self, when):
+        """Function to look up the photocurrent at a time, without the low-pass filter
+        :param when: Time [s since epoch]
+        :type when: float, required
+        ...
+        :return: Photocurrent [A]
+        :rtype: float
+        """
+        if self.wavelength is None:
+            return 0.0
+        return self.previous if when < self.changed else float(self.spectrum(self.wavelength))
+
+
+class MonochromatorPort(object):
+    """Class of the simulated serial port of the monochromator, answering commands after their physical duration
+    :param setup: Simulated setup
+    :type setup: SimulatedSetup, required
+    """
+
+    def __init__(self, setup):
+        self.setup = setup
+        self.clock = setup.clock
+        self.timeout = 0
+        self.speed = SPEED
+        self.grating = 1
+        self.filter = 1
+        self.wavelength = 0.0
+        self.busy_until = self.clock.time()
+        self.responses = [] # Pending responses and the time they are sent
+        self.opened = self.clock.time()
+
+    def write(self, data):
+        command = data.decode().strip()
+        if self.setup.fail_after is not None and self.clock.time() - self.opened > self.setup.fail_after:
+            return len(data) # No longer responding
+        start = max(self.clock.time(), self.busy_until)
+        duration, response = TIMINGS['query'], b' ok\r\n'
+
+        goto = re.match(r'^([\d.]+) GOTO$', command)
+        speed = re.match(r'^([\d.]+) NM/MIN$', command)
+        grating = re.match(r'^(\d) grating$', command)
+        filter_no = re.match(r'^(\d) FILTER$', command)
+        if command == 'HELLO':
+            duration = TIMINGS['init']
+        elif goto is not None:
+            wavelength = float(goto.group(1))
+            duration = TIMINGS['goto_fixed'] + abs(wavelength - self.wavelength)*60/self.speed
+            self.wavelength = wavelength
+            self.setup.move(wavelength, start + duration)
+        elif speed is not None:
+            self.speed = float(speed.group(1))
+        elif grating is not None:
+            duration = TIMINGS['grating'] if int(grating.group(1)) != self.grating else TIMINGS['query']
+            self.grating = int(grating.group(1))
+        elif filter_no is not None:
+            duration = TIMINGS['filter'] if int(filter_no.group(1)) != self.filter else TIMINGS['query']
+            self.filter = int(filter_no.group(1))
+        elif command == 'FHOME':
+            duration = TIMINGS['fhome']
+            self.filter = 1
+        elif command == '?grating':
+            response = (' %d  ok\r\n' % self.grating).encode()
+        elif command == '?filter':
+            response = (' %d  ok\r\n' % self.filter).encode()
+        else:
+            response = b' ?\r\n'
+
+        self.busy_until = start + duration
+        self.responses.append((self.busy_until, response))
+        return len(data)
+
+    def readline(self):
+        # Wait until the response is sent, or for the timeout, on the shared clock
+        if not self.responses:
+            self.clock.sleep(self.timeout or 0)
+            return b''
+        ready, response = self.responses[0]
+        wait = ready - self.clock.time()
+        if self.timeout is not None and wait > self.timeout:
+            self.clock.sleep(self.timeout)
+            return b''
+        self.clock.sleep(wait)
+        self.responses.pop(0)
+        return response
+
+    def close(self):
+        pass
+
+
+class WheelPort(io.RawIOBase):
+    """Class of the simulated serial port of the external filter wheel
+    :param setup: Simulated setup
+    :type setup: SimulatedSetup, required
+    """
+
+    def __init__(self, setup):
+        io.RawIOBase.__init__(self)
+        self.setup = setup
+        self.position = 1
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def readinto(self, buffer):
+        return 0
+
+    def write(self, data):
+        match = re.search(rb'pos=(\d)', bytes(data))
+        if match is not None:
+            self.position = int(match.group(1))
+        return len(data)
+
+
+class SimulatedDAQ(object):
+    """Class of the simulated Lock-in data server, returning demodulator samples of the simulated light
+    :param setup: Simulated setup
+    :type setup: SimulatedSetup, required
+    """
+
+    def __init__(self, setup):
+        self.setup = setup
+        self.clock = setup.clock
+        self.nodes = {}
+        self.channel = '0'
+        self.start = self.clock.time()
+        self.last = self.start
+
+    def set(self, settings):
+        for path, value in settings:
+            self.nodes[''.join(str(part) for part in path)] = value
+
+    def node(self, name, default):
+        return self.nodes.get('/%s/demods/%s/%s' % (DEVICE, self.channel, name), default)
+
+    def flush(self):
+        self.last = self.clock.time()
+
+    def subscribe(self, path):
+        self.channel = path.split('/')[3]
+        self.last = self.clock.time()
+
+    def unsubscribe(self, path):
+        pass
+
+    def getInt(self, path):
+        return int(CLOCKBASE)
+
+    def poll(self, duration, timeout):
+        self.clock.sleep(duration + TIMINGS['poll_latency'])
+        setup = self.setup
+        tc = self.node('timeconstant', 0.1)
+        order = self.node('order', 4)
+        rate = self.node('rate', 224.9)
+        gain = self.nodes.get('/%s/zctrls/%s/tamp/0/currentgain' % (DEVICE, self.channel), 1e6)
+
+        # Samples since the last poll, at most the poll duration as the buffer of the data server is limited
+        times = np.arange(max(self.last, self.clock.time() - duration), self.clock.time(), 1/rate)
+        self.last = self.clock.time()
+        if len(times) == 0:
+            return {}
+
+        # Demodulated current through the low-pass filter, settling after the last move
+        target = setup.current(self.clock.time())
+        settled = step_response(np.maximum((times - setup.changed)/tc, 0), order)
+        current = setup.previous + (target - setup.previous)*settled
+        sigma = setup.noise*np.sqrt(settling.noise_bandwidth(tc, order))
+        x = gain*(current*np.cos(setup.phase) + setup.rng.normal(0, sigma, len(times)))
+        y = gain*(current*np.sin(setup.phase) + setup.rng.normal(0, sigma, len(times)))
+
+        sample = {'timestamp': ((times - self.start)*CLOCKBASE).astype(np.uint64), 'x': x, 'y': y,
+                  'frequency': 273 + setup.rng.normal(0, 0.01, len(times)), 'phase': np.arctan2(y, x),
+                  'time': {'dataloss': int(setup.rng.random() < setup.dataloss)}}
+        return {DEVICE: {'demods': {self.channel: {'sample': sample}}}}
+
+
+class SimulatedMonochromator(engine.Monochromator):
+    """Class of the monochromator driver on a simulated serial port
+    :param setup: Simulated setup
+    :type setup: SimulatedSetup, required
+    """
+
+    def __init__(self, setup):
+        engine.Monochromator.__init__(self, 'simulated', clock=setup.clock)
+        self.setup = setup
+
+    def openPort(self):
+        return MonochromatorPort(self.setup)
+
+
+class SimulatedFilterWheel(engine.FilterWheel):
+    """Class of the filter wheel driver on a simulated serial port
+    :param setup: Simulated setup
+    :type setup: SimulatedSetup, required
+    """
+
+    def __init__(self, setup):
+        engine.FilterWheel.__init__(self, 'simulated')
+        self.setup = setup
+
+    def openPort(self):
+        return WheelPort(self.setup)
+
+
+class SimulatedLockIn(engine.LockIn):
+    """Class of the Lock-in driver on a simulated data server
+    :param setup: Simulated setup
+    :type setup: SimulatedSetup, required
+    """
+
+    def __init__(self, setup):
+        engine.LockIn.__init__(self, 'simulated', clock=setup.clock)
+        self.setup = setup
+
+    def openServer(self):
+        return SimulatedDAQ(self.setup), DEVICE
+
+
+class ErrorCounter(logging.Handler):
+    """Class of a logging handler counting the errors of a simulated run
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Dry-run the scans of a recipe on simulated instruments')
+    parser.add_argument('recipe', help='Recipe file')
+    parser.add_argument('--save-path', help='Data folder of the simulated scans, a temporary folder by default')
+    parser.add_argument('--stop-after', type=int, help='Stop after this many points and resume from the checkpoint')
+    parser.add_argument('--dataloss', type=float, default=0.0, help='Probability of a poll with sample loss')
+    parser.add_argument('--fail-after', type=float, help='Simulated seconds after which the monochromator stops responding')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the simulated noise')
+    parser.add_argument('--metrics-port', type=int, help='Serve live metrics of the simulated scans on this port of localhost')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+                        datefmt='%Y-%m-%d - %H:%M:%S')
+    logger = logging.getLogger(__name__)
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    try:
+        recipe = recipes.load(args.recipe)
+    except (OSError, ValueError) as ex:
+        logger.error('Recipe Not Loaded: %s' % ex)
+        return 1
+    calibration_path = recipe.get('calibration_path', 'calibrations') if isinstance(recipe, dict) else 'calibrations'
+    problems = recipes.validate(recipe, calibration_path)
+    if problems:
+        for problem in problems:
+            logger.error('Invalid Recipe: %s' % problem)
+        return 1
+
+    setup = SimulatedSetup(dataloss=args.dataloss, fail_after=args.fail_after, seed=args.seed)
+    scan = setup.createEngine(args.save_path or tempfile.mkdtemp(prefix='seqe_simulation_'), calibration_path)
+    for key, value in recipe.get('engine', {}).items():
+        setattr(scan, key, value)
+    scan.log_timings = False # Also with log_timings in the recipe, simulated timings would spoil the timing model
+    if args.metrics_port is not None:
+        metrics.serve(scan, 'simulation', args.metrics_port)
+
+    points = [0]
+    def count(point):
+        points[0] += 1
+        if args.stop_after is not None and points[0] == args.stop_after:
+            scan.stop()
+    scan.point_callback = count
+
+    wall_start = time.perf_counter()
+    simulated_start = setup.clock.time()
+    recipes.run(recipe, scan)
+    if args.stop_after is not None and points[0] >= args.stop_after:
+        logger.info('Stopped After %d Points, Resuming From The Checkpoint' % args.stop_after)
+        recipes.run(recipe, scan, resume=True)
+    wall = time.perf_counter() - wall_start
+    simulated = setup.clock.time() - simulated_start
+
+    settings = recipe.get('engine', {})
+    estimate = recipes.estimate_duration(recipes.build_plans(recipe), settings.get('integration_tc', 5),
+                                         settings.get('settle_accuracy', 0.99), timing.load(calibration_path))
+    print('Data in %s' % scan.save_path)
+    print('%d points, simulated duration %s (estimated %s without the initialisation), %d errors logged'
+          % (points[0], scheduler.format_duration(simulated), scheduler.format_duration(estimate), errors.count))
+    print('Wall time %.2f s, software time %.1f ms per point' % (wall, 1e3*wall/max(points[0], 1)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fast startup of the GUI
+
+Heavy modules are wrapped with lazy_import() and only imported when one of their attributes is first
+used. With --profile-startup every import and startup phase is timed and reported once the window
+is ready, with nested imports indented below the import that triggered them.
+"""
+
+import builtins
+import contextlib
+import importlib
+import logging
+import sys
+import time
+
+_records = []   # (kind, name, seconds, depth) in the order they finished
+_depth = 0
+_enabled = False
+_original_import = builtins.__import__
+_start = time.perf_counter()
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    global _depth
+    if level != 0 or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        _records.append(('import', name, time.perf_counter() - start, _depth))
+
+
+def profile_imports(enabled):
+    """Function to start timing imports, called before the heavy imports
+    :param enabled: Profile the startup
+    :type enabled: bool, required
+    ...
+    :return: None
+    """
+    global _enabled, _start
+    _enabled = enabled
+    if enabled:
+        _start = time.perf_counter()
+        builtins.__import__ = _timed_import
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Context manager to time a startup phase
+    :param name: Name of the phase
+    :type name: str, required
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _enabled:
+            _records.append(('phase', name, time.perf_counter() - start, 0))
+
+
+def report(logger=None):
+    """Function to stop timing imports and log the startup profile
+    :param logger: Logger, defaults to the logger of this module
+    :type logger: Logger, optional
+    ...
+    :return: None
+    """
+    if not _enabled:
+        return
+    builtins.__import__ = _original_import
+    logger = logger or logging.getLogger(__name__)
+    lines = ['Startup Profile, %.3f s until ready:' % (time.perf_counter() - _start)]
+    for kind, name, seconds, depth in _records:
+        if kind == 'phase' or seconds >= 0.001:
+            lines.append('%8.1f ms  %s%s %s' % (1000*seconds, '  '*depth, kind, name))
+    logger.info('\n'.join(lines))
+
+
+class LazyModule(object):
+    """Class of a module that is imported when one of its attributes is first used
+    :param name: Module name
+    :type name: str, required
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attribute):
+        module = self.__dict__['_module']
+        if module is None:
+            name = self.__dict__['_name']
+            start = time.perf_counter()
+            module = importlib.import_module(name)
+            if _enabled:
+                _records.append(('lazy import', name, time.perf_counter() - start, 0))
+            self.__dict__['_module'] = module
+        return getattr(module, attribute)
+
+
+def lazy_import(name):
+    """Function to import a module on first use
+    :param name: Module name, e.g. 'pandas' or 'zhinst.utils'
+    :type name: str, required
+    ...
+    :return: Module placeholder
+    :rtype: LazyModule
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stitching of complete scan segments taken with different external filters
+
+Each new segment is scaled onto the spectrum stitched so far with a least-squares fit over their
+overlapping wavelengths, s = sum(a*b) / sum(b^2), where a is the stitched spectrum interpolated
+onto the wavelengths b of the new segment. In the overlap the spectrum switches from the lower
+lying to the higher lying of the two at the middle of the overlap region, whichever of them was
+measured first.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+SCALED_COLUMNS = ('Mean Current', 'Mean R', 'EQE')
+
+
+def scale_factor(wavelength, values, ref_wavelength, ref_values):
+    """Function to fit the factor that scales a segment onto a reference spectrum in their overlap
+    :param wavelength: Wavelengths of the segment, ascending
+    :type wavelength: array, required
+    :param values: Values of the segment
+    :type values: array, required
+    :param ref_wavelength: Wavelengths of the reference spectrum, ascending
+    :type ref_wavelength: array, required
+    :param ref_values: Values of the reference spectrum
+    :type ref_values: array, required
+    ...
+    :return: Scale factor, or None if the spectra do not overlap
+    :rtype: float
+    """
+    overlap = (wavelength >= ref_wavelength[0]) & (wavelength <= ref_wavelength[-1])
+    b = values[overlap]
+    a = np.interp(wavelength[overlap], ref_wavelength, ref_values)
+    valid = np.isfinite(a) & np.isfinite(b)
+    a, b = a[valid], b[valid]
+    if b.size == 0 or not np.any(b):
+        return None
+    return float(np.dot(a, b) / np.dot(b, b))
+
+
+class Stitcher(object):
+    """Class to merge complete scan segments into one spectrum while they are measured
+    :param column: Column used to fit the scale factors
+    :type column: str, optional
+    """
+
+    def __init__(self, column='Mean Current'):
+        self.column = column
+        self.logger = logging.getLogger(__name__)
+        self.stitched = None
+        self.count = 0
+
+    def add(self, segment_df, label):
+        """Function to scale a finished segment and merge it into the stitched spectrum
+        :param segment_df: Measurement data of the segment
+        :type segment_df: DataFrame, required
+        :param label: Filter of the segment, e.g. 'no' or a cut-on wavelength
+        :type label: str, required
+        ...
+        :return: Stitched spectrum with the columns 'Segment', 'Filter' and 'Scale' as provenance of each point
+        :rtype: DataFrame
+        """
+        columns = ['Wavelength'] + [column for column in SCALED_COLUMNS if column in segment_df.columns]
+        segment = segment_df[columns].dropna(subset=['Wavelength', self.column]).sort_values('Wavelength').reset_index(drop=True)
+        if len(segment) == 0:
+            return self.stitched
+
+        segment['Segment'] = self.count
+        segment['Filter'] = label
+        self.count += 1
+
+        if self.stitched is None:
+            segment['Scale'] = 1.0
+            self.stitched = segment
+            return self.stitched
+
+        wavelength = segment['Wavelength'].to_numpy(dtype=float)
+        ref_wavelength = self.stitched['Wavelength'].to_numpy(dtype=float)
+        scale = scale_factor(wavelength, segment[self.column].to_numpy(dtype=float),
+                             ref_wavelength, self.stitched[self.column].to_numpy(dtype=float))
+        if scale is None:
+            self.logger.error('Segment with %s Filter Does Not Overlap, Not Scaled' % label)
+            scale = 1.0
+
+        for column in SCALED_COLUMNS:
+            if column in segment.columns:
+                segment[column] = segment[column] * scale
+        segment['Scale'] = scale
+
+        # Segments may arrive in any order. Keep the part of each that lies away from the overlap and switch from
+        # the lower to the upper one in the middle of the overlap, segments that do not overlap are kept whole
+        start, stop = max(wavelength[0], ref_wavelength[0]), min(wavelength[-1], ref_wavelength[-1])
+        if start > stop:
+            parts = [self.stitched, segment]
+        else:
+            switch = 0.5 * (start + stop)
+            if (wavelength[0], wavelength[-1]) < (ref_wavelength[0], ref_wavelength[-1]):
+                lower, upper = segment, self.stitched
+            else:
+                lower, upper = self.stitched, segment
+            # The lower one continues above the overlap if it contains the upper one
+            parts = [lower[(lower['Wavelength'] < switch) | (lower['Wavelength'] > stop)], upper[upper['Wavelength'] >= switch]]
+        self.stitched = pd.concat(parts, ignore_index=True).sort_values('Wavelength', kind='stable').reset_index(drop=True)
+        return self.stitched
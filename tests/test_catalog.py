@@ -0,0 +1,25 @@
+import os
+
+import catalog
+
+CALIBRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'calibrations')
+
+
+def write_scan(folder, file_name, header):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, file_name), 'w') as f:
+        f.write(header + '\n0,900,1e-6\n')
+
+
+def test_rebuild_labels_reference_detectors(tmp_path):
+    folder = str(tmp_path / 'user' / 'experiment')
+    write_scan(folder, 'ref_(900-1700nm_10nm_1000000x)', ',Wavelength,Mean Current,Power')
+    write_scan(folder, 'Si_check_(900-1700nm_10nm_1000000x)', ',Wavelength,Mean Current,Power')
+    write_scan(folder, 'sample_(900-1700nm_10nm_100000000x)', ',Wavelength,Mean Current')
+    scans = catalog.Catalog(str(tmp_path))
+    assert scans.rebuild(workers=1, calibration_path=CALIBRATIONS) == 3
+
+    detectors = {scan['name']: scan['detector'] for scan in scans.find()}
+    assert detectors == {'ref': 'InGaAs', 'Si_check': 'Si', 'sample': 'sample'}
+    assert scans.latest_reference('user', 'experiment', 900, 1700, detector='InGaAs')['name'] == 'ref'
+    scans.close()
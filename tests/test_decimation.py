@@ -0,0 +1,17 @@
+import numpy as np
+
+import decimation
+
+
+def test_streaming_bound():
+    rng = np.random.default_rng(0)
+    for width in (2, 10, 100):
+        decimator = decimation.MinMaxDecimator(width)
+        y = rng.normal(size=1000)
+        for n, value in enumerate(y):
+            decimator.append(float(n), value)
+            x_out, y_out = decimator.data()
+            assert len(x_out) <= 2*width + 2
+            assert np.all(np.diff(x_out) >= 0)
+        # Peaks survive the decimation
+        assert y_out.max() == y.max() and y_out.min() == y.min()
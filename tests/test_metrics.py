@@ -0,0 +1,33 @@
+import metrics
+
+
+class Interleaved(object):
+    """Array that runs a reader after the writer's first assignment, before the writer finishes"""
+
+    def __init__(self, array, reader):
+        self.array = array
+        self.reader = reader
+        self.results = []
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, key):
+        return self.array[key]
+
+    def __setitem__(self, key, value):
+        self.array[key] = value
+        if self.reader is not None:
+            reader, self.reader = self.reader, None
+            self.results.append(reader())
+
+
+def test_points_drop_row_being_written():
+    scan = metrics.ScanMetrics('bench', history=4)
+    for n in range(4):
+        scan.record(500.0 + n, 1.0, float(n))
+    scan.history = Interleaved(scan.history, scan.points)
+    scan.record(504.0, 1.0, 4.0)
+    block = scan.history.results[0]
+    assert list(block[:, 0]) == [1.0, 2.0, 3.0]
+    assert list(scan.points()[:, 0]) == [1.0, 2.0, 3.0, 4.0]
@@ -0,0 +1,56 @@
+import threading
+
+import numpy as np
+
+import ringbuffer
+
+
+class Interleaved(object):
+    """Array that runs a reader after the writer's first assignment, before the writer finishes"""
+
+    def __init__(self, array, reader):
+        self.array = array
+        self.reader = reader
+        self.results = []
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, key):
+        return self.array[key]
+
+    def __setitem__(self, key, value):
+        self.array[key] = value
+        if self.reader is not None:
+            reader, self.reader = self.reader, None
+            self.results.append(reader())
+
+
+def test_latest_drops_slots_being_written():
+    buffer = ringbuffer.RingBuffer(capacity=8)
+    times = np.arange(8.0)
+    buffer.extend(times, times, times, times, times)
+    buffer.samples = Interleaved(buffer.samples, lambda: buffer.latest(100))
+    times = np.arange(8.0, 10.0)
+    buffer.extend(times, times, times, times, times)
+    block = buffer.samples.results[0]
+    assert np.all(np.diff(block[0]) > 0)
+    assert list(block[0]) == list(range(2, 8))
+    assert list(buffer.latest(100)[0]) == list(range(2, 10))
+
+
+def test_latest_in_order_while_writing():
+    buffer = ringbuffer.RingBuffer(capacity=64)
+    done = threading.Event()
+
+    def write():
+        for n in range(20000):
+            times = np.arange(4.0*n, 4.0*n + 4)
+            buffer.extend(times, times, times, times, times)
+        done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    while not done.is_set():
+        assert np.all(np.diff(buffer.latest(1e9)[0]) > 0)
+    writer.join()
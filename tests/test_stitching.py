@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+import stitching
+
+
+def segment(start, stop, step=10, scale=1.0):
+    wavelength = np.arange(start, stop + step, step, dtype=float)
+    current = scale*np.exp(-((wavelength - 700)/300)**2)
+    return pd.DataFrame({'Wavelength': wavelength, 'Mean Current': current, 'Mean R': 1e6*current})
+
+
+def test_higher_second_segment():
+    stitcher = stitching.Stitcher()
+    stitcher.add(segment(350, 750), 'no')
+    stitched = stitcher.add(segment(700, 1100, scale=2.0), '600')
+    assert stitched['Wavelength'].tolist() == list(np.arange(350, 1110, 10, dtype=float))
+    assert np.allclose(stitched['Mean Current'], segment(350, 1100)['Mean Current'])
+
+
+def test_lower_second_segment():
+    stitcher = stitching.Stitcher()
+    stitcher.add(segment(700, 1100), '600')
+    stitched = stitcher.add(segment(350, 750, scale=0.5), 'no')
+    assert stitched['Wavelength'].tolist() == list(np.arange(350, 1110, 10, dtype=float))
+    assert np.allclose(stitched['Mean Current'], segment(350, 1100)['Mean Current'])
+    # The lower segment is used below the middle of the overlap, the first segment above it
+    assert stitched.loc[stitched['Wavelength'] < 725, 'Segment'].eq(1).all()
+    assert stitched.loc[stitched['Wavelength'] >= 725, 'Segment'].eq(0).all()
+
+
+def test_disjoint_segment():
+    stitcher = stitching.Stitcher()
+    stitcher.add(segment(800, 1100), '600')
+    stitched = stitcher.add(segment(350, 600), 'no')
+    assert stitched['Wavelength'].tolist() == list(np.arange(350, 610, 10, dtype=float)) + list(np.arange(800, 1110, 10, dtype=float))
+    assert (stitched['Scale'] == 1.0).all()
+
+
+def test_segment_inside_stitched():
+    stitcher = stitching.Stitcher()
+    stitcher.add(segment(350, 1100), 'no')
+    stitched = stitcher.add(segment(600, 800, scale=3.0), '600')
+    assert stitched['Wavelength'].tolist() == list(np.arange(350, 1110, 10, dtype=float))
+    assert np.allclose(stitched['Mean Current'], segment(350, 1100)['Mean Current'])
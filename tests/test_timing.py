@@ -0,0 +1,20 @@
+import timing
+
+
+def test_swaps_fitted_per_position(tmp_path):
+    log = timing.TimingLog(str(tmp_path / timing.TIMING_FILE))
+    for _ in range(timing.MIN_SAMPLES):
+        log.record('grating', 10.0, 1)
+        log.record('grating', 30.0, 2)
+        log.record('filter', 4.0, 3)
+    log.record('filter', 8.0, 5) # Too few swaps to position 5
+    model = log.fit()
+    log.close()
+
+    assert model.swap('grating', 1) == 10.0 and model.swap('grating', 2) == 30.0
+    assert model.swap('grating', 3) == model.grating == 20.0
+    assert model.swap('filter', 3) == 4.0 and model.swap('filter', 5) == model.filter == 4.0
+
+    before = {'grating': 1, 'filter': 3, 'wheel': None, 'gain': None}
+    assert model.switch(before, dict(before, grating=2)) == 30.0
+    assert model.switch(before, dict(before, filter=5)) == 4.0
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing model of the setup to estimate scan durations
+
+The duration of a scan is built from the monochromator moves (a fixed time per GOTO plus a time
+per nm), grating and filter swaps, the external filter wheel moves, the Lock-in settling time
+of the time constant and filter order, the measurement windows and the software overhead per
+point. The scan engine logs the measured time of the moves, swaps and point overhead to
+timings.sqlite in the calibration folder, and the model is fitted to the latest entries, so that
+estimates follow the actual instruments. Swaps are fitted per target grating and filter position,
+positions that were not swapped to often enough use the time of all swaps of their kind. The filter
+wheel driver does not wait for the wheel, so its move time cannot be measured and keeps the default.
+
+Usage: python timing.py [CALIBRATION_FOLDER]
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+import settling
+
+TIMING_FILE = 'timings.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS timings (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    amount REAL,
+    duration REAL NOT NULL,
+    recorded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS timings_kind ON timings (kind, id);
+"""
+
+# Logged steps: 'goto' with the distance [nm], swaps of the 'grating' and 'filter' with the target position
+# and the 'overhead' of a point outside the moves, settling and measurement window
+KINDS = ('goto', 'grating', 'filter', 'overhead')
+SWAPS = ('grating', 'filter') # Steps fitted per target position
+
+# Timings used until enough steps have been logged [s]
+DEFAULTS = {'goto_fixed': 0.2, 'goto_per_nm': 0.05, 'grating': 20.0, 'filter': 5.0, 'wheel': 3.0, 'gain': 1.0,
+            'overhead': 0.5}
+
+MIN_SAMPLES = 5 # Logged steps needed to replace a default
+RANGE_PAUSE = 1.0 # Pause of the engine before each range [s]
+
+
+def position(position_map, wavelength):
+    """Function to look up the grating or filter of a wavelength without logging out of range wavelengths
+    :param position_map: Grating or filter map
+    :type position_map: PositionMap, required
+    :param wavelength: Wavelength
+    :type wavelength: float, required
+    ...
+    :return: Position, or None if the wavelength is not covered
+    :rtype: int
+    """
+    positions = sorted(position_map.ranges)
+    for number in positions:
+        start, stop = position_map.ranges[number]
+        # Same ranges as PositionMap, including start and excluding stop except for the last position
+        if start <= wavelength < stop or (number == positions[-1] and wavelength == stop):
+            return number
+    return None
+
+
+class TimingModel(object):
+    """Class of the timings of the setup
+    :param positions: Swap times by kind of SWAPS and target position, replacing the time of the kind [s]
+    :type positions: dict, optional
+    :param timings: Timings replacing the DEFAULTS [s]
+    :type timings: keyword arguments, optional
+    """
+
+    def __init__(self, positions=None, **timings):
+        for key, value in dict(DEFAULTS, **timings).items():
+            setattr(self, key, float(value))
+        self.positions = {kind: {int(number): float(value) for number, value in (positions or {}).get(kind, {}).items()}
+                          for kind in SWAPS}
+
+    def timings(self):
+        """Function to list the timings of the model
+        :return: Timings [s]
+        :rtype: dict
+        """
+        return {key: getattr(self, key) for key in DEFAULTS}
+
+    def move(self, distance):
+        """Function to estimate the time of a monochromator GOTO
+        :param distance: Distance [nm]
+        :type distance: float, required
+        ...
+        :return: Time [s]
+        :rtype: float
+        """
+        return self.goto_fixed + self.goto_per_nm*abs(distance)
+
+    def swap(self, kind, number):
+        """Function to estimate the time of a grating or filter swap
+        :param kind: One of SWAPS
+        :type kind: str, required
+        :param number: Target grating or filter position
+        :type number: int, required
+        ...
+        :return: Time [s]
+        :rtype: float
+        """
+        return self.positions[kind].get(number, getattr(self, kind))
+
+    def switch(self, before, after):
+        """Function to estimate the time to change the instrument configuration between two scans
+        :param before: Configuration at the end of the previous scan, None if unknown
+        :type before: dict, required
+        :param after: Configuration at the start of the next scan
+        :type after: dict, required
+        ...
+        :return: Time [s]
+        :rtype: float
+        """
+        if before is None:
+            return 0.0
+        return sum(self.swap(key, after[key]) if key in SWAPS else getattr(self, key)
+                   for key in ('grating', 'filter', 'wheel', 'gain') if after[key] is not None and before[key] != after[key])
+
+    def points(self, plan, wavelengths, windows, settle, start=None):
+        """Function to estimate the time to measure a list of wavelengths
+        :param plan: Scan plan with the grating and filter maps
+        :type plan: ScanPlan, required
+        :param wavelengths: Wavelengths in the order of the scan
+        :type wavelengths: list, required
+        :param windows: Measurement window of each wavelength [s]
+        :type windows: list, required
+        :param settle: Lock-in settling time [s]
+        :type settle: float, required
+        :param start: Current wavelength, grating and filter, None if unknown
+        :type start: tuple, optional
+        ...
+        :return: Time [s]
+        :rtype: float
+        """
+        total = 0.0
+        previous, grating, filter_no = start if start is not None else (None, None, None)
+        for wavelength, window in zip(wavelengths, windows):
+            next_grating, next_filter = position(plan.gratings, wavelength), position(plan.filters, wavelength)
+            # The engine settles the Lock-in again after each swap. Without a start, the first configuration is
+            # assumed to be set, the switching time between scans is estimated separately
+            if next_filter is not None and next_filter != filter_no:
+                total += 0 if filter_no is None else self.swap('filter', next_filter) + settle
+                filter_no = next_filter
+            if next_grating is not None and next_grating != grating:
+                total += 0 if grating is None else self.swap('grating', next_grating) + settle
+                grating = next_grating
+            total += self.move(0 if previous is None else wavelength - previous)
+            total += settle + window + self.overhead
+            previous = wavelength
+        return total
+
+    def scan(self, plan, integration_tc=5, settle_accuracy=0.99, ranges=None):
+        """Function to estimate the duration of a scan with fixed measurement windows
+        :param plan: Scan plan
+        :type plan: ScanPlan, required
+        :param integration_tc: Measurement window after settling in time constants
+        :type integration_tc: float, optional
+        :param settle_accuracy: Settled fraction to wait for after moves and setting changes
+        :type settle_accuracy: float, optional
+        :param ranges: Ranges to include, by default all ranges of the plan and the return to filter position 1 after it
+        :type ranges: list of ScanRange, optional
+        ...
+        :return: Duration [s]
+        :rtype: float
+        """
+        settle = settling.settle_time(plan.lockin.tc, plan.lockin.order, settle_accuracy)
+        window = integration_tc*plan.lockin.tc
+        total = 0.0
+        for scan_range in plan.ranges if ranges is None else ranges:
+            wavelengths = scan_range.wavelengths()
+            if plan.complete:
+                total += self.wheel
+            total += settle + RANGE_PAUSE # Lock-in update and pause before the range
+            total += self.points(plan, wavelengths, [window]*len(wavelengths), settle)
+        if ranges is None:
+            # The engine returns the monochromator filter and the external filter wheel to position 1 after the scan
+            total += self.swap('filter', 1) + (self.wheel if plan.complete else 0)
+        return total
+
+
+class TimingLog(object):
+    """Class of the log of measured step timings
+    :param path: Log file
+    :type path: str, required
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Function to close the log
+        :return: None
+        """
+        self.connection.close()
+
+    def record(self, kind, duration, amount=None):
+        """Function to log the time of a step
+        :param kind: One of KINDS
+        :type kind: str, required
+        :param duration: Measured time [s]
+        :type duration: float, required
+        :param amount: Size of the step, e.g. the distance of a GOTO [nm], or the target position of a swap
+        :type amount: float, optional
+        ...
+        :return: None
+        """
+        with self.connection:
+            self.connection.execute('INSERT INTO timings (kind, amount, duration, recorded) VALUES (?, ?, ?, ?)',
+                                    (kind, amount, duration, time.time()))
+
+    def samples(self, kind, limit=500):
+        """Function to read the latest logged steps of a kind
+        :param kind: One of KINDS
+        :type kind: str, required
+        :param limit: Number of steps
+        :type limit: int, optional
+        ...
+        :return: Amounts and durations
+        :rtype: tuple of arrays
+        """
+        rows = self.connection.execute('SELECT amount, duration FROM timings WHERE kind = ? ORDER BY id DESC LIMIT ?',
+                                       (kind, limit)).fetchall()
+        amounts = np.array([np.nan if row['amount'] is None else row['amount'] for row in rows], dtype=float)
+        return amounts, np.array([row['duration'] for row in rows], dtype=float)
+
+    def fit(self, limit=500):
+        """Function to fit the timing model to the latest logged steps
+        :param limit: Number of steps of each kind
+        :type limit: int, optional
+        ...
+        :return: Timing model, with the DEFAULTS for steps that were not logged often enough
+        :rtype: TimingModel
+        """
+        timings = {}
+        positions = {}
+        distance, duration = self.samples('goto', limit)
+        if len(duration) >= MIN_SAMPLES and np.ptp(distance) > 0:
+            # Straight line through the GOTO times against the distance
+            per_nm, fixed = np.polyfit(distance, duration, 1)
+            timings['goto_per_nm'] = max(per_nm, 0.0)
+            timings['goto_fixed'] = max(fixed, 0.0)
+        elif len(duration) >= MIN_SAMPLES:
+            # All moves had the same step, only the fixed time can be fitted
+            timings['goto_fixed'] = max(np.median(duration - DEFAULTS['goto_per_nm']*distance), 0.0)
+        # Logged 'wheel' steps of earlier versions only timed the serial write and are not used
+        for kind in ('grating', 'filter', 'overhead'):
+            number, duration = self.samples(kind, limit)
+            if len(duration) >= MIN_SAMPLES:
+                timings[kind] = max(np.median(duration), 0.0)
+            if kind in SWAPS:
+                # Swaps logged without the target position only count for the time of all swaps of the kind
+                positions[kind] = {int(target): max(np.median(duration[number == target]), 0.0)
+                                   for target in np.unique(number[np.isfinite(number)])
+                                   if np.count_nonzero(number == target) >= MIN_SAMPLES}
+        return TimingModel(positions, **timings)
+
+
+def load(calibration_path):
+    """Function to load the timing model fitted to the log of the calibration folder
+    :param calibration_path: Calibration folder
+    :type calibration_path: str, required
+    ...
+    :return: Timing model, the DEFAULTS if nothing was logged yet
+    :rtype: TimingModel
+    """
+    path = os.path.join(calibration_path, TIMING_FILE)
+    if not os.path.exists(path):
+        return TimingModel()
+    log = TimingLog(path)
+    try:
+        return log.fit()
+    except sqlite3.Error as ex:
+        logging.getLogger(__name__).error('Timing Log Not Read: %s' % ex)
+        return TimingModel()
+    finally:
+        log.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show the timing model fitted to the logged step timings')
+    parser.add_argument('calibration_path', nargs='?', default='calibrations', help='Calibration folder')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+                        datefmt='%Y-%m-%d - %H:%M:%S')
+    path = os.path.join(args.calibration_path, TIMING_FILE)
+    counts = {}
+    if os.path.exists(path):
+        log = TimingLog(path)
+        counts = dict(log.connection.execute('SELECT kind, COUNT(*) FROM timings GROUP BY kind').fetchall())
+        log.close()
+    model = load(args.calibration_path)
+    for key, value in model.timings().items():
+        kind = 'goto' if key.startswith('goto') else key
+        print('%-12s %8.3f s  (%d logged)' % (key, value, counts.get(kind, 0)))
+        for number, position_value in sorted(model.positions.get(key, {}).items()):
+            print('  %-10s %8.3f s' % ('to %d' % number, position_value))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())